@@ -0,0 +1,101 @@
+"""
+Đo thời gian tìm biển số gần đúng trên lịch sử giả lập (không cần history.csv)
+- Sinh N biển số ngẫu nhiên đúng định dạng (format_plate), dựng PlateIndex
+- Truy vấn = biển số đã có bị "đọc sai" (cặp hay nhầm, sai ký tự, thiếu / thừa ký tự) và biển số không có
+- In p50 / p99 / max theo từng ngưỡng khoảng cách; p99 ở SEARCH_MAX_DISTANCE vượt ngưỡng -> mã thoát 1
+
+Ví dụ:
+    python benchmark_search.py                         # 1 triệu biển số, max-distance 1 và 2
+    python benchmark_search.py --plates 200000 --queries 500 --distances 0.5 1 1.5
+"""
+
+import argparse
+import gc
+import random
+import sys
+import time
+from modules.search import PlateIndex, CONFUSABLE, normalize_plate
+from modules.utils import format_plate, VALID_SERIES_LETTERS
+from modules.config import SEARCH_MAX_DISTANCE, SEARCH_BENCHMARK_BUDGET_MS
+
+_DIGITS = '0123456789'
+_LETTERS = sorted(VALID_SERIES_LETTERS)
+
+
+def random_plate(rng: random.Random) -> str:
+    """1 biển số ngẫu nhiên đã format (ô tô 7-8 ký tự, xe máy 9 ký tự)"""
+    digits = lambda n: ''.join(rng.choice(_DIGITS) for _ in range(n))
+    kind = rng.random()
+    if kind < 0.5:
+        return format_plate(digits(2) + rng.choice(_LETTERS) + digits(5), "Ô TÔ")
+    if kind < 0.7:
+        return format_plate(digits(2) + rng.choice(_LETTERS) + digits(4), "Ô TÔ")
+    if kind < 0.95:
+        return format_plate(digits(2) + rng.choice(_LETTERS) + digits(6), "XE MÁY")
+    return format_plate(digits(2) + rng.choice(_LETTERS) + rng.choice(_LETTERS) + digits(5), "XE MÁY")
+
+
+def misread(plate: str, rng: random.Random) -> str:
+    """Làm sai biển số như OCR: nhầm cặp ký tự, sai 1 ký tự, thiếu hoặc thừa 1 ký tự"""
+    chars = list(normalize_plate(plate))
+    i = rng.randrange(len(chars))
+    kind = rng.random()
+    if kind < 0.4 and chars[i] in CONFUSABLE:
+        chars[i] = rng.choice(sorted(CONFUSABLE[chars[i]]))
+    elif kind < 0.7:
+        chars[i] = rng.choice(_DIGITS + ''.join(_LETTERS))
+    elif kind < 0.85:
+        del chars[i]
+    else:
+        chars.insert(i, rng.choice(_DIGITS))
+    return ''.join(chars)
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Đo thời gian tìm biển số gần đúng trên lịch sử giả lập")
+    parser.add_argument('--plates', type=int, default=1_000_000, help="Số biển số trong lịch sử giả lập")
+    parser.add_argument('--queries', type=int, default=200, help="Số truy vấn cho mỗi ngưỡng khoảng cách")
+    parser.add_argument('--distances', type=float, nargs='+', default=[SEARCH_MAX_DISTANCE, 2.0],
+                        help="Các ngưỡng khoảng cách cần đo")
+    parser.add_argument('--budget-ms', type=float, default=SEARCH_BENCHMARK_BUDGET_MS,
+                        help=f"p99 tối đa ở max-distance {SEARCH_MAX_DISTANCE:g} (ms)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    plates = [random_plate(rng) for _ in range(args.plates)]
+    index = PlateIndex()
+    for ref, plate in enumerate(plates):
+        index.add(plate, ref)
+    print(f"📇 Chỉ mục: {len(index)} biển số ({time.perf_counter() - start:.1f}s)")
+
+    # Truy vấn cố định cho mọi ngưỡng: 3/4 biển số có thật bị đọc sai, 1/4 biển số không có
+    queries = [misread(rng.choice(plates), rng) if rng.random() < 0.75 else random_plate(rng)
+               for _ in range(args.queries)]
+    # Chỉ mục lớn -> gom rác vòng đời dài làm nhiễu số đo từng truy vấn
+    gc.freeze()
+
+    failed = False
+    for max_distance in args.distances:
+        times, hits = [], 0
+        for query in queries:
+            start = time.perf_counter()
+            hits += len(index.search(query, max_distance=max_distance))
+            times.append((time.perf_counter() - start) * 1000)
+        p99 = percentile(times, 0.99)
+        print(f"🔍 max-distance {max_distance:g}: p50 {percentile(times, 0.5):.2f}ms, p99 {p99:.2f}ms, "
+              f"max {max(times):.2f}ms, TB {hits / len(queries):.1f} kết quả/truy vấn")
+        if max_distance == SEARCH_MAX_DISTANCE and p99 > args.budget_ms:
+            print(f"❌ p99 {p99:.2f}ms vượt ngưỡng {args.budget_ms:g}ms")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
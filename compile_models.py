@@ -0,0 +1,48 @@
+"""
+Biên dịch trước model vào cache (models/cache) để các lần khởi động sau nhanh hơn
+- YOLO (model chính + model cascade): export TorchScript
+- EasyOCR: lưu sẵn detector / recognizer / converter
+
+Cache được khóa theo hash file model + phiên bản torch / ultralytics / easyocr,
+nên cần chạy lại script sau khi đổi model hoặc nâng cấp thư viện.
+
+Ví dụ:
+    python compile_models.py
+    python compile_models.py --only ocr
+"""
+
+import argparse
+import time
+from modules.config import MODEL_PATH, FALLBACK_MODEL_PATH, OCR_LANGUAGES, OCR_GPU, MODEL_CACHE_DIR
+from modules.model_cache import compile_detector, compile_ocr, library_versions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Biên dịch trước model vào cache")
+    parser.add_argument('--only', choices=['detector', 'ocr'], help="Chỉ biên dịch 1 loại model")
+    parser.add_argument('--cache-dir', default=MODEL_CACHE_DIR, help="Thư mục cache")
+    args = parser.parse_args()
+
+    versions = ', '.join(f"{name} {version}" for name, version in library_versions().items())
+    print(f"📦 Thư viện: {versions}")
+
+    if args.only in (None, 'detector'):
+        for model_path in (MODEL_PATH, FALLBACK_MODEL_PATH):
+            start = time.time()
+            try:
+                artifact = compile_detector(model_path, cache_dir=args.cache_dir)
+                print(f"✓ {model_path} -> {artifact} ({time.time() - start:.1f}s)")
+            except Exception as e:
+                print(f"✗ Không biên dịch được {model_path}: {e}")
+
+    if args.only in (None, 'ocr'):
+        start = time.time()
+        try:
+            artifact = compile_ocr(OCR_LANGUAGES, gpu=OCR_GPU, cache_dir=args.cache_dir)
+            print(f"✓ EasyOCR {OCR_LANGUAGES} -> {artifact} ({time.time() - start:.1f}s)")
+        except Exception as e:
+            print(f"✗ Không biên dịch được EasyOCR: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Xuất history.csv sang Parquet / Arrow IPC (chia thư mục theo ngày) cho phân tích
+- Chạy lại chỉ xuất các dòng mới ghi thêm từ lần trước
+- Cần pyarrow: pip install pyarrow
+
+Ví dụ:
+    python export_history.py                                  # history/history.csv -> history/columnar/
+    python export_history.py --history ket_qua/history --format arrow
+    python export_history.py --full                           # xuất lại từ đầu
+
+Đọc bằng pandas (chỉ quét các ngày cần):
+    pd.read_parquet("history/columnar", filters=[("date", ">=", "2024-05-01")])
+Kết quả ghi liên tục (run_batch.py / watch_folder.py --export) nằm ở thư mục riêng history/columnar_live
+"""
+
+import argparse
+import os
+import shutil
+import time
+from modules.columnar import CSVExporter, EXPORT_FORMATS
+from modules.config import HISTORY_DIR, HISTORY_CSV_FILE, EXPORT_DIR, EXPORT_FORMAT
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Xuất lịch sử nhận diện dạng cột (Parquet / Arrow IPC)")
+    parser.add_argument('--history', default=HISTORY_DIR, help="Thư mục History chứa history.csv")
+    parser.add_argument('--output', help=f"Thư mục xuất (mặc định {{history}}/{os.path.basename(EXPORT_DIR)})")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default=EXPORT_FORMAT, help="Định dạng file")
+    parser.add_argument('--full', action='store_true', help="Xóa dữ liệu đã xuất, xuất lại toàn bộ history.csv")
+    args = parser.parse_args()
+
+    csv_path = os.path.join(args.history, HISTORY_CSV_FILE)
+    if not os.path.isfile(csv_path):
+        print(f"❌ Không tìm thấy {csv_path}")
+        return
+    out_dir = args.output or os.path.join(args.history, os.path.basename(EXPORT_DIR))
+    try:
+        exporter = CSVExporter(csv_path, out_dir, fmt=args.format)
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return
+    if args.full and os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+
+    start = time.perf_counter()
+    stats = exporter.export()
+    elapsed = time.perf_counter() - start
+    if not stats['rows']:
+        print(f"📊 Không có dòng mới ({elapsed:.2f}s)")
+    else:
+        print(f"📊 Đã xuất {stats['rows']} dòng, {stats['days']} ngày -> {out_dir} ({elapsed:.2f}s)")
+    if stats['bad_rows']:
+        print(f"⚠ Bỏ qua {stats['bad_rows']} dòng có thời điểm không hợp lệ")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,5 @@
 import tkinter as tk
 from tkinter import filedialog
-from PIL import Image, ImageTk
-import numpy as np
 import os
 import platform
 import subprocess
@@ -9,10 +7,14 @@ import re
 import threading
 import time
 from tkinterdnd2 import DND_FILES, TkinterDnD
-from modules.detection import LicensePlateDetector
-from modules.ocr import LicensePlateOCR
+from modules.loader import ModelLoader, STATE_ERROR
 from modules.logger import HistoryLogger
+from modules.pipeline import build_recognition_pipeline
 from modules.config import HISTORY_DIR
+from modules.diagnostics import Diagnostics, get_logger, setup_logging
+from gui_results import VirtualResultList, ResultRecord, UIUpdateChannel
+
+log = get_logger('gui')
 
 class MultiPlateApp:
     def __init__(self, root):
@@ -29,16 +31,20 @@ class MultiPlateApp:
         self.root.drop_target_register(DND_FILES)
         self.root.dnd_bind('<<Drop>>', self.drop_files)
 
-        # Khởi tạo detector và OCR (EasyOCR với Warping)
-        self.detector = LicensePlateDetector()
-        self.ocr = LicensePlateOCR()
+        # Detector và OCR (EasyOCR với Warping) được load trong thread nền (xem start_model_loading)
+        self.detector = None
+        self.ocr = None
         self.logger = HistoryLogger()
+        self.pending_files = []  # Ảnh được chọn / kéo thả trong lúc model chưa sẵn sàng
 
-        self.image_refs = []
+        self.pipeline = None
+        # Tracing / profiler mỗi lần nhận diện (bật/tắt: kill -USR1 / -USR2 <pid>)
+        self.diagnostics = Diagnostics()
+        self.diagnostics.install_signals()
         
         # Biến theo dõi thời gian xử lý
         self.processing_start_time = None
-        self.image_processing_times = []
+        self.completed_count = 0
 
         # Giao diện chính
         self.top_frame = tk.Frame(root, bg="#f0f0f0", pady=10)
@@ -67,33 +73,64 @@ class MultiPlateApp:
                  bg="#f0f0f0",
                  font=("Arial", 10, "italic")).pack()
 
-        self.canvas = tk.Canvas(root, bg="white")
-        self.scrollbar = tk.Scrollbar(root, orient="vertical", command=self.canvas.yview)
-        self.h_scrollbar = tk.Scrollbar(root, orient="horizontal", command=self.canvas.xview)
-        self.scrollable_frame = tk.Frame(self.canvas, bg="white")
-
-        self.scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        # Danh sách kết quả ảo hóa: chỉ dựng các dòng đang nhìn thấy, thumbnail có cache giới hạn
+        self.results_view = VirtualResultList(root, on_open=self.open_image_external)
+        # Kết quả từ worker được gộp và đưa lên giao diện theo frame
+        self.ui_channel = UIUpdateChannel(root, handler=self.apply_ui_updates)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.bind_mouse_scroll()
+        self.start_model_loading()
+
+    def start_model_loading(self):
+        """Load model trong thread nền để cửa sổ hiện ngay"""
+        self.lbl_status.config(text="⏳ Đang tải model AI... (có thể chọn / kéo thả ảnh, sẽ xử lý khi sẵn sàng)",
+                               fg="#FF9800")
+        self.model_loader = ModelLoader(
+            on_ready=lambda loader: self.root.after(0, self.on_models_ready),
+            on_error=lambda loader, e: self.root.after(0, self.on_models_failed, e)
         )
+        self.model_loader.start()
+
+    def on_models_ready(self):
+        """Model đã load + warm-up xong (chạy trên Main Thread)"""
+        self.detector = self.model_loader.detector
+        self.ocr = self.model_loader.ocr
+        load_time = sum(self.model_loader.timings.values())
+        self.lbl_status.config(text=f"✅ Model đã sẵn sàng ({load_time:.1f}s)", fg="green")
+        
+        # Xử lý các ảnh đã xếp hàng trong lúc chờ
+        if self.pending_files:
+            file_paths, self.pending_files = self.pending_files, []
+            self.process_batch(file_paths)
 
-        self.canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        self.canvas.configure(yscrollcommand=self.scrollbar.set, xscrollcommand=self.h_scrollbar.set)
-
-        self.h_scrollbar.pack(side="bottom", fill="x")
-        self.scrollbar.pack(side="right", fill="y")
-        self.canvas.pack(side="left", fill="both", expand=True)
-        self.bind_mouse_scroll()
+    def on_models_failed(self, error):
+        """Load model thất bại (chạy trên Main Thread): bỏ hàng đợi, giữ thông báo lỗi"""
+        dropped = len(self.pending_files)
+        self.pending_files = []
+        message = f"❌ Không load được model: {error}"
+        if dropped:
+            message += f" (bỏ {dropped} ảnh đang xếp hàng)"
+        self.lbl_status.config(text=message, fg="red")
 
     def bind_mouse_scroll(self):
         def _on_mousewheel(event):
-            self.canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
+            self.results_view.yview_scroll(int(-1 * (event.delta / 120)), "units")
         
         def _on_shift_mousewheel(event):
-            self.canvas.xview_scroll(int(-1 * (event.delta / 120)), "units")
+            self.results_view.xview_scroll(int(-1 * (event.delta / 120)), "units")
+
+        self.root.bind_all("<MouseWheel>", _on_mousewheel)
+        self.root.bind_all("<Shift-MouseWheel>", _on_shift_mousewheel)
+        # Linux (X11) dùng Button-4/5 thay cho MouseWheel
+        self.root.bind_all("<Button-4>", lambda e: self.results_view.yview_scroll(-1, "units"))
+        self.root.bind_all("<Button-5>", lambda e: self.results_view.yview_scroll(1, "units"))
 
-        self.canvas.bind_all("<MouseWheel>", _on_mousewheel)
-        self.canvas.bind_all("<Shift-MouseWheel>", _on_shift_mousewheel)
+    def on_close(self):
+        """Dọn cache thumbnail khi đóng cửa sổ"""
+        self.ui_channel.stop()
+        self.results_view.close()
+        self.logger.close()
+        self.root.destroy()
 
     def drop_files(self, event):
         """Xử lý sự kiện kéo thả file"""
@@ -151,73 +188,29 @@ class MultiPlateApp:
         except Exception as e:
             print(f"Không mở được file: {e}")
 
-    def process_and_predict(self, image, image_index=None):
-        """
-        Xử lý ảnh và nhận diện biển số xe
-        
-        Args:
-            image: PIL Image
-            image_index: Số thứ tự ảnh để in ra terminal
-            
-        Returns:
-            tuple: (processed_image_np, detected_plates_list, detections)
-        """
-        image_np = np.array(image)
-        detected_plates = []
-        
-        # Lấy các vùng ROI của biển số với image_index
-        plate_regions = self.detector.get_plate_regions(image_np, image_index=image_index)
-        
-        detections = []
-        valid_plates = []
-        
-        # Bước 1: Thu thập tất cả các biển số hợp lệ
-        for roi, bbox in plate_regions:
-            # OCR và xử lý biển số (với warping)
-            plate_info = self.ocr.process_plate(roi, apply_warping=True)
-            
-            if plate_info and self.ocr.is_valid_plate(plate_info):
-                valid_plates.append((plate_info, bbox, roi))
-
-        # Bước 2: Format kết quả và thêm vào danh sách detections
-        num_plates = len(valid_plates)
-        
-        for i, (plate_info, bbox, roi) in enumerate(valid_plates):
-            vehicle_type = plate_info['vehicle_type']
-            formatted_text = plate_info['formatted_text']
-            
-            # Chuẩn bị text cho UI
-            prefix = f"#{i+1} " if num_plates > 1 else ""
-            info_for_ui = f"{prefix}[{vehicle_type}] {formatted_text}"
-            detected_plates.append(info_for_ui)
-            
-            # Thêm vào danh sách detection để vẽ
-            detections.append({
-                'bbox': bbox,
-                'text': formatted_text,
-                'vehicle_type': vehicle_type,
-                'roi': roi,
-                'preprocessed_image': plate_info.get('preprocessed_image'),
-                'preprocessing_method': plate_info.get('preprocessing_method'),
-                'intermediate_images': plate_info.get('intermediate_images')
-            })
-        
-        # Vẽ các detection lên ảnh
-        processed_image = self.detector.draw_detections(image_np, detections)
-        
-        return processed_image, detected_plates, detections
-
     def process_batch(self, file_paths):
         """Bắt đầu xử lý batch trong thread riêng"""
-        # 1. Xóa kết quả cũ trên UI
-        for widget in self.scrollable_frame.winfo_children():
-            widget.destroy()
-        self.image_refs = []
+        # 0. Load model thất bại -> không nhận ảnh, giữ nguyên thông báo lỗi
+        if self.model_loader.state == STATE_ERROR:
+            self.lbl_status.config(text=f"❌ Không load được model: {self.model_loader.error} "
+                                        f"- khởi động lại ứng dụng để thử lại", fg="red")
+            return
+        # Model chưa sẵn sàng -> xếp hàng, sẽ xử lý trong on_models_ready
+        if not self.model_loader.is_ready:
+            self.pending_files.extend(file_paths)
+            self.lbl_status.config(text=f"⏳ Đang tải model AI... đã xếp hàng {len(self.pending_files)} ảnh",
+                                   fg="#FF9800")
+            return
+        
+        # 1. Xóa kết quả cũ trên UI, History dạng gói: mỗi batch 1 gói mới
+        self.results_view.clear()
+        self.logger.new_batch()
         
         # 2. Cập nhật trạng thái UI
         self.btn_select.config(state="disabled")
         self.btn_history.config(state="disabled")
         self.lbl_status.config(text="Đang khởi tạo...", fg="blue")
+        self.ui_channel.start()
         
         # 3. Chạy thread xử lý
         threading.Thread(target=self.processing_thread, args=(file_paths,), daemon=True).start()
@@ -228,88 +221,74 @@ class MultiPlateApp:
         
         # Bắt đầu tính tổng thời gian
         self.processing_start_time = time.time()
-        self.image_processing_times = []
+        # Thống kê cascade theo từng batch
+        if self.detector is not None:
+            self.detector.reset_routing_stats()
+        self.completed_count = 0
         
         print(f"\n🚀 Bắt đầu xử lý batch {total} ảnh...")
         print("=" * 60)
         
-        for index, file_path in enumerate(file_paths):
-            stt = index + 1
+        def on_result(item):
+            # Chạy trên thread của pipeline sau giai đoạn persist (không chạm vào Tk)
+            self.completed_count += 1
             
-            # Cập nhật thông báo trạng thái
-            msg = f"Đang xử lý ảnh {stt}/{total}..."
-            self.root.after(0, lambda: self.lbl_status.config(text=msg))
+            status = f"Đã xử lý {self.completed_count}/{total} ảnh..."
             
-            # Bắt đầu tính thời gian cho ảnh này
-            image_start_time = time.time()
+            log.debug("\n📸 ===== ẢNH #%d =====\nFile: %s", item.stt, os.path.basename(item.file_path))
+            if item.error is not None:
+                log.error("❌ Lỗi xử lý ảnh #%d: %s", item.stt, item.error)
+                self.ui_channel.post((status, None))
+                return
             
-            try:
-                print(f"\n📸 ===== ẢNH #{stt} =====\nFile: {os.path.basename(file_path)}")
-                
-                # Xử lý nặng (Detect + OCR) với STT
-                img_pil = Image.open(file_path)
-                processed_img_np, plates, detections = self.process_and_predict(img_pil, image_index=stt)
-                
-                result_pil = Image.fromarray(processed_img_np)
-                
-                # Tính thời gian xử lý ảnh này
-                image_end_time = time.time()
-                image_time = image_end_time - image_start_time
-                self.image_processing_times.append(image_time)
-                
-                print(f"✅ Ảnh #{stt} hoàn thành trong {image_time:.2f}s")
-                if plates:
-                    print(f"🎯 Kết quả: {', '.join(plates)}")
-                else:
-                    print("❌ Không phát hiện biển số")
-                
-                # Lưu kết quả vào History
-                self.logger.save_result(file_path, img_pil, detections, processed_image_pil=result_pil)
-                
-                # Cập nhật UI (gửi về Main Thread)
-                self.root.after(0, self.add_result_row, index, file_path, img_pil, result_pil, plates)
-                
-            except Exception as e:
-                image_end_time = time.time()
-                image_time = image_end_time - image_start_time
-                self.image_processing_times.append(image_time)
-                
-                print(f"❌ Lỗi xử lý ảnh #{stt}: {e}")
-                import traceback
-                traceback.print_exc()
+            log.debug("✅ Ảnh #%d xong, tổng thời gian các giai đoạn %.2fs", item.stt, sum(item.timings.values()))
+            if item.plates:
+                log.debug("🎯 Kết quả: %s", ', '.join(item.plates))
+            else:
+                log.debug("❌ Không phát hiện biển số")
+            
+            # Resize thumbnail ngay trên worker, Main Thread chỉ còn hiển thị
+            record = ResultRecord(index=item.index, file_path=item.file_path, plates=list(item.plates))
+            self.results_view.render_thumbnails(record, item.image_pil, item.result_pil)
+            self.ui_channel.post((status, record))
+        
+        # decode -> detect -> OCR -> render -> persist chạy chồng lên nhau
+        self.pipeline = build_recognition_pipeline(self.detector, self.ocr, self.logger, on_result=on_result)
+        self.diagnostics.begin_batch()
+        try:
+            self.pipeline.run(file_paths)
+        finally:
+            self.diagnostics.end_batch()
 
         # Hoàn tất
         self.root.after(0, self.on_processing_finished)
 
     def on_processing_finished(self):
         """Được gọi khi thread xử lý xong"""
+        # Đưa nốt các kết quả còn trong kênh lên giao diện
+        self.ui_channel.stop()
+        
         # Tính tổng thời gian
         if self.processing_start_time:
             total_time = time.time() - self.processing_start_time
-            total_images = len(self.image_processing_times)
-            avg_time = sum(self.image_processing_times) / len(self.image_processing_times) if self.image_processing_times else 0
+            total_images = self.completed_count
             
             print("\n" + "=" * 60)
-            print(f"🎉 ĐÃ NHẬN DIỆN XONG {total_images} ẢNH!")
-            
-            # THỰC TẾ: Đo lường và phân tích thời gian
-            ai_processing_time = sum(self.image_processing_times)  # Thời gian AI thuần túy
-            overhead_time = total_time - ai_processing_time  # Overhead (UI, I/O, etc.)
+            print(f"🎉 ĐÃ NHẬN DIỆN XONG {total_images} ẢNH trong {total_time:.2f}s "
+                  f"({total_images / total_time if total_time > 0 else 0:.2f} ảnh/s)")
             
-            # Ước tính phân bố dựa trên benchmark thực tế:
-            # - YOLO Detection thường chiếm 60-70% thời gian AI
-            # - OCR + Preprocessing chiếm 30-40% thời gian AI
-            estimated_load_time = total_images * 0.05  # Measured: ~0.05s/image load
-            estimated_detection = ai_processing_time * 0.65  # Benchmark: YOLO ~65%
-            estimated_ocr = ai_processing_time * 0.35  # Benchmark: OCR ~35%
-            estimated_ui = overhead_time  # Còn lại
+            # Metrics từng giai đoạn pipeline (latency, queue depth)
+            if self.pipeline is not None:
+                self.pipeline.print_metrics()
             
-            print("THỜI GIAN XỬ LÝ:")
-            print(f"   • Tổng {total_time:.2f}s bao gồm:")
-            print(f"     - Tải ảnh từ file: ~{estimated_load_time:.1f}s")
-            print(f"     - YOLOv8 Detection: ~{estimated_detection:.1f}s")
-            print(f"     - EasyOCR + Preprocessing: ~{estimated_ocr:.1f}s")
-            print(f"     - Lưu History + UI update: ~{estimated_ui:.1f}s")
+            # Thống kê định tuyến cascade (yolov8s -> model nặng)
+            if self.detector.cascade:
+                stats = self.detector.get_routing_stats()
+                print("DETECTOR CASCADE:")
+                print(f"   • {stats['light_only']}/{stats['frames']} frame chỉ dùng model nhẹ, "
+                      f"{stats['heavy_frames']} frame chạy lại model nặng ({stats['heavy_rate'] * 100:.1f}%)")
+                print(f"   • Lý do: confidence thấp {stats['low_conf']}, xung đột {stats['conflict']}, "
+                      f"không thấy biển {stats['empty']}, OCR thất bại {stats['ocr_failed']} vùng")
             print("=" * 60)
             
             self.lbl_status.config(text=f"Hoàn thành {total_images} ảnh trong {total_time:.1f}s!", fg="green")
@@ -319,82 +298,16 @@ class MultiPlateApp:
         self.btn_select.config(state="normal")
         self.btn_history.config(state="normal")
 
-    def add_result_row(self, index, file_path, img_pil, result_pil, plates):
-        """Thêm một dòng kết quả vào giao diện (chạy trên Main Thread)"""
-        stt = index + 1
-
-        # Khung chứa 1 dòng
-        row_frame = tk.Frame(self.scrollable_frame, bg="white", bd=2, relief="groove")
-        row_frame.pack(fill="x", padx=10, pady=10)
-
-        # Header
-        lbl_header = tk.Label(row_frame, text=f"Hồ sơ ảnh #{stt}", font=("Arial", 11, "bold"), bg="#ddd",
-                              anchor="w", padx=10)
-        lbl_header.pack(fill="x")
-
-        content_frame = tk.Frame(row_frame, bg="white")
-        content_frame.pack(pady=10)
-
-        # --- CỘT 1: ẢNH GỐC ---
-        col1 = tk.Frame(content_frame, bg="white")
-        col1.grid(row=0, column=0, padx=20)
-
-        # Resize to hơn (450px)
-        thumb_orig = self.resize_image(img_pil, fixed_height=450)
-        tk_thumb_orig = ImageTk.PhotoImage(thumb_orig)
-        self.image_refs.append(tk_thumb_orig)
-
-        lbl_img1 = tk.Label(col1, image=tk_thumb_orig, cursor="hand2")
-        lbl_img1.pack()
-        # Gán sự kiện Click đúp -> Mở ảnh gốc full size
-        lbl_img1.bind("<Double-Button-1>", lambda e, path=file_path: self.open_image_external(e, path))
-
-        tk.Label(col1, text="Ảnh gốc (Click đúp để phóng to)", font=("Arial", 10, "italic"), bg="white").pack()
-
-        # --- CỘT 2: ẢNH XỬ LÝ ---
-        col2 = tk.Frame(content_frame, bg="white")
-        col2.grid(row=0, column=1, padx=20)
-
-        thumb_res = self.resize_image(result_pil, fixed_height=450)
-        tk_thumb_res = ImageTk.PhotoImage(thumb_res)
-        self.image_refs.append(tk_thumb_res)
-
-        tk.Label(col2, image=tk_thumb_res).pack()
-        tk.Label(col2, text="Ảnh đã nhận diện", font=("Arial", 10, "italic"), bg="white").pack()
-
-        # --- CỘT 3: KẾT QUẢ ---
-        col3 = tk.Frame(content_frame, bg="white")
-        col3.grid(row=0, column=2, padx=30, sticky="n")  # Sticky n để chữ nằm phía trên
-
-        # Tạo khoảng trống phía trên để chữ ngang tầm mắt hơn
-        tk.Frame(col3, height=50, bg="white").pack()
-
-        if plates:
-            result_text = ""
-            for p in plates:
-                if "]" in p:
-                    type_part, number_part = p.split("]", 1)
-                    type_clean = type_part.replace("[", "")
-                    result_text += f"{type_clean} - {number_part.strip()}\n"
-                else:
-                    result_text += f"{p}\n"
-
-            tk.Label(col3, text=result_text, font=("Arial", 20, "bold"), fg="#2E7D32", bg="white",
-                     justify="left").pack()
-        else:
-            tk.Label(col3, text="Không tìm thấy\nbiển số", font=("Arial", 16), fg="red", bg="white").pack()
-            
-        # Cập nhật UI ngay lập tức
-        self.root.update_idletasks()
-
-    def resize_image(self, img_pil, fixed_height):
-        # Hàm resize giữ nguyên tỉ lệ
-        h_percent = (fixed_height / float(img_pil.size[1]))
-        w_size = int((float(img_pil.size[0]) * float(h_percent)))
-        return img_pil.resize((w_size, fixed_height), Image.Resampling.LANCZOS)
+    def apply_ui_updates(self, updates):
+        """Áp dụng 1 lô cập nhật từ worker (chạy trên Main Thread, tối đa UI_FRAME_RATE lần/giây)"""
+        records = [record for _, record in updates if record is not None]
+        self.results_view.add_records(records)
+        # Chỉ cần hiển thị trạng thái mới nhất của lô
+        self.lbl_status.config(text=updates[-1][0])
 
 
 if __name__ == "__main__":
+    setup_logging()
     root = TkinterDnD.Tk()
     app = MultiPlateApp(root)
     root.mainloop()
\ No newline at end of file
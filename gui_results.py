@@ -0,0 +1,324 @@
+"""
+Danh sách kết quả ảo hóa (virtualized) cho giao diện batch
+- Chỉ dựng widget cho các dòng đang nhìn thấy (+ vài dòng đệm), tái sử dụng khi cuộn
+- Mỗi kết quả chỉ lưu metadata nhẹ (đường dẫn, biển số, khóa thumbnail)
+- Thumbnail lấy từ ThumbnailCache (LRU + đĩa), tạo trong thread nền
+- Kết quả từ worker được gộp lại và đưa lên Tk theo frame (UIUpdateChannel)
+=> Bộ nhớ không tăng theo số ảnh đã xử lý, Tk main thread không bị nghẽn
+"""
+
+import queue
+import tkinter as tk
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+from PIL import ImageTk
+from modules.thumbnails import ThumbnailCache
+from modules.config import THUMBNAIL_HEIGHT, RESULT_LIST_OVERSCAN, UI_FRAME_RATE, UI_MAX_BATCH
+
+ROW_HEIGHT = THUMBNAIL_HEIGHT + 110   # Header + ảnh + chú thích + padding
+SCROLL_UNIT = 40                       # Số pixel mỗi lần cuộn chuột
+
+
+@dataclass
+class ResultRecord:
+    """Metadata 1 dòng kết quả (không giữ ảnh)"""
+    index: int
+    file_path: str
+    plates: List[str] = field(default_factory=list)
+
+    @property
+    def stt(self) -> int:
+        return self.index + 1
+
+    @property
+    def original_key(self) -> str:
+        return f"{self.index}:orig:{self.file_path}"
+
+    @property
+    def result_key(self) -> str:
+        return f"{self.index}:result:{self.file_path}"
+
+
+def format_plates(plates: List[str]) -> str:
+    """'[Xe máy] 59-X1 123.45' -> 'Xe máy - 59-X1 123.45' (mỗi biển 1 dòng)"""
+    result_text = ""
+    for p in plates:
+        if "]" in p:
+            type_part, number_part = p.split("]", 1)
+            type_clean = type_part.replace("[", "")
+            result_text += f"{type_clean} - {number_part.strip()}\n"
+        else:
+            result_text += f"{p}\n"
+    return result_text
+
+
+class RowView:
+    """Widget 1 dòng kết quả, được tái sử dụng cho nhiều record khi cuộn"""
+
+    def __init__(self, canvas: tk.Canvas, on_open: Callable[[object, str], None]):
+        self.canvas = canvas
+        self.on_open = on_open
+        self.record: Optional[ResultRecord] = None
+        self._photos: Dict[str, ImageTk.PhotoImage] = {}
+
+        self.frame = tk.Frame(canvas, bg="white", bd=2, relief="groove", height=ROW_HEIGHT - 20)
+        self.lbl_header = tk.Label(self.frame, font=("Arial", 11, "bold"), bg="#ddd", anchor="w", padx=10)
+        self.lbl_header.pack(fill="x")
+
+        content_frame = tk.Frame(self.frame, bg="white")
+        content_frame.pack(pady=10)
+
+        # --- CỘT 1: ẢNH GỐC ---
+        col1 = tk.Frame(content_frame, bg="white")
+        col1.grid(row=0, column=0, padx=20)
+        self.lbl_orig = tk.Label(col1, cursor="hand2", bg="#f5f5f5", text="Đang tạo ảnh...")
+        self.lbl_orig.pack()
+        # Gán sự kiện Click đúp -> Mở ảnh gốc full size
+        self.lbl_orig.bind("<Double-Button-1>", self._open)
+        tk.Label(col1, text="Ảnh gốc (Click đúp để phóng to)", font=("Arial", 10, "italic"), bg="white").pack()
+
+        # --- CỘT 2: ẢNH XỬ LÝ ---
+        col2 = tk.Frame(content_frame, bg="white")
+        col2.grid(row=0, column=1, padx=20)
+        self.lbl_result = tk.Label(col2, bg="#f5f5f5", text="Đang tạo ảnh...")
+        self.lbl_result.pack()
+        tk.Label(col2, text="Ảnh đã nhận diện", font=("Arial", 10, "italic"), bg="white").pack()
+
+        # --- CỘT 3: KẾT QUẢ ---
+        col3 = tk.Frame(content_frame, bg="white")
+        col3.grid(row=0, column=2, padx=30, sticky="n")  # Sticky n để chữ nằm phía trên
+        # Tạo khoảng trống phía trên để chữ ngang tầm mắt hơn
+        tk.Frame(col3, height=50, bg="white").pack()
+        self.lbl_plates = tk.Label(col3, bg="white", justify="left")
+        self.lbl_plates.pack()
+
+        self.window_id = canvas.create_window((0, 0), window=self.frame, anchor="nw", state="hidden")
+
+    def _open(self, event):
+        if self.record is not None:
+            self.on_open(event, self.record.file_path)
+
+    def bind(self, record: ResultRecord, cache: ThumbnailCache):
+        """Gắn record vào dòng và hiển thị thumbnail (nếu đã có)"""
+        if self.record is not record:
+            self.record = record
+            self._photos.clear()
+            self.lbl_header.config(text=f"Hồ sơ ảnh #{record.stt}")
+            if record.plates:
+                self.lbl_plates.config(text=format_plates(record.plates), font=("Arial", 20, "bold"), fg="#2E7D32")
+            else:
+                self.lbl_plates.config(text="Không tìm thấy\nbiển số", font=("Arial", 16), fg="red")
+        self._show_thumbnail(self.lbl_orig, record.original_key, cache)
+        self._show_thumbnail(self.lbl_result, record.result_key, cache)
+
+    def _show_thumbnail(self, label: tk.Label, key: str, cache: ThumbnailCache):
+        if key in self._photos:
+            return
+        thumb = cache.get(key)
+        if thumb is None:
+            label.config(image="", text="Đang tạo ảnh...", width=40, height=10)
+            return
+        # PhotoImage chỉ được giữ khi dòng còn hiển thị
+        photo = ImageTk.PhotoImage(thumb)
+        self._photos[key] = photo
+        label.config(image=photo, text="", width=0, height=0)
+
+    def place(self, row: int):
+        self.canvas.coords(self.window_id, 10, row * ROW_HEIGHT + 10)
+        self.canvas.itemconfigure(self.window_id, state="normal")
+
+    def release(self):
+        """Ẩn dòng và bỏ tham chiếu ảnh để trả bộ nhớ"""
+        self.record = None
+        self._photos.clear()
+        self.lbl_orig.config(image="")
+        self.lbl_result.config(image="")
+        self.canvas.itemconfigure(self.window_id, state="hidden")
+
+
+class VirtualResultList:
+    """
+    Danh sách kết quả có thanh cuộn, chỉ dựng các dòng đang nhìn thấy
+
+    Ví dụ:
+        results = VirtualResultList(root, on_open=app.open_image_external)
+        results.render_thumbnails(record, image_pil, result_pil)   # worker của pipeline
+        results.add_records([record])                              # Main Thread
+    """
+
+    def __init__(self, parent, on_open: Callable[[object, str], None],
+                 cache: Optional[ThumbnailCache] = None, overscan: int = RESULT_LIST_OVERSCAN):
+        """
+        Args:
+            parent: Widget cha
+            on_open: Hàm mở ảnh gốc khi click đúp (event, file_path)
+            cache: ThumbnailCache dùng chung (None = tạo mới)
+            overscan: Số dòng dựng thêm phía trên/dưới vùng nhìn thấy
+        """
+        self.parent = parent
+        self.on_open = on_open
+        self.cache = cache or ThumbnailCache()
+        self.overscan = overscan
+        self.records: List[ResultRecord] = []
+        self._rows: Dict[int, RowView] = {}     # row index -> RowView đang hiển thị
+        self._pool: List[RowView] = []          # RowView rảnh để tái sử dụng
+        self._refresh_pending = False
+        self._content_width = 0
+
+        self.canvas = tk.Canvas(parent, bg="white", yscrollincrement=SCROLL_UNIT, xscrollincrement=SCROLL_UNIT)
+        self.scrollbar = tk.Scrollbar(parent, orient="vertical", command=self.canvas.yview)
+        self.h_scrollbar = tk.Scrollbar(parent, orient="horizontal", command=self.canvas.xview)
+        self.canvas.configure(yscrollcommand=self._on_yscroll, xscrollcommand=self.h_scrollbar.set)
+        self.canvas.bind("<Configure>", lambda e: self.schedule_refresh())
+
+        self.h_scrollbar.pack(side="bottom", fill="x")
+        self.scrollbar.pack(side="right", fill="y")
+        self.canvas.pack(side="left", fill="both", expand=True)
+        self._update_scrollregion()
+
+    def _on_yscroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self.schedule_refresh()
+
+    def schedule_refresh(self):
+        """Gộp nhiều sự kiện cuộn/resize thành 1 lần refresh"""
+        if not self._refresh_pending:
+            self._refresh_pending = True
+            self.canvas.after_idle(self._refresh)
+
+    def _update_scrollregion(self):
+        width = max(self._content_width + 20, self.canvas.winfo_width())
+        self.canvas.configure(scrollregion=(0, 0, width, max(1, len(self.records)) * ROW_HEIGHT))
+
+    def _visible_range(self) -> range:
+        top = self.canvas.canvasy(0)
+        height = max(self.canvas.winfo_height(), ROW_HEIGHT)
+        first = max(0, int(top // ROW_HEIGHT) - self.overscan)
+        last = min(len(self.records), int((top + height) // ROW_HEIGHT) + 1 + self.overscan)
+        return range(first, last)
+
+    def _refresh(self):
+        self._refresh_pending = False
+        visible = self._visible_range()
+
+        # Trả các dòng ra khỏi vùng nhìn thấy về pool
+        for row in [r for r in self._rows if r not in visible]:
+            view = self._rows.pop(row)
+            view.release()
+            self._pool.append(view)
+
+        for row in visible:
+            view = self._rows.get(row)
+            if view is None:
+                view = self._pool.pop() if self._pool else RowView(self.canvas, self.on_open)
+                self._rows[row] = view
+            view.bind(self.records[row], self.cache)
+            view.place(row)
+            self._content_width = max(self._content_width, view.frame.winfo_reqwidth())
+        self._update_scrollregion()
+
+    def render_thumbnails(self, record: ResultRecord, image_pil, result_pil):
+        """
+        Tạo thumbnail cho record ngay trên thread gọi (thread-safe)
+
+        Dùng trong worker của pipeline để Tk main thread chỉ còn việc hiển thị.
+        """
+        self.cache.render(record.original_key, image_pil)
+        self.cache.render(record.result_key, result_pil)
+
+    def add_records(self, records: Sequence[ResultRecord]):
+        """Thêm nhiều record đã có thumbnail, chỉ refresh 1 lần (chạy trên Main Thread)"""
+        if not records:
+            return
+        self.records.extend(records)
+        self._update_scrollregion()
+        self.schedule_refresh()
+
+    def clear(self):
+        """Xóa toàn bộ kết quả và thumbnail"""
+        for view in self._rows.values():
+            view.release()
+            self._pool.append(view)
+        self._rows.clear()
+        self.records = []
+        self._content_width = 0
+        self.cache.clear()
+        self.canvas.yview_moveto(0)
+        self._update_scrollregion()
+
+    def close(self):
+        self.cache.close()
+
+    def yview_scroll(self, number, what):
+        self.canvas.yview_scroll(number, what)
+
+    def xview_scroll(self, number, what):
+        self.canvas.xview_scroll(number, what)
+
+
+class UIUpdateChannel:
+    """
+    Kênh cập nhật giao diện từ worker thread
+
+    Worker gọi post() (không chạm vào Tk); Main Thread lấy ra theo nhịp cố định
+    (UI_FRAME_RATE) và xử lý cả lô trong 1 lần gọi handler.
+
+    Ví dụ:
+        channel = UIUpdateChannel(root, handler=lambda items: ...)
+        channel.start()
+        channel.post(item)    # từ thread bất kỳ
+        channel.stop()        # xử lý nốt phần còn lại rồi dừng
+    """
+
+    def __init__(self, widget, handler: Callable[[List[object]], None],
+                 frame_rate: int = UI_FRAME_RATE, max_batch: int = UI_MAX_BATCH):
+        """
+        Args:
+            widget: Widget Tk dùng để lập lịch after()
+            handler: Hàm nhận list các item (chạy trên Main Thread)
+            frame_rate: Số lần cập nhật tối đa mỗi giây
+            max_batch: Số item tối đa mỗi frame (phần còn lại để frame sau)
+        """
+        self.widget = widget
+        self.handler = handler
+        self.interval_ms = max(1, int(1000 / frame_rate))
+        self.max_batch = max_batch
+        self._queue: queue.Queue = queue.Queue()
+        self._after_id = None
+
+    def post(self, item):
+        """Gửi 1 item lên giao diện (an toàn khi gọi từ thread bất kỳ)"""
+        self._queue.put(item)
+
+    def start(self):
+        """Bắt đầu vòng cập nhật theo frame (gọi trên Main Thread)"""
+        if self._after_id is None:
+            self._after_id = self.widget.after(self.interval_ms, self._tick)
+
+    def _drain(self, limit: Optional[int]) -> List[object]:
+        items = []
+        while limit is None or len(items) < limit:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _tick(self):
+        items = self._drain(self.max_batch)
+        if items:
+            self.handler(items)
+        self._after_id = self.widget.after(self.interval_ms, self._tick)
+
+    def flush(self):
+        """Xử lý ngay mọi item đang chờ (gọi trên Main Thread)"""
+        items = self._drain(None)
+        if items:
+            self.handler(items)
+
+    def stop(self):
+        """Dừng vòng cập nhật sau khi xử lý nốt các item còn lại"""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+        self.flush()
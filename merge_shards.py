@@ -0,0 +1,48 @@
+"""
+Gộp kết quả các shard của run_batch.py --shard i/N thành 1 kho
+- History của từng shard được chép (hoặc di chuyển) vào {dest}/history/
+- history.csv được gộp và đổi đường dẫn sang kho, manifest.jsonl giữ 1 bản ghi/ảnh
+- Ảnh bị xử lý ở nhiều shard (đổi N giữa các lần chạy, chạy lại) chỉ giữ 1 kết quả
+- Chạy lại nhiều lần được, ảnh đã gộp sẽ bỏ qua
+
+Ví dụ:
+    python merge_shards.py shards/ --dest ket_qua/
+    python merge_shards.py shards/shard-0-of-2 shards/shard-1-of-2 --dest ket_qua/ --move
+"""
+
+import argparse
+import os
+from modules.sharding import find_shard_dirs, merge_shards
+from modules.config import SHARD_MANIFEST_FILE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gộp kết quả các shard thành 1 kho")
+    parser.add_argument('sources', nargs='+', help="Thư mục gốc chứa các shard, hoặc từng thư mục shard-i-of-N")
+    parser.add_argument('--dest', required=True, help="Thư mục kho đã gộp")
+    parser.add_argument('--move', action='store_true', help="Di chuyển thư mục History thay vì copy")
+    args = parser.parse_args()
+
+    shard_dirs = []
+    for source in args.sources:
+        if not os.path.isdir(source):
+            parser.error(f"không phải thư mục: {source}")
+        if os.path.isfile(os.path.join(source, SHARD_MANIFEST_FILE)):
+            shard_dirs.append(source)
+        else:
+            shard_dirs.extend(find_shard_dirs(source))
+    if not shard_dirs:
+        print("Không tìm thấy shard nào.")
+        return
+
+    print(f"🧩 Gộp {len(shard_dirs)} shard -> {args.dest}")
+    stats = merge_shards(shard_dirs, args.dest, move=args.move)
+    print(f"✅ {stats['images']} ảnh, {stats['folders']} thư mục History, {stats['packs']} gói, {stats['rows']} dòng CSV")
+    if stats['duplicates']:
+        print(f"♻ Bỏ {stats['duplicates']} bản ghi trùng giữa các shard")
+    if stats['skipped']:
+        print(f"⏭ Bỏ qua {stats['skipped']} ảnh đã có trong kho")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,62 @@
 """
 Module nhận diện biển số xe Việt Nam
 Bao gồm: Detection, OCR, Preprocessing, và các hàm hỗ trợ
+
+Các class cần ultralytics / easyocr (LicensePlateDetector, LicensePlateOCR, ...)
+được import lười (lazy) khi truy cập lần đầu để `import modules` không tốn vài giây.
 """
 
-from .detection import LicensePlateDetector
-from .ocr import LicensePlateOCR
-from .preprocessing import preprocess_for_ocr
+import importlib
 from .utils import (
     classify_vehicle,
     validate_province_code,
     fix_plate_chars,
     format_plate,
+    is_plate_prefix,
+    match_plate_pattern,
     VALID_PROVINCE_CODES,
+    PLATE_PATTERNS,
     dict_char_to_num,
     dict_num_to_char
 )
+from .decoding import decode_plate_lines
+from .results import OCRReading, PlateResult
+
+# Tên -> module con chứa nó, chỉ import khi được dùng
+_LAZY_ATTRS = {
+    'LicensePlateDetector': '.detection',
+    'LicensePlateOCR': '.ocr',
+    'HistoryLogger': '.logger',
+    'ModelLoader': '.loader',
+    'preprocess_for_ocr': '.preprocessing',
+}
+
 
-from .logger import HistoryLogger
+def __getattr__(name):
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
 
 __all__ = [
     'LicensePlateDetector',
     'LicensePlateOCR',
     'HistoryLogger',
+    'ModelLoader',
     'preprocess_for_ocr',
     'classify_vehicle',
     'validate_province_code',
     'fix_plate_chars',
     'format_plate',
+    'is_plate_prefix',
+    'match_plate_pattern',
+    'decode_plate_lines',
+    'OCRReading',
+    'PlateResult',
     'VALID_PROVINCE_CODES',
+    'PLATE_PATTERNS',
     'dict_char_to_num',
     'dict_num_to_char'
 ]
@@ -0,0 +1,264 @@
+"""
+Module lưu ảnh History dạng gói (pack) thay cho hàng nghìn file nhỏ
+- 1 file .pack chỉ ghi thêm (append-only) cho mỗi batch hoặc mỗi giờ, kèm file chỉ mục .idx (JSONL)
+- Mỗi bản ghi trong .pack tự mô tả: MAGIC + (kích thước, độ dài tên) + tên + dữ liệu,
+  nên có thể dựng lại chỉ mục khi file .idx bị mất/hỏng
+- Đường dẫn tới ảnh trong gói: "{đường dẫn .pack}::{tên thành viên}", ví dụ
+  history/packs/20250101_0930_1234.pack::20250101_093015_xe/20250101_093015_xe.jpg
+"""
+
+import io
+import json
+import os
+import struct
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+import numpy as np
+from PIL import Image
+
+PACK_EXT = '.pack'
+INDEX_EXT = '.idx'
+REF_SEPARATOR = '::'
+
+# Header bản ghi: MAGIC (4 byte) + kích thước dữ liệu (uint64) + độ dài tên (uint16)
+_MAGIC = b'LPA1'
+_HEADER = struct.Struct('<4sQH')
+
+
+def make_ref(pack_path: str, member: str) -> str:
+    """Tạo đường dẫn tham chiếu tới 1 ảnh trong gói"""
+    return f"{pack_path}{REF_SEPARATOR}{member}"
+
+
+def is_archive_ref(path: str) -> bool:
+    """Đường dẫn có trỏ vào gói .pack không"""
+    return bool(path) and REF_SEPARATOR in path and path.split(REF_SEPARATOR, 1)[0].endswith(PACK_EXT)
+
+
+def split_ref(ref: str) -> Tuple[str, str]:
+    """Tách tham chiếu thành (đường dẫn .pack, tên thành viên)"""
+    pack_path, _, member = ref.partition(REF_SEPARATOR)
+    return pack_path, member
+
+
+def index_path(pack_path: str) -> str:
+    """File chỉ mục đi kèm file .pack"""
+    return pack_path[:-len(PACK_EXT)] + INDEX_EXT if pack_path.endswith(PACK_EXT) else pack_path + INDEX_EXT
+
+
+class ArchiveWriter:
+    """
+    Ghi ảnh vào 1 file .pack (thread-safe, chỉ ghi thêm)
+
+    Dữ liệu được ghi trước, dòng chỉ mục ghi sau: process bị kill giữa chừng
+    chỉ để lại phần đuôi không có trong chỉ mục (reader bỏ qua).
+    """
+
+    def __init__(self, pack_path: str):
+        self.pack_path = pack_path
+        folder = os.path.dirname(pack_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self.members = set()
+        if os.path.isfile(pack_path):
+            # Chạy tiếp gói đã có (cùng giờ): cắt bản ghi dở ở cuối file rồi nạp tên đã dùng để không trùng
+            valid_end = 0
+            for _, offset, size in scan_pack(pack_path):
+                valid_end = offset + size
+            if valid_end < os.path.getsize(pack_path):
+                os.truncate(pack_path, valid_end)
+            # Dòng chỉ mục ghi dở ở cuối (hoặc .idx thiếu bản ghi) -> dựng lại từ .pack,
+            # nếu không dòng ghi tiếp theo sẽ bị nối vào dòng hỏng và mất khỏi chỉ mục
+            if not self._index_intact(pack_path):
+                rebuild_index(pack_path)
+            self.members = set(ArchiveReader.load_index(pack_path))
+        self._prefixes = {member.split('/', 1)[0] for member in self.members}
+        self._pack = open(pack_path, 'ab')
+        self._index = open(index_path(pack_path), 'a', encoding='utf-8')
+
+    @staticmethod
+    def _index_intact(pack_path: str) -> bool:
+        """File .idx kết thúc bằng xuống dòng và khớp các bản ghi trong .pack"""
+        idx_path = index_path(pack_path)
+        if not os.path.isfile(idx_path):
+            return False
+        with open(idx_path, 'rb') as f:
+            data = f.read()
+        if data and not data.endswith(b"\n"):
+            return False
+        scanned = {name: (offset, size) for name, offset, size in scan_pack(pack_path)}
+        return ArchiveReader.load_index(pack_path) == scanned
+
+    def unique_prefix(self, prefix: str) -> str:
+        """Tiền tố thư mục chưa dùng trong gói (thêm _1, _2, ... nếu trùng)"""
+        with self._lock:
+            candidate = prefix
+            suffix = 0
+            while candidate in self._prefixes:
+                suffix += 1
+                candidate = f"{prefix}_{suffix}"
+            # Giữ chỗ để thread khác không lấy trùng
+            self._prefixes.add(candidate)
+            return candidate
+
+    def add(self, member: str, data: bytes) -> str:
+        """
+        Thêm 1 file vào gói
+
+        Returns:
+            Đường dẫn tham chiếu "{pack}::{member}"
+        """
+        name = member.encode('utf-8')
+        with self._lock:
+            offset = self._pack.seek(0, os.SEEK_END)
+            # 1 lần write cho header + tên + dữ liệu
+            self._pack.write(_HEADER.pack(_MAGIC, len(data), len(name)) + name + data)
+            self._pack.flush()
+            entry = {'name': member, 'offset': offset + _HEADER.size + len(name), 'size': len(data)}
+            self._index.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._index.flush()
+            self.members.add(member)
+        return make_ref(self.pack_path, member)
+
+    def add_image(self, member: str, image: Union[Image.Image, np.ndarray], format: str = 'JPEG') -> str:
+        """Nén ảnh (PIL hoặc numpy) trong RAM rồi thêm vào gói"""
+        if not isinstance(image, Image.Image):
+            image = Image.fromarray(image)
+        buffer = io.BytesIO()
+        image.save(buffer, format=format)
+        return self.add(member, buffer.getvalue())
+
+    def add_file(self, member: str, path: str) -> str:
+        """Thêm nguyên nội dung 1 file trên đĩa (không giải mã/nén lại)"""
+        with open(path, 'rb') as f:
+            return self.add(member, f.read())
+
+    def close(self):
+        with self._lock:
+            for f in (self._pack, self._index):
+                if not f.closed:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    f.close()
+
+
+class ArchiveReader:
+    """
+    Đọc ngẫu nhiên (random access) ảnh trong 1 file .pack theo chỉ mục
+
+    Ví dụ:
+        with ArchiveReader("history/packs/20250101_0930_1234.pack") as reader:
+            for name in reader.names():
+                data = reader.read(name)
+    """
+
+    def __init__(self, pack_path: str):
+        self.pack_path = pack_path
+        self.index = self.load_index(pack_path)
+        self._file = open(pack_path, 'rb')
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load_index(pack_path: str) -> Dict[str, Tuple[int, int]]:
+        """
+        Nạp chỉ mục {tên: (offset, size)}; file .idx thiếu/hỏng -> dựng lại bằng cách quét .pack
+        """
+        idx_path = index_path(pack_path)
+        index: Dict[str, Tuple[int, int]] = {}
+        if os.path.isfile(idx_path):
+            pack_size = os.path.getsize(pack_path)
+            with open(idx_path, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        offset, size = int(entry['offset']), int(entry['size'])
+                    except (ValueError, KeyError, TypeError):
+                        # Dòng ghi dở khi process bị kill
+                        continue
+                    if offset + size <= pack_size:
+                        index[entry['name']] = (offset, size)
+            return index
+        return dict((name, (offset, size)) for name, offset, size in scan_pack(pack_path))
+
+    def names(self) -> List[str]:
+        """Tên các thành viên trong gói (theo thứ tự ghi)"""
+        return list(self.index)
+
+    def __contains__(self, member: str) -> bool:
+        return member in self.index
+
+    def read(self, member: str) -> bytes:
+        """Đọc nội dung 1 thành viên"""
+        offset, size = self.index[member]
+        with self._lock:
+            self._file.seek(offset)
+            return self._file.read(size)
+
+    def open_image(self, member: str) -> Image.Image:
+        """Mở 1 thành viên dạng PIL Image"""
+        return Image.open(io.BytesIO(self.read(member)))
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def scan_pack(pack_path: str) -> Iterator[Tuple[str, int, int]]:
+    """
+    Duyệt tuần tự các bản ghi trong .pack (không cần chỉ mục)
+
+    Yields:
+        (tên, offset dữ liệu, kích thước); dừng ở bản ghi cắt dở cuối file
+    """
+    file_size = os.path.getsize(pack_path)
+    with open(pack_path, 'rb') as f:
+        position = 0
+        while position + _HEADER.size <= file_size:
+            f.seek(position)
+            magic, size, name_len = _HEADER.unpack(f.read(_HEADER.size))
+            data_offset = position + _HEADER.size + name_len
+            if magic != _MAGIC or data_offset + size > file_size:
+                break
+            name = f.read(name_len).decode('utf-8', errors='replace')
+            yield name, data_offset, size
+            position = data_offset + size
+
+
+def rebuild_index(pack_path: str) -> int:
+    """Dựng lại file .idx từ nội dung .pack, trả về số bản ghi"""
+    entries = [{'name': name, 'offset': offset, 'size': size} for name, offset, size in scan_pack(pack_path)]
+    tmp_path = index_path(pack_path) + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, index_path(pack_path))
+    return len(entries)
+
+
+def unpack_to(pack_path: str, dest_dir: str, reader: Optional[ArchiveReader] = None) -> Dict[str, str]:
+    """
+    Giải nén 1 gói về dạng thư mục cũ: {dest_dir}/{tên thành viên}
+
+    Returns:
+        Dict {tham chiếu gói: đường dẫn file đã giải nén}
+    """
+    own_reader = reader is None
+    reader = reader or ArchiveReader(pack_path)
+    mapping = {}
+    try:
+        for member in reader.names():
+            target = os.path.join(dest_dir, *member.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, 'wb') as f:
+                f.write(reader.read(member))
+            mapping[make_ref(pack_path, member)] = target
+    finally:
+        if own_reader:
+            reader.close()
+    return mapping
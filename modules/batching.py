@@ -0,0 +1,121 @@
+"""
+Module gom request thành micro-batch (dynamic batching)
+- Nhiều thread gửi request đồng thời, 1 worker gom lại thành batch
+- Batch được chạy khi đủ max_batch_size hoặc hết max_wait kể từ request đầu tiên
+=> Model được gọi 1 lần cho cả batch thay vì 1 lần / request
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+from .config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+
+# Tín hiệu dừng worker
+_SENTINEL = object()
+
+
+class MicroBatcher:
+    """
+    Gom các request đồng thời thành batch và xử lý bằng 1 hàm batch
+
+    Ví dụ:
+        batcher = MicroBatcher(lambda items: [x * 2 for x in items])
+        future = batcher.submit(21)
+        future.result()  # 42
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        """
+        Args:
+            process_batch: Hàm nhận list payload, trả về list kết quả cùng thứ tự
+                (phần tử là Exception -> chỉ request đó nhận exception)
+            max_batch_size: Số request tối đa trong 1 batch
+            max_wait_ms: Thời gian chờ tối đa (ms) kể từ request đầu tiên của batch
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        # Metrics
+        self.batches = 0
+        self.items = 0
+        self.max_seen_batch = 0
+        self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, payload: Any) -> Future:
+        """
+        Gửi 1 request
+
+        Returns:
+            Future chứa kết quả (hoặc exception của request / của cả batch)
+        """
+        future: Future = Future()
+        self._queue.put((payload, future))
+        return future
+
+    def _collect(self, first) -> List[Any]:
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                entry = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if entry is _SENTINEL:
+                # Xử lý nốt batch hiện tại rồi mới dừng
+                self._queue.put(_SENTINEL)
+                break
+            batch.append(entry)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _SENTINEL:
+                return
+            batch = self._collect(first)
+            payloads = [payload for payload, _ in batch]
+
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                self.max_seen_batch = max(self.max_seen_batch, len(batch))
+
+            try:
+                results = self.process_batch(payloads)
+                if len(results) != len(batch):
+                    raise RuntimeError(f"process_batch trả về {len(results)} kết quả cho {len(batch)} request")
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Thống kê batching"""
+        with self._lock:
+            return {
+                'batches': self.batches,
+                'items': self.items,
+                'avg_batch_size': self.items / self.batches if self.batches else 0.0,
+                'max_batch_size': self.max_seen_batch,
+                'pending': self._queue.qsize(),
+            }
+
+    def close(self, wait: bool = True):
+        """Dừng worker sau khi xử lý hết các request đang chờ"""
+        self._queue.put(_SENTINEL)
+        if wait:
+            self._thread.join()
@@ -0,0 +1,441 @@
+"""
+Module xuất History dạng cột (Parquet / Arrow IPC) cho phân tích
+- Cột có kiểu: thời điểm, biển số, loại xe, confidence, phương pháp, thời gian từng giai đoạn, đường dẫn ảnh
+- Chia thư mục theo ngày kiểu Hive ({EXPORT_DIR}/date=YYYY-MM-DD/*.parquet): pandas / pyarrow / DuckDB
+  đọc thẳng cả thư mục và chỉ quét các ngày cần
+- CSVExporter: xuất history.csv, mỗi lần chỉ đọc phần mới ghi thêm (chịu được BOM, header lặp lại,
+  dòng thiếu/thừa cột, thời điểm hỏng). CSV không có confidence / phương pháp / thời gian giai đoạn
+  -> các cột đó để trống
+- ColumnarWriter: ghi liên tục từ pipeline (đủ mọi cột), mỗi lần ghi là 1 file mới
+- File chỉ hiện ra khi đã ghi xong (ghi file tạm rồi đổi tên), file đã có không bao giờ bị sửa
+- Cần pyarrow (pip install pyarrow), chỉ import khi dùng
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from .config import EXPORT_DIR, EXPORT_LIVE_DIR, EXPORT_FORMAT, EXPORT_BATCH_ROWS, EXPORT_FLUSH_ROWS, EXPORT_FLUSH_SECONDS
+from .logger import CSV_HEADER
+
+EXPORT_FORMATS = ('parquet', 'arrow')
+_EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+
+STAGE_NAMES = ('decode', 'detect', 'ocr', 'render', 'persist')
+
+# (tên cột, kiểu) - thứ tự cột trong file
+COLUMNS = (
+    ('time', 'timestamp'),
+    ('plate', 'string'),                 # None = ảnh không có biển số ("No Plate" trong CSV)
+    ('vehicle_type', 'string'),
+    ('confidence', 'float32'),
+    ('method', 'string'),                # Phương pháp tiền xử lý được chọn
+    ('decoder', 'string'),               # 'greedy' / 'grammar'
+    ('plate_index', 'int16'),            # Thứ tự biển số trong ảnh
+    ('source', 'string'),                # Ảnh nguồn
+    *((f'{stage}_ms', 'float32') for stage in STAGE_NAMES),
+    ('original_path', 'string'),
+    ('roi_path', 'string'),
+    ('preprocessed_path', 'string'),
+    ('detected_path', 'string'),
+    ('history', 'string'),               # Thư mục History / tham chiếu gói "{gói}::{thư mục}"
+)
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+
+# Cột CSV (theo vị trí trong CSV_HEADER) -> cột xuất
+_CSV_COLUMNS = ('time', 'plate', 'vehicle_type', 'original_path', 'roi_path', 'preprocessed_path', 'detected_path')
+_CSV_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+_NO_PLATE = "No Plate"
+
+# Mỗi lần đọc 1 khối CSV (cắt ở cuối dòng)
+_READ_CHUNK = 8 << 20
+_STATE_FILE = "_export_state.json"
+# Đoạn đầu file dùng để nhận ra history.csv đã bị thay bằng file khác
+_FINGERPRINT_BYTES = 4096
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Cần pyarrow để xuất dạng cột: pip install pyarrow") from None
+    return pyarrow
+
+
+def history_schema():
+    """Schema pyarrow của dữ liệu xuất"""
+    pa = _import_pyarrow()
+    types = {'timestamp': pa.timestamp('ms'), 'string': pa.string(),
+             'float32': pa.float32(), 'int16': pa.int16()}
+    return pa.schema([(name, types[kind]) for name, kind in COLUMNS])
+
+
+def partition_dir(out_dir: str, day: str) -> str:
+    """Thư mục của 1 ngày (day: 'YYYY-MM-DD')"""
+    return os.path.join(out_dir, f"date={day}")
+
+
+class _PartFile:
+    """1 file dữ liệu đang ghi: ghi vào file tạm, đổi tên khi đóng"""
+
+    def __init__(self, directory: str, name: str, schema, fmt: str):
+        pa = _import_pyarrow()
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, name + _EXTENSIONS[fmt])
+        self._tmp_path = os.path.join(directory, f".{name}.tmp")
+        self.rows = 0
+        if fmt == 'parquet':
+            self._writer = pa.parquet.ParquetWriter(self._tmp_path, schema, compression='zstd')
+        else:
+            self._sink = pa.OSFile(self._tmp_path, 'wb')
+            self._writer = pa.ipc.new_file(self._sink, schema,
+                                           options=pa.ipc.IpcWriteOptions(compression='zstd'))
+        self._fmt = fmt
+
+    def write(self, table):
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self) -> str:
+        self._writer.close()
+        if self._fmt != 'parquet':
+            self._sink.close()
+        os.replace(self._tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        """Bỏ file đang ghi (không công bố phần dở)"""
+        try:
+            self._writer.close()
+            if self._fmt != 'parquet':
+                self._sink.close()
+        finally:
+            if os.path.exists(self._tmp_path):
+                os.remove(self._tmp_path)
+
+
+def _part_name(prefix: str, seq: int) -> str:
+    return f"{prefix}-{datetime.now().strftime('%Y%m%d_%H%M%S')}-{os.getpid()}-{seq:04d}"
+
+
+def _build_table(columns: Dict[str, list], rows: int, schema):
+    """Dict cột -> pyarrow.Table (cột không có -> toàn null)"""
+    pa = _import_pyarrow()
+    arrays = []
+    for field in schema:
+        values = columns.get(field.name)
+        if values is None:
+            arrays.append(pa.nulls(rows, field.type))
+        elif isinstance(values, (pa.Array, pa.ChunkedArray)):
+            arrays.append(values)
+        else:
+            arrays.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+# ---------------------------------------------------------------------------
+# history.csv -> dạng cột
+# ---------------------------------------------------------------------------
+
+def iter_csv_rows(text: str) -> Iterator[Tuple[str, List[Optional[str]]]]:
+    """
+    Duyệt các dòng dữ liệu của 1 đoạn history.csv
+
+    Bỏ qua dòng trống, header (kể cả header lặp lại khi nhiều file được nối với nhau), BOM ở giữa file.
+    Dòng thiếu cột được bù None, cột thừa bị bỏ.
+
+    Yields:
+        (ngày 'YYYY-MM-DD', [thời điểm, biển số, loại xe, 4 đường dẫn ảnh]) - ngày "" nếu thời điểm hỏng
+    """
+    width = len(CSV_HEADER)
+    for row in csv.reader(io.StringIO(text)):
+        if not row:
+            continue
+        first = row[0].lstrip('\ufeff').strip()
+        if first == CSV_HEADER[0]:
+            continue
+        values = [value or None for value in row[:width]]
+        values[0] = first
+        if len(values) < width:
+            values.extend([None] * (width - len(values)))
+        if values[1] == _NO_PLATE:
+            values[1] = None
+        # Kiểm tra nhanh dạng 'YYYY-MM-DD ...', parse đầy đủ khi dựng cột
+        day = first[:10] if len(first) >= 10 and first[4] == '-' and first[7] == '-' else ""
+        yield day, values
+
+
+class CSVExporter:
+    """
+    Xuất history.csv sang thư mục dạng cột, tăng dần
+
+    Vị trí đã đọc được lưu ở {out_dir}/_export_state.json: chạy lại chỉ xuất các dòng mới.
+    File chỉ được công bố khi xuất thành công, lỗi giữa chừng thì bỏ hết (chạy lại không bị trùng dòng).
+    history.csv bị xóa (clear_history.py) hoặc thay bằng file khác -> đọc lại từ đầu,
+    các file đã xuất giữ nguyên (vẫn là lịch sử thật).
+
+    Ví dụ:
+        stats = CSVExporter("history/history.csv", "history/columnar").export()
+    """
+
+    def __init__(self, csv_path: str, out_dir: str = EXPORT_DIR, fmt: str = EXPORT_FORMAT,
+                 batch_rows: int = EXPORT_BATCH_ROWS):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Định dạng không hợp lệ: {fmt} (chọn {'/'.join(EXPORT_FORMATS)})")
+        self.schema = history_schema()
+        self.csv_path = csv_path
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.batch_rows = batch_rows
+        self.state_path = os.path.join(out_dir, _STATE_FILE)
+
+    def _load_state(self) -> Dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return state if state.get('csv_path') == os.path.abspath(self.csv_path) else {}
+
+    def _save_state(self, consumed: int, fingerprint: str):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'csv_path': os.path.abspath(self.csv_path), 'consumed': consumed,
+                       'fingerprint': fingerprint}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _fingerprint(self, f, length: int) -> str:
+        f.seek(0)
+        return hashlib.sha1(f.read(min(length, _FINGERPRINT_BYTES))).hexdigest()
+
+    def export(self) -> Dict[str, int]:
+        """
+        Xuất các dòng mới của history.csv
+
+        Returns:
+            Thống kê: rows (số dòng đã xuất), bad_rows (dòng bỏ qua do thời điểm hỏng),
+            files (số file đã ghi), days (số ngày có dữ liệu mới)
+        """
+        pa = _import_pyarrow()
+        schema = self.schema
+        stats = {'rows': 0, 'bad_rows': 0, 'files': 0, 'days': 0}
+        if not os.path.isfile(self.csv_path):
+            return stats
+        os.makedirs(self.out_dir, exist_ok=True)
+        state = self._load_state()
+        parts: Dict[str, _PartFile] = {}
+        pending: Dict[str, List[List[Optional[str]]]] = {}
+        seq = 0
+
+        def flush_day(day: str):
+            nonlocal seq
+            rows = pending.pop(day, None)
+            if not rows:
+                return
+            columns = {name: [row[i] for row in rows] for i, name in enumerate(_CSV_COLUMNS)}
+            times = pa.compute.strptime(pa.array(columns['time'], pa.string()), format=_CSV_TIME_FORMAT,
+                                        unit='ms', error_is_null=True)
+            columns['time'] = times
+            table = _build_table(columns, len(rows), schema)
+            bad = times.null_count
+            if bad:
+                table = table.filter(times.is_valid())
+                stats['bad_rows'] += bad
+            if not table.num_rows:
+                return
+            part = parts.get(day)
+            if part is None:
+                part = parts[day] = _PartFile(partition_dir(self.out_dir, day), _part_name('csv', seq), schema, self.fmt)
+                seq += 1
+            part.write(table)
+            stats['rows'] += table.num_rows
+
+        with open(self.csv_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            consumed = state.get('consumed', 0)
+            if consumed > size or (consumed and self._fingerprint(f, consumed) != state.get('fingerprint')):
+                print(f"⚠ {self.csv_path} đã bị xóa hoặc thay mới, đọc lại từ đầu")
+                consumed = 0
+            f.seek(consumed)
+            try:
+                while True:
+                    chunk = f.read(_READ_CHUNK)
+                    if not chunk:
+                        break
+                    # Cắt ở cuối dòng cuối cùng (dòng đang ghi dở để lần sau)
+                    end = chunk.rfind(b'\n') + 1
+                    if end == 0:
+                        if len(chunk) < _READ_CHUNK:
+                            break
+                        end = len(chunk)
+                    f.seek(consumed + end)
+                    consumed += end
+                    for day, values in iter_csv_rows(chunk[:end].decode('utf-8', errors='replace')):
+                        if not day:
+                            stats['bad_rows'] += 1
+                            continue
+                        rows = pending.setdefault(day, [])
+                        rows.append(values)
+                        if len(rows) >= self.batch_rows:
+                            flush_day(day)
+                for day in list(pending):
+                    flush_day(day)
+            except BaseException:
+                for part in parts.values():
+                    part.abort()
+                raise
+            for part in parts.values():
+                part.close()
+            stats['files'] = stats['days'] = len(parts)
+            fingerprint = self._fingerprint(f, consumed)
+        self._save_state(consumed, fingerprint)
+        return stats
+
+
+# ---------------------------------------------------------------------------
+# Ghi liên tục từ pipeline
+# ---------------------------------------------------------------------------
+
+class ColumnarWriter:
+    """
+    Ghi kết quả pipeline dạng cột (đủ confidence, phương pháp, thời gian từng giai đoạn)
+
+    Gom dòng trong RAM, ghi 1 file mới cho mỗi ngày khi đủ flush_rows dòng hoặc đã quá flush_seconds giây
+    (thread nền ghi cả khi không có kết quả mới, close() ghi nốt phần còn lại).
+    Mặc định ghi vào EXPORT_LIVE_DIR, không dùng chung thư mục với CSVExporter (cùng 1 ảnh sẽ có 2 dòng).
+
+    Ví dụ:
+        writer = ColumnarWriter("history/columnar_live")
+        pipeline = build_recognition_pipeline(detector, ocr, logger, on_result=writer.add_item)
+        ...
+        writer.close()
+    """
+
+    def __init__(self, out_dir: str = EXPORT_LIVE_DIR, fmt: str = EXPORT_FORMAT,
+                 flush_rows: int = EXPORT_FLUSH_ROWS, flush_seconds: float = EXPORT_FLUSH_SECONDS):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Định dạng không hợp lệ: {fmt} (chọn {'/'.join(EXPORT_FORMATS)})")
+        self.schema = history_schema()
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._columns: Dict[str, Dict[str, list]] = {}      # ngày -> cột -> giá trị
+        self._buffered = 0
+        self._seq = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.files = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="columnar-flush")
+        self._thread.start()
+
+    def _append(self, day: str, values: Dict):
+        columns = self._columns.get(day)
+        if columns is None:
+            columns = self._columns[day] = {name: [] for name in COLUMN_NAMES}
+        for name in COLUMN_NAMES:
+            columns[name].append(values.get(name))
+        self._buffered += 1
+
+    def add_item(self, item):
+        """Thêm kết quả 1 ảnh (PipelineItem đã qua đủ các giai đoạn)"""
+        if item.error is not None:
+            return
+        now = datetime.now()
+        day = now.strftime("%Y-%m-%d")
+        base = {'time': now, 'source': item.file_path, 'history': item.history_dir or None}
+        for stage in STAGE_NAMES:
+            elapsed = item.timings.get(stage)
+            base[f'{stage}_ms'] = elapsed * 1000 if elapsed is not None else None
+        with self._lock:
+            if not item.detections:
+                self._append(day, base)
+            for index, det in enumerate(item.detections):
+                self._append(day, dict(base, plate=det.text, vehicle_type=det.vehicle_type,
+                                       confidence=det.confidence, method=det.method, decoder=det.decoder,
+                                       plate_index=index))
+            due = self._buffered >= self.flush_rows or \
+                time.monotonic() - self._last_flush >= self.flush_seconds
+            if due:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        self._last_flush = time.monotonic()
+        buffered, self._columns, self._buffered = self._columns, {}, 0
+        for day, columns in buffered.items():
+            rows = len(columns['time'])
+            part = _PartFile(partition_dir(self.out_dir, day), _part_name('live', self._seq), self.schema, self.fmt)
+            self._seq += 1
+            part.write(_build_table(columns, rows, self.schema))
+            part.close()
+            self.rows += rows
+            self.files += 1
+
+    def _loop(self):
+        timeout = self.flush_seconds
+        while not self._stop.wait(timeout):
+            timeout = self.flush_seconds
+            try:
+                with self._lock:
+                    elapsed = time.monotonic() - self._last_flush
+                    if not self._buffered:
+                        continue
+                    if elapsed >= self.flush_seconds:
+                        self._flush_locked()
+                    else:
+                        timeout = self.flush_seconds - elapsed
+            except OSError as e:
+                print(f"⚠ Không ghi được dữ liệu dạng cột {self.out_dir}: {e}")
+
+    def flush(self):
+        """Ghi ngay các dòng đang gom"""
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+        if self.rows:
+            print(f"📊 Đã ghi {self.rows} dòng dạng cột vào {self.files} file ({self.out_dir})")
+
+
+def read_history(out_dir: str = EXPORT_DIR, days: Optional[Tuple[str, str]] = None, columns: Optional[List[str]] = None):
+    """
+    Đọc dữ liệu đã xuất thành pyarrow.Table (chỉ quét các ngày / cột cần)
+
+    Args:
+        out_dir: Thư mục dữ liệu dạng cột
+        days: (ngày đầu, ngày cuối) dạng 'YYYY-MM-DD', None = tất cả
+        columns: Các cột cần đọc (None = tất cả, thêm cột 'date' của thư mục ngày)
+
+    Ví dụ:
+        df = read_history("history/columnar", days=("2024-05-01", "2024-05-31")).to_pandas()
+    """
+    pa = _import_pyarrow()
+    import pyarrow.dataset as ds
+    tables = []
+    for fmt, ext in _EXTENSIONS.items():
+        files = [os.path.join(root, name) for root, _, names in os.walk(out_dir)
+                 for name in sorted(names) if name.endswith(ext) and not name.startswith('.')]
+        if files:
+            tables.append(ds.dataset(files, format='ipc' if fmt == 'arrow' else fmt,
+                                     partitioning='hive', partition_base_dir=out_dir))
+    if not tables:
+        return history_schema().empty_table()
+    dataset = tables[0] if len(tables) == 1 else ds.dataset(tables)
+    condition = None
+    if days is not None:
+        condition = (ds.field('date') >= days[0]) & (ds.field('date') <= days[1])
+    return dataset.to_table(columns=columns, filter=condition)
@@ -11,14 +11,92 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 MODEL_PATH = "models/yolov8s/yolov8s.pt"
 FALLBACK_MODEL_PATH = "models/yolov8l/yolov8l_dataset_moinhat_lan2.pt"
 
+# Cascade 2 model: yolov8s chạy mọi frame, yolov8l chỉ chạy lại khi cần
+DETECTOR_CASCADE = True
+DETECTION_CONF = 0.25              # Ngưỡng confidence của YOLO
+CASCADE_LOW_CONF = 0.5             # Box có confidence thấp hơn -> chạy lại bằng model nặng
+CASCADE_CONFLICT_IOU = 0.3         # 2 box chồng lấn IoU lớn hơn -> xung đột, chạy lại
+CASCADE_ON_EMPTY = False           # Chạy lại bằng model nặng khi model nhẹ không thấy biển số (phần lớn frame
+                                   # của camera không có xe -> bật sẽ mất gần hết lợi ích về tốc độ)
+CASCADE_REGION_PADDING = 0.25      # Nới rộng vùng (theo tỉ lệ bbox) khi chạy lại cho 1 vùng
+
 # Thư mục lưu lịch sử
 HISTORY_DIR = "history"
 HISTORY_CSV_FILE = "history.csv"
 
+# Mức lưu History (HistoryLogger), tăng dần theo dung lượng ghi:
+# 'none'    = không ghi gì
+# 'text'    = chỉ ghi dòng CSV (biển số, loại xe, đường dẫn ảnh nguồn)
+# 'roi'     = CSV + ảnh gốc + ảnh ROI từng biển số
+# 'debug'   = thêm ảnh toàn cảnh đã vẽ, ảnh tiền xử lý và mọi biến thể đã thử
+# 'sampled' = 'roi', riêng ảnh được lấy mẫu hoặc đọc với độ tin cậy thấp thì lưu như 'debug'
+HISTORY_PERSIST_LEVEL = 'debug'       # GUI / server: lưu đầy đủ như trước
+HISTORY_BATCH_PERSIST_LEVEL = 'roi'   # Mặc định --persist của run_batch.py / watch_folder.py (khối lượng lớn)
+HISTORY_DEBUG_SAMPLE_RATE = 0.01      # 'sampled': tỉ lệ ảnh lưu đủ debug (theo hash đường dẫn, chạy lại cho cùng kết quả)
+HISTORY_DEBUG_MIN_CONFIDENCE = 0.5    # 'sampled': biển số có confidence thấp hơn -> lưu đủ debug
+# Ảnh gốc đã có trên đĩa: 'link' = hard link (fallback copy nếu khác ổ đĩa), 'copy' = copy nguyên file,
+# 'reference' = không ghi, CSV trỏ thẳng về file nguồn. Ảnh không có file nguồn (upload) luôn được ghi JPEG.
+HISTORY_ORIGINAL_MODE = 'link'
+# Cách lưu ảnh History: 'files' = mỗi ảnh 1 thư mục nhiều file JPEG (mặc định),
+# 'pack' = gói ảnh vào file .pack chỉ ghi thêm + chỉ mục .idx trong {HISTORY_DIR}/packs/
+# (ít file/inode, sao lưu và xóa nhanh trên ổ mạng; giải nén bằng unpack_history.py)
+HISTORY_STORAGE = 'files'
+HISTORY_PACK_ROTATE = 'batch'     # 'batch' = mỗi lần chạy/batch 1 gói, 'hour' = mỗi giờ 1 gói
+HISTORY_PACK_DIR = "packs"
+
+# Tìm kiếm gần đúng trong lịch sử (search_history.py)
+# Khoảng cách: sai 1 ký tự = 1, nhầm cặp ký tự OCR hay nhầm (8/B, 0/D, 5/S, ...) = 0.5
+SEARCH_MAX_DISTANCE = 1.0
+SEARCH_LIMIT = 20
+SEARCH_CACHE_FILE = os.path.join(HISTORY_DIR, "search_index.pkl")
+SEARCH_BENCHMARK_BUDGET_MS = 5.0   # benchmark_search.py: p99 tối đa (ms) ở SEARCH_MAX_DISTANCE với 1 triệu biển số
+
+# Danh sách theo dõi (watchlist): CSV "biển số,danh sách,ghi chú"
+WATCHLIST_FILE = "watchlist.csv"
+WATCHLIST_EVENTS_FILE = os.path.join(HISTORY_DIR, "watchlist_events.jsonl")
+# Khớp gần đúng khi OCR nhầm cặp ký tự hay nhầm (mỗi cặp = 0.5), 0 = chỉ khớp chính xác
+WATCHLIST_MAX_DISTANCE = 1.0
+# Chu kỳ kiểm tra file danh sách thay đổi để nạp lại (giây)
+WATCHLIST_RELOAD_INTERVAL = 2.0
+
+# Gộp lần đọc lặp lại (sightings.py): cùng nguồn + cùng biển số, cách nhau <= SIGHTING_WINDOW giây
+SIGHTING_WINDOW = 10.0
+# Số sự kiện mở tối đa (vượt quá -> ghi sự kiện cũ nhất)
+SIGHTING_MAX_OPEN = 256
+SIGHTING_EVENTS_FILE = "sightings.jsonl"
+
+# Kết quả thô của OCR cho rescore_history.py (ghi khi chạy với --record-raw)
+RAW_OCR_DIR = os.path.join(HISTORY_DIR, "raw_ocr")
+# Số bản ghi mỗi lần gửi cho 1 process khi chạy lại
+RESCORE_CHUNK_SIZE = 5000
+
+# Xuất History dạng cột cho phân tích (columnar.py, export_history.py), chia thư mục theo ngày
+EXPORT_DIR = os.path.join(HISTORY_DIR, "columnar")
+EXPORT_FORMAT = 'parquet'          # 'parquet' hoặc 'arrow' (Arrow IPC)
+EXPORT_BATCH_ROWS = 65536          # Số dòng mỗi row group / record batch khi xuất history.csv
+# Ghi liên tục (run_batch.py / watch_folder.py --export): thư mục riêng (cùng ảnh không bị đếm 2 lần với bản xuất CSV),
+# ghi 1 file mới khi đủ EXPORT_FLUSH_ROWS dòng hoặc sau EXPORT_FLUSH_SECONDS giây
+EXPORT_LIVE_DIR = os.path.join(HISTORY_DIR, "columnar_live")
+EXPORT_FLUSH_ROWS = 5000
+EXPORT_FLUSH_SECONDS = 60.0
+
 # --- OCR SETTINGS ---
 OCR_LANGUAGES = ['en']
 OCR_GPU = False
 
+# Giải mã có ràng buộc ngữ pháp biển số (dùng xác suất ký tự của recognizer)
+GRAMMAR_DECODING = True
+GRAMMAR_BEAM_WIDTH = 10
+GRAMMAR_MIN_CHAR_PROB = 1e-3
+
+# Tách dòng bằng projection profile (bỏ qua bước text detection CRAFT của EasyOCR)
+LINE_SPLIT_FAST_PATH = True
+LINE_SPLIT_MIN_INK = 0.08          # Tỉ lệ điểm chữ tối thiểu của 1 hàng để coi là có chữ
+LINE_SPLIT_BORDER_INK = 0.85       # Hàng có tỉ lệ điểm chữ cao hơn -> viền biển số, bỏ qua
+LINE_SPLIT_MIN_LINE_RATIO = 0.2    # Chiều cao tối thiểu của 1 dòng (so với chiều cao ROI)
+LINE_SPLIT_MAX_HEIGHT_RATIO = 2.0  # Tỉ lệ chiều cao tối đa giữa 2 dòng
+LINE_SPLIT_MARGIN = 3              # Số pixel nới rộng trên/dưới mỗi dòng
+
 # --- PREPROCESSING SETTINGS ---
 # CLAHE
 CLAHE_CLIP_LIMIT = 2.0
@@ -30,10 +108,111 @@ UPSCALE_SCALE = 2
 # Warping
 WARP_PADDING = 20
 
+# Cổng ước lượng độ nghiêng: chỉ chạy chuỗi warping khi biển số thực sự bị méo
+WARP_SKEW_GATE = True
+WARP_SKEW_THRESHOLD_DEG = 3.0         # Góc nghiêng tối thiểu (độ) để warping
+WARP_PERSPECTIVE_THRESHOLD = 0.08     # Độ méo phối cảnh tối thiểu (1 - area contour / area minAreaRect)
+WARP_DOMINANT_CONTOUR_RATIO = 0.3     # Contour chính phải chiếm ít nhất tỉ lệ này của ROI
+
+# Chuẩn hóa kích thước ROI trước OCR (size buckets)
+# ROI được resize (giữ tỉ lệ) về chiều cao chuẩn gần nhất, chiều rộng
+# được pad lên bội số của OCR_WIDTH_STEP -> số lượng shape nhỏ, gom batch được
+OCR_NORMALIZE_ROI = True
+OCR_HEIGHT_BUCKETS = (64, 96, 128, 160)
+OCR_WIDTH_STEP = 32
+OCR_MAX_ASPECT_RATIO = 8.0            # Rộng tối đa = chiều cao chuẩn x tỉ lệ này (ROI dài hơn: thu nhỏ + pad chiều cao)
+
 # Adaptive Threshold
 ADAPTIVE_THRESH_BLOCK_SIZE = 19
 ADAPTIVE_THRESH_C = 9
 
+# --- PIPELINE SETTINGS ---
+# Số worker cho từng giai đoạn. Detect/OCR dùng chung 1 model nên để 1 worker;
+# decode và persist là I/O nên có thể chạy song song nhiều worker.
+PIPELINE_WORKERS = {
+    'decode': 2,
+    'detect': 1,
+    'ocr': 1,
+    'render': 1,
+    'persist': 2,
+}
+PIPELINE_QUEUE_SIZE = 8  # Kích thước tối đa của queue giữa các giai đoạn
+
+# Decode: ảnh cho detector được giải mã giảm độ phân giải (YOLO chỉ dùng 640px),
+# ROI biển số được cắt lại từ ảnh gốc full-resolution
+DECODE_MAX_SIDE = 1280
+
+# Mức giữ ảnh trung gian trong kết quả (được giải phóng ngay sau khi ghi History):
+# 'none' = chỉ text/bbox/điểm, 'roi' = thêm ảnh ROI + ảnh tiền xử lý được chọn,
+# 'debug' = thêm mọi biến thể tiền xử lý đã thử (tốn RAM với ảnh nhiều biển số)
+# Mặc định theo HISTORY_PERSIST_LEVEL: chỉ giữ những ảnh History sẽ ghi
+if HISTORY_PERSIST_LEVEL in ('debug', 'sampled'):
+    RESULT_RETENTION = 'debug'
+elif HISTORY_PERSIST_LEVEL == 'roi':
+    RESULT_RETENTION = 'roi'
+else:
+    RESULT_RETENTION = 'none'
+
+# --- STARTUP SETTINGS ---
+# Model được load trong thread nền, sau đó chạy thử (warm-up) 1 lần trên ảnh giả
+# để ảnh thật đầu tiên không phải chịu chi phí khởi tạo kernel / cấp phát bộ nhớ
+MODEL_WARMUP = True
+WARMUP_IMAGE_SIZE = 640
+
+# Cache model đã biên dịch (TorchScript cho YOLO, module EasyOCR lưu sẵn)
+# Tạo bằng: python compile_models.py. Khóa theo hash model + phiên bản thư viện.
+USE_MODEL_CACHE = True
+MODEL_CACHE_DIR = "models/cache"
+
+# --- SERVER SETTINGS ---
+# Server HTTP nội bộ (server.py): request đồng thời được gom thành micro-batch
+SERVER_HOST = "127.0.0.1"
+SERVER_PORT = 8080
+SERVER_MAX_UPLOAD_MB = 20
+BATCH_MAX_SIZE = 8         # Số ảnh tối đa trong 1 batch
+BATCH_MAX_WAIT_MS = 15     # Thời gian gom batch tối đa kể từ request đầu tiên
+
+# --- METRICS SETTINGS ---
+# metrics.py: text Prometheus ở /metrics (server.py, hoặc --metrics-port) / ghi file định kỳ (--metrics-file)
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9108
+METRICS_DUMP_INTERVAL = 15.0       # Chu kỳ ghi file metrics (giây)
+# Bucket (giây) của histogram thời gian xử lý
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# --- DIAGNOSTICS SETTINGS ---
+# diagnostics.py: log theo mức, tracing (Chrome trace-event JSON), sampling profiler (folded stacks)
+LOG_LEVEL = 'INFO'                 # 'DEBUG' = in chi tiết từng ảnh / biển số (detect, early exit, các ứng viên)
+TRACE_DIR = os.path.join(HISTORY_DIR, "traces")
+TRACE_MAX_EVENTS = 1_000_000       # Số span tối đa giữ trong RAM (bộ đệm vòng, ~200 byte/span)
+PROFILE_INTERVAL = 0.005           # Chu kỳ lấy mẫu stack của profiler (giây)
+
+# --- WATCH FOLDER SETTINGS ---
+# watch_folder.py: theo dõi thư mục camera đổ ảnh vào và xử lý ảnh mới
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+WATCH_POLL_INTERVAL = 2.0          # Chu kỳ quét (giây) khi không dùng được inotify
+WATCH_STABLE_SECONDS = 1.0         # File không đổi trong khoảng này mới coi là đã ghi xong
+WATCH_CURSOR_FILE = os.path.join(HISTORY_DIR, "watch_cursor.json")
+WATCH_PROCESSED_MAX = 100_000      # Số file (đường dẫn + mtime) đã xử lý nhớ trong phiên, tránh xử lý lại khi có sự kiện lặp
+
+# --- JOB MANIFEST SETTINGS ---
+# run_batch.py --manifest: nhật ký JSONL để chạy tiếp batch bị dừng giữa chừng
+MANIFEST_MAX_RETRIES = 3       # Số lần thử tối đa cho 1 ảnh lỗi
+MANIFEST_FSYNC_EVERY = 50      # fsync nhật ký xuống đĩa sau mỗi N ảnh
+
+# --- SHARDING SETTINGS ---
+# run_batch.py --shard i/N: chia 1 job cho nhiều máy dùng chung ổ mạng (không cần điều phối)
+SHARD_OUTPUT_DIR = "shards"            # Mỗi shard ghi vào {SHARD_OUTPUT_DIR}/shard-i-of-N/
+SHARD_MANIFEST_FILE = "manifest.jsonl"  # Manifest của từng shard (và của kho đã gộp)
+
+# --- GUI SETTINGS ---
+THUMBNAIL_HEIGHT = 450          # Chiều cao thumbnail trong danh sách kết quả
+THUMBNAIL_CACHE_SIZE = 200      # Số thumbnail tối đa giữ trong RAM (LRU)
+THUMBNAIL_CACHE_DIR = None      # Thư mục cache thumbnail trên đĩa (None = thư mục tạm)
+RESULT_LIST_OVERSCAN = 2        # Số dòng dựng thêm phía trên/dưới vùng nhìn thấy
+UI_FRAME_RATE = 20              # Số lần cập nhật giao diện tối đa mỗi giây (gộp kết quả theo frame)
+UI_MAX_BATCH = 50               # Số kết quả tối đa đưa lên giao diện trong 1 frame
+
 # --- VISUALIZATION SETTINGS ---
 COLOR_DEFAULT = (0, 255, 0)      # Green
 COLOR_MOTO = (0, 255, 0)         # Green
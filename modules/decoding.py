@@ -0,0 +1,198 @@
+"""
+Module giải mã biển số có ràng buộc ngữ pháp (Grammar-constrained decoding)
+Đọc ma trận xác suất ký tự (CTC) từ recognizer và chạy beam search
+chỉ trên các chuỗi đúng ngữ pháp biển số Việt Nam (xem utils.py)
+"""
+
+import math
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from .utils import (
+    PLATE_CHARSET,
+    PLATE_LINE1_PATTERNS,
+    PLATE_PATTERNS,
+    PLATE_SERIAL_LENGTHS,
+    INVALID_CHAR_MAPPING,
+    dict_char_to_num,
+    is_plate_prefix,
+    match_plate_pattern
+)
+from .config import GRAMMAR_BEAM_WIDTH, GRAMMAR_MIN_CHAR_PROB
+
+_NEG_INF = -float('inf')
+
+
+def _logsumexp(a: float, b: float) -> float:
+    """log(exp(a) + exp(b)) ổn định số học"""
+    if a == _NEG_INF:
+        return b
+    if b == _NEG_INF:
+        return a
+    if a > b:
+        return a + math.log1p(math.exp(b - a))
+    return b + math.log1p(math.exp(a - b))
+
+
+def build_symbol_map(charset: Sequence[str]) -> np.ndarray:
+    """
+    Tạo ma trận gộp lớp của recognizer về không gian ký hiệu biển số
+
+    Cột 0 là blank CTC; các cột tiếp theo tương ứng PLATE_CHARSET.
+    Chữ thường được gộp vào chữ hoa. Chữ cái biển số không dùng (I, J, O, Q, R, W)
+    được chia đều cho số và chữ hay nhầm với nó (O -> 0 / D, I -> 1 / L, ...) để beam search
+    vẫn dùng được xác suất đó ở vị trí số lẫn vị trí chữ. Các ký tự còn lại
+    (dấu '-', '.', khoảng trắng, ...) được coi như blank để đóng vai trò phân tách.
+
+    Args:
+        charset: Danh sách ký tự của recognizer, phần tử 0 là blank
+
+    Returns:
+        Ma trận (num_classes, 1 + len(PLATE_CHARSET))
+    """
+    index = {c: i + 1 for i, c in enumerate(PLATE_CHARSET)}
+    mapping = np.zeros((len(charset), len(PLATE_CHARSET) + 1), dtype=np.float32)
+    for i, char in enumerate(charset):
+        char = char.upper()
+        if i > 0 and char in index:
+            mapping[i, index[char]] = 1.0
+            continue
+        targets = [index[t] for t in (dict_char_to_num.get(char), INVALID_CHAR_MAPPING.get(char))
+                   if i > 0 and t in index]
+        if targets:
+            mapping[i, targets] = 1.0 / len(targets)
+        else:
+            mapping[i, 0] = 1.0
+    return mapping
+
+
+def constrained_ctc_beam_search(
+    probs: np.ndarray,
+    is_valid_prefix: Callable[[str], bool],
+    is_complete: Callable[[str], bool],
+    beam_width: int = GRAMMAR_BEAM_WIDTH,
+    min_char_prob: float = GRAMMAR_MIN_CHAR_PROB
+) -> List[Tuple[str, float]]:
+    """
+    CTC prefix beam search chỉ mở rộng các tiền tố đúng ngữ pháp
+
+    Args:
+        probs: Ma trận xác suất (T, 1 + len(PLATE_CHARSET)), cột 0 là blank
+        is_valid_prefix: Hàm kiểm tra tiền tố còn hợp lệ
+        is_complete: Hàm kiểm tra chuỗi đã là một dòng/biển hoàn chỉnh
+        beam_width: Số tiền tố giữ lại mỗi bước
+        min_char_prob: Bỏ qua ký tự có xác suất thấp hơn ngưỡng tại mỗi bước
+
+    Returns:
+        List (text, log_prob) các chuỗi hoàn chỉnh, sắp xếp giảm dần theo log_prob
+    """
+    log_probs = np.log(np.clip(probs, 1e-12, 1.0))
+    # beams: prefix -> (log P kết thúc bằng blank, log P kết thúc bằng ký tự)
+    beams: Dict[str, Tuple[float, float]] = {'': (0.0, _NEG_INF)}
+
+    for t in range(log_probs.shape[0]):
+        frame = log_probs[t]
+        candidates = np.nonzero(probs[t, 1:] >= min_char_prob)[0] + 1
+        next_beams: Dict[str, List[float]] = {}
+
+        def _add(prefix, p_b, p_nb):
+            entry = next_beams.setdefault(prefix, [_NEG_INF, _NEG_INF])
+            entry[0] = _logsumexp(entry[0], p_b)
+            entry[1] = _logsumexp(entry[1], p_nb)
+
+        for prefix, (p_b, p_nb) in beams.items():
+            p_total = _logsumexp(p_b, p_nb)
+            # Giữ nguyên tiền tố với blank
+            _add(prefix, p_total + frame[0], _NEG_INF)
+
+            last = prefix[-1] if prefix else None
+            for k in candidates:
+                char = PLATE_CHARSET[k - 1]
+                p_char = frame[k]
+                if char == last:
+                    # Lặp ký tự không có blank xen giữa -> gộp
+                    _add(prefix, _NEG_INF, p_nb + p_char)
+                    # Ký tự lặp thật sự (có blank xen giữa)
+                    extended = prefix + char
+                    if is_valid_prefix(extended):
+                        _add(extended, _NEG_INF, p_b + p_char)
+                else:
+                    extended = prefix + char
+                    if is_valid_prefix(extended):
+                        _add(extended, _NEG_INF, p_total + p_char)
+
+        ranked = sorted(next_beams.items(), key=lambda kv: _logsumexp(*kv[1]), reverse=True)
+        beams = {prefix: tuple(p) for prefix, p in ranked[:beam_width]}
+
+    results = [
+        (prefix, _logsumexp(p_b, p_nb))
+        for prefix, (p_b, p_nb) in beams.items()
+        if is_complete(prefix)
+    ]
+    results.sort(key=lambda item: item[1], reverse=True)
+    return results
+
+
+def _char_confidence(text: str, log_prob: float) -> float:
+    """Độ tin cậy trung bình hình học theo từng ký tự (0.0-1.0)"""
+    return float(math.exp(log_prob / max(1, len(text))))
+
+
+def decode_plate_lines(
+    line_probs: List[np.ndarray],
+    beam_width: int = GRAMMAR_BEAM_WIDTH
+) -> Optional[Tuple[List[str], float]]:
+    """
+    Giải mã biển số từ ma trận xác suất của từng dòng text
+
+    - 1 dòng: beam search trên toàn bộ ngữ pháp biển số
+    - 2 dòng: dòng 1 theo mẫu NNL/NNLN/NNLL, dòng 2 là 4-5 chữ số,
+      sau đó ghép top-k của hai dòng và kiểm tra lại toàn biển
+
+    Args:
+        line_probs: List ma trận (T, 1 + len(PLATE_CHARSET)) theo thứ tự trên -> dưới
+        beam_width: Số tiền tố giữ lại mỗi bước
+
+    Returns:
+        (các dòng đã giải mã, độ tin cậy), hoặc None nếu không có chuỗi hợp lệ
+    """
+    if not line_probs:
+        return None
+
+    if len(line_probs) == 1:
+        results = constrained_ctc_beam_search(
+            line_probs[0],
+            is_plate_prefix,
+            lambda text: match_plate_pattern(text) is not None,
+            beam_width=beam_width
+        )
+        if not results:
+            return None
+        text, log_prob = results[0]
+        return [text], _char_confidence(text, log_prob)
+
+    # Biển 2 dòng (bỏ qua các dòng thừa)
+    line1_results = constrained_ctc_beam_search(
+        line_probs[0],
+        lambda text: is_plate_prefix(text, PLATE_LINE1_PATTERNS),
+        lambda text: match_plate_pattern(text, PLATE_LINE1_PATTERNS) is not None,
+        beam_width=beam_width
+    )
+    line2_results = constrained_ctc_beam_search(
+        line_probs[1],
+        lambda text: len(text) <= max(PLATE_SERIAL_LENGTHS) and text.isdigit(),
+        lambda text: len(text) in PLATE_SERIAL_LENGTHS,
+        beam_width=beam_width
+    )
+
+    best = None
+    for line1, lp1 in line1_results:
+        for line2, lp2 in line2_results:
+            if match_plate_pattern(line1 + line2, PLATE_PATTERNS) is None:
+                continue
+            if best is None or lp1 + lp2 > best[2]:
+                best = (line1, line2, lp1 + lp2)
+
+    if best is None:
+        return None
+    line1, line2, log_prob = best
+    return [line1, line2], _char_confidence(line1 + line2, log_prob)
@@ -2,19 +2,33 @@
 Module phát hiện biển số xe sử dụng YOLO
 """
 
+import logging
+import threading
 import cv2
 import numpy as np
-from ultralytics import YOLO
 from .config import (
     MODEL_PATH, 
     FALLBACK_MODEL_PATH, 
+    DETECTOR_CASCADE,
+    DETECTION_CONF,
+    CASCADE_LOW_CONF,
+    CASCADE_CONFLICT_IOU,
+    CASCADE_ON_EMPTY,
+    CASCADE_REGION_PADDING,
     COLOR_DEFAULT, 
     COLOR_MOTO, 
     COLOR_CAR, 
     BBOX_THICKNESS,
     TEXT_FONT_SCALE,
-    TEXT_THICKNESS
+    TEXT_THICKNESS,
+    WARMUP_IMAGE_SIZE,
+    USE_MODEL_CACHE
 )
+from .model_cache import detector_artifact_path
+from .metrics import IMAGES_TOTAL, PLATES_DETECTED, CACHE_REQUESTS
+from .diagnostics import span, traced
+
+log = logging.getLogger(__name__)
 
 
 class LicensePlateDetector:
@@ -22,35 +36,111 @@ class LicensePlateDetector:
     Class phát hiện biển số xe sử dụng YOLO model
     """
     
-    def __init__(self, model_path=MODEL_PATH, fallback_model=FALLBACK_MODEL_PATH):
+    def __init__(self, model_path=MODEL_PATH, fallback_model=FALLBACK_MODEL_PATH, cascade=DETECTOR_CASCADE):
         """
         Khởi tạo detector với YOLO model
         
         Args:
             model_path: Đường dẫn đến model custom
             fallback_model: Model dự phòng nếu không load được model custom
+                            (đồng thời là model nặng trong chế độ cascade)
+            cascade: Bật chế độ cascade (model nhẹ cho mọi frame, model nặng khi cần)
         """
         self.model = None
+        self.heavy_model = None
         self.model_path = model_path
         self.fallback_model = fallback_model
+        self.cascade = cascade
+        # Cập nhật từ nhiều worker của pipeline -> giữ khóa khi cộng / đọc
+        self._stats_lock = threading.Lock()
+        self.routing_stats = self._empty_routing_stats()
         self.load_model()
     
+    @staticmethod
+    def _empty_routing_stats():
+        return {
+            'frames': 0,            # Tổng số frame đã detect
+            'light_only': 0,        # Frame chỉ cần model nhẹ
+            'heavy_frames': 0,      # Frame chạy lại bằng model nặng
+            'heavy_regions': 0,     # Vùng chạy lại bằng model nặng (OCR thất bại)
+            'low_conf': 0,          # Lý do: box confidence thấp
+            'conflict': 0,          # Lý do: box chồng lấn xung đột
+            'empty': 0,             # Lý do: model nhẹ không thấy biển số
+            'ocr_failed': 0         # Lý do: OCR không ra biển số hợp lệ
+        }
+    
+    def _count_routing(self, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self.routing_stats[key] += value
+    
+    @staticmethod
+    def _load_yolo(path):
+        """
+        Load YOLO model (import ultralytics lúc cần để khởi động nhanh)
+        
+        Nếu đã chạy compile_models.py, load bản TorchScript trong cache thay cho file .pt
+        """
+        from ultralytics import YOLO
+        if USE_MODEL_CACHE:
+            try:
+                artifact = detector_artifact_path(path)
+                CACHE_REQUESTS.inc(cache='detector_model', result='hit' if artifact is not None else 'miss')
+                if artifact is not None:
+                    model = YOLO(artifact, task='detect')
+                    print(f"✓ Load model từ cache: {artifact}")
+                    return model
+            except Exception as e:
+                print(f"⚠ Không dùng được cache model, load file gốc: {e}")
+        return YOLO(path)
+    
     def load_model(self):
         """
         Load YOLO model
         """
         try:
-            self.model = YOLO(self.model_path)
+            self.model = self._load_yolo(self.model_path)
             print(f"✓ Đã load model custom: {self.model_path}")
         except Exception as e:
             print(f"⚠ Không load được model custom: {e}")
             try:
-                self.model = YOLO(self.fallback_model)
+                self.model = self._load_yolo(self.fallback_model)
                 print(f"✓ Đã load model dự phòng: {self.fallback_model}")
+                # Model dự phòng đã là model chính -> không còn gì để cascade
+                self.cascade = False
             except Exception as e2:
                 print(f"✗ Lỗi khi load model: {e2}")
                 raise
     
+    def _get_heavy_model(self):
+        """
+        Load model nặng (lazy) cho chế độ cascade
+        
+        Returns:
+            YOLO model, hoặc None nếu không load được (cascade sẽ bị tắt)
+        """
+        if self.heavy_model is None and self.cascade:
+            try:
+                self.heavy_model = self._load_yolo(self.fallback_model)
+                print(f"✓ Đã load model cascade: {self.fallback_model}")
+            except Exception as e:
+                print(f"⚠ Không load được model cascade, tắt cascade: {e}")
+                self.cascade = False
+        return self.heavy_model
+    
+    def warmup(self, size=WARMUP_IMAGE_SIZE):
+        """
+        Chạy thử 1 lần trên ảnh giả để khởi tạo kernel / cấp phát bộ nhớ trước,
+        ảnh thật đầu tiên không phải chịu chi phí này. Không tính vào routing_stats.
+        Chỉ warm-up model nhẹ: model cascade vẫn load lười ở lần escalate đầu tiên.
+        
+        Args:
+            size: Kích thước cạnh ảnh giả
+        """
+        if self.model is not None:
+            dummy = np.zeros((size, size, 3), dtype=np.uint8)
+            self.model(dummy, verbose=False)
+    
     def _preprocess_image(self, image):
         """
         Chuyển đổi ảnh sang định dạng numpy RGB chuẩn
@@ -70,6 +160,7 @@ class LicensePlateDetector:
             
         return image_np
 
+    @traced('detect.yolo')
     def detect(self, image, image_index=None):
         """
         Phát hiện biển số trong ảnh
@@ -89,33 +180,84 @@ class LicensePlateDetector:
         # Thực hiện detection với verbose=False để tắt output tự động
         # Thêm conf=0.25 để lọc các box có độ tin cậy thấp
         # Thêm classes=[0] để chỉ nhận diện class 0 (biển số)
-        results = self.model(image_np, conf=0.25, classes=[0], verbose=False)
+        results = self.model(image_np, conf=DETECTION_CONF, classes=[0], verbose=False)
         
         # In thông tin detection với STT tùy chỉnh
         if results and len(results) > 0:
-            result = results[0]  # Lấy kết quả đầu tiên
-            if hasattr(result, 'boxes') and result.boxes is not None:
-                num_detections = len(result.boxes)
-                orig_height, orig_width = image_np.shape[:2]
-                
-                # Lấy kích thước inference từ model (thường là 640x640 cho YOLOv8)
-                model_imgsz = getattr(self.model, 'imgsz', 640)
-                if isinstance(model_imgsz, (list, tuple)):
-                    yolo_size = f"{model_imgsz[0]}x{model_imgsz[1]}" if len(model_imgsz) > 1 else f"{model_imgsz[0]}x{model_imgsz[0]}"
-                else:
-                    yolo_size = f"{model_imgsz}x{model_imgsz}"
-                
-                if image_index is not None:
-                    print(f"{image_index}: {orig_width}x{orig_height} (resized to: {yolo_size}) {num_detections} bien_so")
-                else:
-                    print(f"0: {orig_width}x{orig_height} (resized to: {yolo_size}) {num_detections} bien_so")
+            self._print_detection(image_np, results[0], image_index)  # Lấy kết quả đầu tiên
         
         return results
     
+    def _print_detection(self, image_np, result, image_index=None):
+        """
+        Log (mức DEBUG) số biển số phát hiện được của 1 ảnh
+        """
+        if not log.isEnabledFor(logging.DEBUG):
+            return
+        if hasattr(result, 'boxes') and result.boxes is not None:
+            num_detections = len(result.boxes)
+            orig_height, orig_width = image_np.shape[:2]
+            
+            # Lấy kích thước inference từ model (thường là 640x640 cho YOLOv8)
+            model_imgsz = getattr(self.model, 'imgsz', 640)
+            if isinstance(model_imgsz, (list, tuple)):
+                yolo_size = f"{model_imgsz[0]}x{model_imgsz[1]}" if len(model_imgsz) > 1 else f"{model_imgsz[0]}x{model_imgsz[0]}"
+            else:
+                yolo_size = f"{model_imgsz}x{model_imgsz}"
+            
+            log.debug("%s: %dx%d (resized to: %s) %d bien_so", image_index if image_index is not None else 0,
+                      orig_width, orig_height, yolo_size, num_detections)
+    
+    def _extract_boxes(self, results):
+        """
+        Lấy danh sách (bbox, confidence) từ kết quả YOLO
+        """
+        boxes = []
+        for result in results:
+            if result.boxes is None:
+                continue
+            for box in result.boxes:
+                x1, y1, x2, y2 = map(int, box.xyxy[0])
+                boxes.append(((x1, y1, x2, y2), float(box.conf[0])))
+        return boxes
+    
+    @staticmethod
+    def _iou(box_a, box_b):
+        """
+        Tính IoU giữa 2 bbox (x1, y1, x2, y2)
+        """
+        ix1, iy1 = max(box_a[0], box_b[0]), max(box_a[1], box_b[1])
+        ix2, iy2 = min(box_a[2], box_b[2]), min(box_a[3], box_b[3])
+        inter = max(0, ix2 - ix1) * max(0, iy2 - iy1)
+        area_a = (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+        area_b = (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+        union = area_a + area_b - inter
+        return inter / union if union > 0 else 0.0
+    
+    def _escalation_reason(self, boxes):
+        """
+        Quyết định có cần chạy lại frame bằng model nặng hay không
+        
+        Returns:
+            Tên lý do ('empty', 'low_conf', 'conflict') hoặc None
+        """
+        if not boxes:
+            return 'empty' if CASCADE_ON_EMPTY else None
+        if any(conf < CASCADE_LOW_CONF for _, conf in boxes):
+            return 'low_conf'
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                if self._iou(boxes[i][0], boxes[j][0]) > CASCADE_CONFLICT_IOU:
+                    return 'conflict'
+        return None
+    
     def get_plate_regions(self, image, image_index=None):
         """
         Lấy các vùng ROI (Region of Interest) của biển số
         
+        Trong chế độ cascade, frame có box confidence thấp, box xung đột
+        hoặc không có box sẽ được chạy lại bằng model nặng.
+        
         Args:
             image: Ảnh đầu vào (PIL Image hoặc numpy array)
             image_index: Số thứ tự ảnh (optional)
@@ -125,20 +267,123 @@ class LicensePlateDetector:
                 - roi: Ảnh vùng biển số (numpy array)
                 - bbox: Tọa độ bounding box (x1, y1, x2, y2)
         """
-        image_np = self._preprocess_image(image)
+        return self.get_plate_regions_batch([image], [image_index])[0]
+    
+    def get_plate_regions_batch(self, images, image_indices=None):
+        """
+        Lấy vùng ROI biển số cho nhiều ảnh với 1 lần gọi model (batch inference)
         
-        results = self.detect(image_np, image_index=image_index)
-        plate_regions = []
+        Các frame cần cascade cũng được chạy lại bằng model nặng trong 1 lần gọi.
         
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                x1, y1, x2, y2 = map(int, box.xyxy[0])
+        Args:
+            images: List ảnh (PIL Image hoặc numpy array)
+            image_indices: List số thứ tự ảnh (optional)
+            
+        Returns:
+            List (theo thứ tự images) các list (roi, bbox) như get_plate_regions
+        """
+        if self.model is None:
+            raise RuntimeError("Model chưa được load!")
+        if not images:
+            return []
+        images_np = [self._preprocess_image(image) for image in images]
+        if image_indices is None:
+            image_indices = [None] * len(images_np)
+        
+        with span('detect.yolo', images=len(images_np)):
+            results = self.model(images_np, conf=DETECTION_CONF, classes=[0], verbose=False)
+        boxes_per_image = []
+        for image_np, result, image_index in zip(images_np, results, image_indices):
+            self._print_detection(image_np, result, image_index)
+            boxes_per_image.append(self._extract_boxes([result]))
+        reasons = [self._escalation_reason(boxes) if self.cascade else None for boxes in boxes_per_image]
+        escalated = [i for i, reason in enumerate(reasons) if reason]
+        heavy_model = self._get_heavy_model() if escalated else None
+        if heavy_model is not None:
+            with span('detect.cascade', images=len(escalated)):
+                heavy_results = heavy_model([images_np[i] for i in escalated], conf=DETECTION_CONF, classes=[0], verbose=False)
+            for i, heavy_result in zip(escalated, heavy_results):
+                self._count_routing(heavy_frames=1, **{reasons[i]: 1})
+                heavy_boxes = self._extract_boxes([heavy_result])
+                log.debug("🔁 Cascade (%s): yolov8s %d -> model nặng %d bien_so",
+                          reasons[i], len(boxes_per_image[i]), len(heavy_boxes))
+                # Giữ kết quả model nhẹ nếu model nặng cũng không thấy gì
+                if heavy_boxes:
+                    boxes_per_image[i] = heavy_boxes
+        self._count_routing(frames=len(images_np),
+                            light_only=len(images_np) - (len(escalated) if heavy_model is not None else 0))
+        
+        all_regions = []
+        for image_np, boxes in zip(images_np, boxes_per_image):
+            plate_regions = []
+            for bbox, _ in boxes:
+                x1, y1, x2, y2 = bbox
                 roi = image_np[y1:y2, x1:x2]
-                bbox = (x1, y1, x2, y2)
                 plate_regions.append((roi, bbox))
+            all_regions.append(plate_regions)
+        IMAGES_TOTAL.inc(len(images_np))
+        PLATES_DETECTED.inc(sum(len(regions) for regions in all_regions))
+        
+        return all_regions
+    
+    def refine_region(self, image, bbox):
+        """
+        Chạy lại model nặng trên vùng quanh bbox (dùng khi OCR thất bại)
         
-        return plate_regions
+        Args:
+            image: Ảnh đầu vào (PIL Image hoặc numpy array)
+            bbox: Bounding box ban đầu (x1, y1, x2, y2)
+            
+        Returns:
+            Tuple (roi, bbox) mới theo tọa độ ảnh gốc, hoặc None nếu không tìm thấy
+        """
+        if not self.cascade:
+            return None
+        heavy_model = self._get_heavy_model()
+        if heavy_model is None:
+            return None
+        
+        image_np = self._preprocess_image(image)
+        img_h, img_w = image_np.shape[:2]
+        x1, y1, x2, y2 = bbox
+        pad_x = int((x2 - x1) * CASCADE_REGION_PADDING)
+        pad_y = int((y2 - y1) * CASCADE_REGION_PADDING)
+        cx1, cy1 = max(0, x1 - pad_x), max(0, y1 - pad_y)
+        cx2, cy2 = min(img_w, x2 + pad_x), min(img_h, y2 + pad_y)
+        crop = image_np[cy1:cy2, cx1:cx2]
+        
+        self._count_routing(heavy_regions=1, ocr_failed=1)
+        
+        boxes = self._extract_boxes(heavy_model(crop, conf=DETECTION_CONF, classes=[0], verbose=False))
+        if not boxes:
+            return None
+        
+        (bx1, by1, bx2, by2), _ = max(boxes, key=lambda item: item[1])
+        new_bbox = (bx1 + cx1, by1 + cy1, bx2 + cx1, by2 + cy1)
+        roi = image_np[new_bbox[1]:new_bbox[3], new_bbox[0]:new_bbox[2]]
+        return roi, new_bbox
+    
+    def get_routing_stats(self, reset=False):
+        """
+        Thống kê định tuyến của cascade
+        
+        Args:
+            reset: Đưa bộ đếm về 0 sau khi lấy (thống kê theo từng batch)
+            
+        Returns:
+            Dict thống kê (bản sao) kèm tỉ lệ frame phải chạy model nặng
+        """
+        with self._stats_lock:
+            stats = dict(self.routing_stats)
+            if reset:
+                self.routing_stats = self._empty_routing_stats()
+        frames = stats['frames']
+        stats['heavy_rate'] = stats['heavy_frames'] / frames if frames else 0.0
+        return stats
+    
+    def reset_routing_stats(self):
+        """Đưa bộ đếm định tuyến về 0"""
+        self.get_routing_stats(reset=True)
     
     def draw_detections(self, image, detections, color=COLOR_DEFAULT, thickness=BBOX_THICKNESS):
         """
@@ -146,7 +391,7 @@ class LicensePlateDetector:
         
         Args:
             image: Ảnh đầu vào (numpy array)
-            detections: List các detection (bbox, text, vehicle_type)
+            detections: List PlateResult (bbox, text, vehicle_type)
             color: Màu của bounding box
             thickness: Độ dày của bounding box
             
@@ -157,9 +402,9 @@ class LicensePlateDetector:
         num_detections = len(detections)
         
         for i, detection in enumerate(detections):
-            bbox = detection['bbox']
-            text = detection.get('text', '')
-            vehicle_type = detection.get('vehicle_type', '')
+            bbox = detection.bbox
+            text = detection.text
+            vehicle_type = detection.vehicle_type
             
             x1, y1, x2, y2 = bbox
             
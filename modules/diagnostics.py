@@ -0,0 +1,353 @@
+"""
+Module chẩn đoán hiệu năng: tracing, sampling profiler, log theo mức
+- Tracing: span quanh detect, từng chiến lược warping, từng lần gọi EasyOCR, ghi History, từng giai đoạn pipeline.
+  Xuất JSON trace-event của Chrome (mở bằng chrome://tracing hoặc https://ui.perfetto.dev)
+  -> thấy ngay ảnh chậm gấp 10 lần là do warping, biến thể OCR nào hay do ghi History
+- Sampling profiler: thread nền lấy stack mọi thread theo chu kỳ, ghi dạng "folded stacks"
+  (flamegraph.pl, speedscope) cho từng batch
+- Cả 2 bật/tắt được lúc đang chạy (Diagnostics, tín hiệu SIGUSR1 / SIGUSR2). Khi tắt, mỗi span chỉ tốn 1 lần
+  kiểm tra cờ
+- Log theo mức: các module dùng logging.getLogger(__name__), setup_logging() in ra stdout như print().
+  Log chi tiết từng ảnh / biển số ở mức DEBUG, mặc định tắt (không format chuỗi)
+"""
+
+import functools
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+from .config import LOG_LEVEL, TRACE_DIR, TRACE_MAX_EVENTS, PROFILE_INTERVAL
+
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+# Logger gốc của package (modules.ocr, modules.detection, ... là logger con)
+_PACKAGE_LOGGER = __name__.rpartition('.')[0]
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger cho script chạy trực tiếp (run_batch, GUI, ...), dùng chung cấu hình setup_logging"""
+    return logging.getLogger(f"{_PACKAGE_LOGGER}.{name}")
+
+
+def setup_logging(level: str = LOG_LEVEL):
+    """
+    In log của package ra stdout (chỉ nội dung, giống print)
+
+    Args:
+        level: 'DEBUG' / 'INFO' / 'WARNING' / 'ERROR'
+    """
+    logger = logging.getLogger(_PACKAGE_LOGGER)
+    logger.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+    if not any(getattr(handler, '_lpr_console', False) for handler in logger.handlers):
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        handler._lpr_console = True
+        logger.addHandler(handler)
+    logger.propagate = False
+
+
+# ---------------------------------------------------------------------------
+# Tracing (Chrome trace-event)
+# ---------------------------------------------------------------------------
+
+_NOOP = nullcontext()
+
+
+class _Span:
+    __slots__ = ('tracer', 'name', 'cat', 'args', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, cat: str, args: Optional[Dict[str, Any]]):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        self.tracer._complete(self.name, self.cat, self.start, end, self.args, exc_type)
+        return False
+
+
+class Tracer:
+    """
+    Ghi span dạng trace-event "X" (complete event) vào bộ đệm vòng trong RAM
+
+    Ví dụ:
+        TRACER.start()
+        with TRACER.span("ocr.variant", method="gray"):
+            ...
+        TRACER.save("trace.json")
+    """
+
+    def __init__(self, max_events: int = TRACE_MAX_EVENTS):
+        self.enabled = False
+        self._events = deque(maxlen=max_events)
+        self._origin = time.perf_counter_ns()
+        self._threads: Dict[int, str] = {}
+
+    def start(self):
+        """Bắt đầu ghi (xóa các span cũ)"""
+        self._events.clear()
+        self._threads.clear()
+        self._origin = time.perf_counter_ns()
+        self.enabled = True
+
+    def stop(self):
+        self.enabled = False
+
+    def span(self, name: str, cat: str = 'lpr', **args):
+        """Context manager đo 1 đoạn code (tắt tracing -> không làm gì)"""
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name, cat, args or None)
+
+    def _complete(self, name: str, cat: str, start: int, end: int, args: Optional[Dict[str, Any]], exc_type):
+        thread = threading.current_thread()
+        tid = thread.ident or 0
+        if tid not in self._threads:
+            self._threads[tid] = thread.name
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'pid': os.getpid(), 'tid': tid,
+                 'ts': (start - self._origin) / 1000.0, 'dur': (end - start) / 1000.0}
+        if args or exc_type is not None:
+            event['args'] = dict(args or {})
+            if exc_type is not None:
+                event['args']['error'] = exc_type.__name__
+        # deque.append an toàn giữa các thread
+        self._events.append(event)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def save(self, path: str) -> int:
+        """
+        Ghi file JSON trace-event
+
+        Returns:
+            Số span đã ghi
+        """
+        events = list(self._events)
+        pid = os.getpid()
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                    for tid, name in list(self._threads.items())]
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return len(events)
+
+
+TRACER = Tracer()
+
+
+def span(name: str, cat: str = 'lpr', **args):
+    """Span trên TRACER mặc định"""
+    if not TRACER.enabled:
+        return _NOOP
+    return _Span(TRACER, name, cat, args or None)
+
+
+def traced(name: Optional[str] = None, cat: str = 'lpr'):
+    """Decorator: mỗi lần gọi hàm là 1 span (kiểm tra cờ lúc gọi, bật/tắt được khi đang chạy)"""
+    def decorate(func: Callable):
+        label = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            with _Span(TRACER, label, cat, None):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# ---------------------------------------------------------------------------
+# Sampling profiler (folded stacks)
+# ---------------------------------------------------------------------------
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(';', ':').replace(' ', '_')
+
+
+class SamplingProfiler:
+    """
+    Lấy mẫu stack mọi thread (sys._current_frames) mỗi interval giây, đếm theo stack
+
+    Kết quả dạng folded ("thread;file:hàm;file:hàm số_mẫu" mỗi dòng):
+        flamegraph.pl profile.folded > profile.svg    hoặc kéo file vào https://www.speedscope.app
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stacks.clear()
+        self.samples = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="sampling-profiler")
+        self._thread.start()
+
+    def _loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)).replace(';', ':').replace(' ', '_'))
+                self._stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def save(self, path: str) -> int:
+        """
+        Ghi file folded stacks
+
+        Returns:
+            Số lần lấy mẫu
+        """
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self._stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return self.samples
+
+
+# ---------------------------------------------------------------------------
+# Bật/tắt lúc chạy, ghi file theo batch
+# ---------------------------------------------------------------------------
+
+class Diagnostics:
+    """
+    Điều khiển tracing + profiler cho 1 chương trình
+
+    - trace / profile: chế độ đang bật (đổi được lúc chạy bằng toggle_* hoặc tín hiệu)
+    - begin_batch / end_batch: mỗi batch 1 file {directory}/{tên}.trace.json và {tên}.folded
+    - Tắt 1 chế độ giữa batch -> ghi ngay phần đã thu được
+
+    Ví dụ:
+        diagnostics = Diagnostics(trace=True)
+        diagnostics.install_signals()       # kill -USR1 <pid>: bật/tắt tracing, -USR2: profiler
+        diagnostics.begin_batch("batch1")
+        pipeline.run(file_paths)
+        diagnostics.end_batch()
+    """
+
+    def __init__(self, directory: str = TRACE_DIR, trace: bool = False, profile: bool = False,
+                 interval: float = PROFILE_INTERVAL, tracer: Tracer = TRACER):
+        self.directory = directory
+        self.trace = trace
+        self.profile = profile
+        self.tracer = tracer
+        self.profiler = SamplingProfiler(interval)
+        self._batch: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _name(self) -> str:
+        return self._batch or datetime.now().strftime("%Y%m%d_%H%M%S")
+
+    def begin_batch(self, name: Optional[str] = None):
+        """Bắt đầu thu cho 1 batch (theo các chế độ đang bật)"""
+        with self._lock:
+            self._batch = name or datetime.now().strftime("%Y%m%d_%H%M%S")
+            if self.trace:
+                self.tracer.start()
+            if self.profile:
+                # Bỏ các mẫu thu trước batch (vd. bật profiler lúc đang rảnh)
+                self.profiler.stop()
+                self.profiler.start()
+
+    def end_batch(self):
+        """Dừng thu và ghi file của batch"""
+        with self._lock:
+            self._flush_trace()
+            self._flush_profile()
+            self._batch = None
+
+    def _flush_trace(self):
+        if not self.tracer.enabled:
+            return
+        self.tracer.stop()
+        path = os.path.join(self.directory, f"{self._name()}.trace.json")
+        count = self.tracer.save(path)
+        print(f"🧭 Trace: {count} span -> {path}")
+
+    def _flush_profile(self):
+        if not self.profiler.running:
+            return
+        self.profiler.stop()
+        path = os.path.join(self.directory, f"{self._name()}.folded")
+        samples = self.profiler.save(path)
+        print(f"🔥 Profile: {samples} mẫu -> {path}")
+
+    def toggle_trace(self):
+        """Bật/tắt tracing (tắt -> ghi file ngay)"""
+        with self._lock:
+            self.trace = not self.trace
+            if self.trace:
+                self.tracer.start()
+            else:
+                self._flush_trace()
+        print(f"🧭 Tracing: {'bật' if self.trace else 'tắt'}")
+
+    def toggle_profile(self):
+        """Bật/tắt sampling profiler (tắt -> ghi file ngay)"""
+        with self._lock:
+            self.profile = not self.profile
+            if self.profile:
+                self.profiler.start()
+            else:
+                self._flush_profile()
+        print(f"🔥 Profiler: {'bật' if self.profile else 'tắt'}")
+
+    def install_signals(self) -> bool:
+        """
+        SIGUSR1 bật/tắt tracing, SIGUSR2 bật/tắt profiler (không có trên Windows)
+
+        Returns:
+            True nếu đã cài được
+        """
+        if not hasattr(signal, 'SIGUSR1') or threading.current_thread() is not threading.main_thread():
+            return False
+        # Handler chạy trên main thread giữa 2 bytecode -> ghi file trong thread riêng
+        signal.signal(signal.SIGUSR1, lambda *_: threading.Thread(target=self.toggle_trace, daemon=True).start())
+        signal.signal(signal.SIGUSR2, lambda *_: threading.Thread(target=self.toggle_profile, daemon=True).start())
+        print(f"🩺 kill -USR1 {os.getpid()}: bật/tắt tracing, kill -USR2 {os.getpid()}: bật/tắt profiler "
+              f"(ghi vào {self.directory})")
+        return True
@@ -0,0 +1,117 @@
+"""
+Module load model trong thread nền
+- Giao diện hiện ngay, detector + OCR được khởi tạo song song phía sau
+- Warm-up 1 lần trên ảnh giả sau khi load
+- Trạng thái sẵn sàng (loading / ready / error) và callback khi xong
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+from .config import MODEL_WARMUP
+
+STATE_IDLE = 'idle'
+STATE_LOADING = 'loading'
+STATE_READY = 'ready'
+STATE_ERROR = 'error'
+
+
+class ModelLoader:
+    """
+    Load LicensePlateDetector và LicensePlateOCR trong thread nền
+
+    Ví dụ:
+        loader = ModelLoader(on_ready=lambda l: print(l.detector, l.ocr))
+        loader.start()
+        ...
+        loader.wait()
+    """
+
+    def __init__(self, on_ready: Optional[Callable[['ModelLoader'], None]] = None,
+                 on_error: Optional[Callable[['ModelLoader', Exception], None]] = None,
+                 warmup: bool = MODEL_WARMUP):
+        """
+        Args:
+            on_ready: Gọi (trên thread nền) khi model đã sẵn sàng
+            on_error: Gọi (trên thread nền) khi load model thất bại
+            warmup: Chạy thử model trên ảnh giả sau khi load
+        """
+        self.detector = None
+        self.ocr = None
+        self.state = STATE_IDLE
+        self.error: Optional[Exception] = None
+        self.timings = {}
+        self.warmup = warmup
+        self._on_ready = on_ready
+        self._on_error = on_error
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == STATE_READY
+
+    def start(self) -> 'ModelLoader':
+        """Bắt đầu load trong thread nền (gọi nhiều lần không sao)"""
+        if self._thread is None:
+            self.state = STATE_LOADING
+            self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            # Import trong thread nền: ultralytics / easyocr / torch mất vài giây
+            from .detection import LicensePlateDetector
+            from .ocr import LicensePlateOCR
+
+            errors = []
+
+            # Detector và OCR độc lập nhau -> load song song
+            def _load_detector():
+                try:
+                    start = time.time()
+                    self.detector = LicensePlateDetector()
+                    self.timings['detector'] = time.time() - start
+                except Exception as e:
+                    errors.append(e)
+
+            detector_thread = threading.Thread(target=_load_detector, name="model-loader-yolo", daemon=True)
+            detector_thread.start()
+            start = time.time()
+            self.ocr = LicensePlateOCR()
+            self.timings['ocr'] = time.time() - start
+            detector_thread.join()
+            if errors:
+                raise errors[0]
+
+            if self.warmup:
+                start = time.time()
+                self.detector.warmup()
+                self.ocr.warmup()
+                self.timings['warmup'] = time.time() - start
+                print(f"✓ Warm-up model xong trong {self.timings['warmup']:.2f}s")
+        except Exception as e:
+            print(f"✗ Lỗi khi load model: {e}")
+            self.error = e
+            self.state = STATE_ERROR
+            self._done.set()
+            if self._on_error is not None:
+                self._on_error(self, e)
+            return
+
+        self.state = STATE_READY
+        self._done.set()
+        if self._on_ready is not None:
+            self._on_ready(self)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Chờ load xong
+
+        Returns:
+            True nếu model sẵn sàng
+        """
+        self.start()
+        self._done.wait(timeout)
+        return self.is_ready
@@ -1,134 +1,360 @@
 """
 Module quản lý việc ghi log và lưu lịch sử nhận diện
+- Mức lưu (HISTORY_PERSIST_LEVEL): none / text / roi / debug / sampled
+- Ảnh gốc đã có trên đĩa được hard link (hoặc copy / tham chiếu), không giải mã và nén lại
+- Lưu dạng thư mục (mỗi ảnh 1 thư mục) hoặc dạng gói .pack (mỗi batch/giờ 1 file, xem archive.py)
 """
 
+import io
+import logging
 import os
 import csv
+import hashlib
+import shutil
+import threading
 from datetime import datetime
 from PIL import Image
 import numpy as np
-from .config import HISTORY_DIR, HISTORY_CSV_FILE
+from .config import (HISTORY_DIR, HISTORY_CSV_FILE, HISTORY_PERSIST_LEVEL, HISTORY_DEBUG_SAMPLE_RATE,
+                     HISTORY_DEBUG_MIN_CONFIDENCE, HISTORY_ORIGINAL_MODE, HISTORY_STORAGE,
+                     HISTORY_PACK_ROTATE, HISTORY_PACK_DIR)
+from .results import RETENTION_NONE, RETENTION_ROI, RETENTION_DEBUG
+from .archive import ArchiveWriter, PACK_EXT, make_ref
+from .diagnostics import traced
+
+log = logging.getLogger(__name__)
+
+# Mức lưu History
+PERSIST_NONE = 'none'
+PERSIST_TEXT = 'text'
+PERSIST_ROI = 'roi'
+PERSIST_DEBUG = 'debug'
+PERSIST_SAMPLED = 'sampled'
+PERSIST_LEVELS = (PERSIST_NONE, PERSIST_TEXT, PERSIST_ROI, PERSIST_DEBUG, PERSIST_SAMPLED)
+
+# Cách lưu ảnh gốc
+ORIGINAL_MODES = ('link', 'copy', 'reference')
+
+# Cách lưu ảnh: thư mục riêng cho mỗi ảnh, hoặc gói .pack
+STORAGE_FILES = 'files'
+STORAGE_PACK = 'pack'
+STORAGE_MODES = (STORAGE_FILES, STORAGE_PACK)
+PACK_ROTATE_MODES = ('batch', 'hour')
+
+
+
+class _FolderSink:
+    """Ghi ảnh của 1 kết quả vào thư mục riêng History/{Timestamp}_{OriginalName}"""
+
+    def __init__(self, save_dir):
+        self.location = save_dir
+
+    def save_image(self, filename, image):
+        path = os.path.join(self.location, filename)
+        (image if isinstance(image, Image.Image) else Image.fromarray(image)).save(path)
+        return path
+
+    def save_file(self, filename, source_path, link=False):
+        path = os.path.join(self.location, filename)
+        if link:
+            try:
+                os.link(source_path, path)
+                return path
+            except OSError:
+                # Khác ổ đĩa / filesystem không hỗ trợ hard link -> copy
+                pass
+        shutil.copyfile(source_path, path)
+        return path
+
+    def save_bytes(self, filename, data):
+        path = os.path.join(self.location, filename)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+
+class _PackSink:
+    """Ghi ảnh của 1 kết quả vào gói .pack, tên thành viên {Timestamp}_{OriginalName}/{file}"""
+
+    def __init__(self, writer, prefix):
+        self.writer = writer
+        self.prefix = prefix
+        self.location = make_ref(writer.pack_path, prefix)
+
+    def save_image(self, filename, image):
+        return self.writer.add_image(f"{self.prefix}/{filename}", image)
+
+    def save_file(self, filename, source_path, link=False):
+        # Không hard link được vào gói -> chép nguyên nội dung file (không nén lại)
+        return self.writer.add_file(f"{self.prefix}/{filename}", source_path)
+
+    def save_bytes(self, filename, data):
+        return self.writer.add(f"{self.prefix}/{filename}", data)
+
+
+def _bytes_ext(data):
+    """Đuôi file theo định dạng ảnh (chỉ đọc header)"""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image_format = image.format
+    except Exception:
+        return '.jpg'
+    return {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'BMP': '.bmp', 'TIFF': '.tif'}.get(image_format, '.jpg')
+
+
+CSV_HEADER = ['Thời gian', 'Biển số xe', 'Loại xe', 'Đường dẫn ảnh gốc', 'Đường dẫn ảnh ROI', 'Đường dẫn ảnh đã qua tiền xử lý', 'Đường dẫn ảnh đã nhận diện']
+
 
 class HistoryLogger:
     """
     Class quản lý việc lưu trữ lịch sử nhận diện, bao gồm ảnh và file CSV
     """
-    
-    def __init__(self, base_dir=HISTORY_DIR):
+
+    def __init__(self, base_dir=HISTORY_DIR, level=HISTORY_PERSIST_LEVEL, original_mode=HISTORY_ORIGINAL_MODE,
+                 sample_rate=HISTORY_DEBUG_SAMPLE_RATE, min_confidence=HISTORY_DEBUG_MIN_CONFIDENCE,
+                 storage=HISTORY_STORAGE, pack_rotate=HISTORY_PACK_ROTATE):
         """
         Khởi tạo logger
-        
+
         Args:
             base_dir: Thư mục gốc để lưu lịch sử
+            level: Mức lưu ('none', 'text', 'roi', 'debug', 'sampled')
+            original_mode: Cách lưu ảnh gốc ('link', 'copy', 'reference')
+            sample_rate: Mức 'sampled': tỉ lệ ảnh được lưu đủ debug
+            min_confidence: Mức 'sampled': biển số có confidence thấp hơn -> lưu đủ debug
+            storage: 'files' (mỗi ảnh 1 thư mục) hoặc 'pack' (gói .pack trong {base_dir}/packs)
+            pack_rotate: Chế độ gói: 'batch' (mỗi batch 1 gói, xem new_batch) hoặc 'hour' (mỗi giờ 1 gói)
         """
+        if level not in PERSIST_LEVELS:
+            raise ValueError(f"Mức lưu History không hợp lệ: {level} (chọn 1 trong {', '.join(PERSIST_LEVELS)})")
+        if original_mode not in ORIGINAL_MODES:
+            raise ValueError(f"Cách lưu ảnh gốc không hợp lệ: {original_mode} (chọn 1 trong {', '.join(ORIGINAL_MODES)})")
+        if storage not in STORAGE_MODES or pack_rotate not in PACK_ROTATE_MODES:
+            raise ValueError(f"Cách lưu History không hợp lệ: {storage}/{pack_rotate}")
         self.base_dir = base_dir
+        self.level = level
+        self.original_mode = original_mode
+        self.sample_rate = sample_rate
+        self.min_confidence = min_confidence
+        self.storage = storage
+        self.pack_rotate = pack_rotate
+        # Gói .pack đang ghi (chế độ 'pack')
+        self._writer = None
+        self._writer_key = None
+        self._writer_lock = threading.Lock()
+        # Khóa ghi CSV (pipeline có thể lưu từ nhiều thread)
+        self._csv_lock = threading.Lock()
         # Đảm bảo thư mục gốc tồn tại
         if not os.path.exists(self.base_dir):
             os.makedirs(self.base_dir)
 
-    def save_result(self, original_image_path, original_image_pil, detections, processed_image_pil=None):
+    @property
+    def required_retention(self):
+        """Mức giữ ảnh trung gian (RESULT_RETENTION) mà kết quả cần có để lưu đủ theo mức này"""
+        if self.level in (PERSIST_DEBUG, PERSIST_SAMPLED):
+            return RETENTION_DEBUG
+        if self.level == PERSIST_ROI:
+            return RETENTION_ROI
+        return RETENTION_NONE
+
+    def _is_sampled(self, original_image_path):
+        """Lấy mẫu theo hash đường dẫn: chạy lại cùng ảnh cho cùng kết quả"""
+        if self.sample_rate <= 0:
+            return False
+        digest = hashlib.sha1(str(original_image_path).encode('utf-8')).hexdigest()
+        return int(digest[:8], 16) / 0xFFFFFFFF < self.sample_rate
+
+    def _artifact_level(self, original_image_path, detections):
+        """Mức lưu thực tế cho 1 ảnh (mức 'sampled' được quy về 'roi' hoặc 'debug')"""
+        if self.level != PERSIST_SAMPLED:
+            return self.level
+        if self._is_sampled(original_image_path):
+            return PERSIST_DEBUG
+        for det in detections:
+            if det.confidence is not None and det.confidence < self.min_confidence:
+                return PERSIST_DEBUG
+        return PERSIST_ROI
+
+    def _open_sink(self, now, timestamp, name_no_ext):
+        """Nơi ghi ảnh cho 1 kết quả: thư mục riêng hoặc gói .pack"""
+        if self.storage == STORAGE_PACK:
+            writer = self._get_writer(now)
+            return _PackSink(writer, writer.unique_prefix(f"{timestamp}_{name_no_ext}"))
+        return _FolderSink(self._make_dir(timestamp, name_no_ext))
+
+    def _get_writer(self, now):
+        """Gói .pack hiện tại (mỗi batch 1 gói, hoặc mỗi giờ 1 gói)"""
+        key = now.strftime("%Y%m%d_%H") if self.pack_rotate == 'hour' else None
+        with self._writer_lock:
+            if self._writer is not None and key != self._writer_key:
+                self._writer.close()
+                self._writer = None
+            if self._writer is None:
+                # pid trong tên gói: nhiều process ghi cùng thư mục không bao giờ ghi chung 1 gói
+                name = key or now.strftime("%Y%m%d_%H%M%S")
+                pack_path = os.path.join(self.base_dir, HISTORY_PACK_DIR, f"{name}_{os.getpid()}{PACK_EXT}")
+                self._writer = ArchiveWriter(pack_path)
+                self._writer_key = key
+            return self._writer
+
+    def new_batch(self):
+        """Bắt đầu batch mới: chế độ gói theo batch sẽ ghi vào gói mới ở lần lưu tiếp theo"""
+        with self._writer_lock:
+            if self._writer is not None and self.pack_rotate == 'batch':
+                self._writer.close()
+                self._writer = None
+
+    def close(self):
+        """Đóng gói .pack đang ghi (fsync)"""
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def _make_dir(self, timestamp, name_no_ext):
+        # Tạo thư mục riêng cho ảnh này: History/{Timestamp}_{OriginalName}
+        # Trùng tên trong cùng 1 giây (ảnh cùng tên ở thư mục khác, chạy lại) -> thêm hậu tố _1, _2, ...
+        image_folder_name = f"{timestamp}_{name_no_ext}"
+        save_dir = os.path.join(self.base_dir, image_folder_name)
+        suffix = 0
+        while True:
+            try:
+                os.makedirs(save_dir)
+                return save_dir
+            except FileExistsError:
+                suffix += 1
+                save_dir = os.path.join(self.base_dir, f"{image_folder_name}_{suffix}")
+
+    def _save_original(self, sink, original_image_path, original_image_pil, timestamp, name_no_ext,
+                       original_bytes=None):
+        """
+        Lưu ảnh gốc
+
+        File nguồn còn trên đĩa: hard link / copy nguyên bản (không giải mã/nén lại,
+        giữ nguyên độ phân giải khi pipeline chỉ giải mã bản preview) hoặc chỉ tham chiếu.
+        Ảnh upload: ghi nguyên nội dung đã nhận (original_bytes), không có thì ghi JPEG từ ảnh PIL.
+
+        Returns:
+            Đường dẫn ảnh gốc ghi vào CSV
         """
-        Lưu kết quả nhận diện vào thư mục History và ghi log CSV
-        
+        if original_bytes is not None:
+            return sink.save_bytes(f"{timestamp}_{name_no_ext}{_bytes_ext(original_bytes)}", original_bytes)
+        if original_image_path and os.path.isfile(original_image_path):
+            if self.original_mode == 'reference':
+                return original_image_path
+            ext = os.path.splitext(original_image_path)[1].lower() or '.jpg'
+            return sink.save_file(f"{timestamp}_{name_no_ext}{ext}", original_image_path,
+                                  link=self.original_mode == 'link')
+        return sink.save_image(f"{timestamp}_{name_no_ext}.jpg", original_image_pil.convert('RGB'))
+
+    @traced('history.save_result')
+    def save_result(self, original_image_path, original_image_pil, detections, processed_image_pil=None,
+                    original_bytes=None):
+        """
+        Lưu kết quả nhận diện vào thư mục History và ghi log CSV (theo mức lưu)
+
         Args:
-            original_image_path: Đường dẫn file ảnh gốc
+            original_image_path: Đường dẫn file ảnh gốc (None = không có file nguồn, vd. ảnh upload)
             original_image_pil: Ảnh gốc (PIL Image)
-            detections: Danh sách kết quả nhận diện
+            detections: Danh sách kết quả nhận diện (PlateResult)
             processed_image_pil: Ảnh toàn cảnh đã vẽ bbox và text (PIL Image)
+            original_bytes: Nội dung file ảnh gốc khi không có file nguồn (ảnh upload, độ phân giải đầy đủ)
+
+        Returns:
+            Thư mục đã lưu (hoặc tham chiếu "{gói}::{thư mục}" khi lưu dạng gói,
+            "" nếu mức lưu không ghi ảnh), hoặc None nếu lưu thất bại
         """
+        if self.level == PERSIST_NONE:
+            return ""
         try:
             now = datetime.now()
             timestamp = now.strftime("%Y%m%d_%H%M%S")
-            
-            # 1. Lưu ảnh gốc
+            has_source = bool(original_image_path) and os.path.isfile(original_image_path)
+            level = self._artifact_level(original_image_path or timestamp, detections)
+            is_debug = level == PERSIST_DEBUG
+
             # Lấy tên file gốc để dễ truy xuất
-            original_filename = os.path.basename(original_image_path)
+            original_filename = os.path.basename(original_image_path) if original_image_path else "upload"
             name_no_ext = os.path.splitext(original_filename)[0]
-            
-            # Tạo thư mục riêng cho ảnh này: History/{Timestamp}_{OriginalName}
-            image_folder_name = f"{timestamp}_{name_no_ext}"
-            save_dir = os.path.join(self.base_dir, image_folder_name)
-            os.makedirs(save_dir, exist_ok=True)
-            
-            # Tên file: YYYYMMDD_HHMMSS_OriginalName.jpg
-            save_original_name = f"{timestamp}_{name_no_ext}.jpg"
-            save_original_path = os.path.join(save_dir, save_original_name)
-            
-            # Lưu ảnh gốc
-            original_image_pil.save(save_original_path)
-            
-            # Lưu ảnh toàn cảnh đã nhận diện (nếu có)
+
+            # 1. Ảnh gốc: mức 'text' chỉ tham chiếu file nguồn, không tạo thư mục/gói
+            sink = None
+            if level == PERSIST_TEXT:
+                save_original_path = original_image_path if has_source else ""
+            else:
+                sink = self._open_sink(now, timestamp, name_no_ext)
+                save_original_path = self._save_original(sink, original_image_path, original_image_pil,
+                                                         timestamp, name_no_ext, original_bytes=original_bytes)
+
+            # Lưu ảnh toàn cảnh đã nhận diện (chỉ mức debug)
             save_detected_full_path = ""
-            if processed_image_pil is not None:
+            if is_debug and processed_image_pil is not None:
                 save_detected_full_name = f"{timestamp}_{name_no_ext}_detected_full.jpg"
-                save_detected_full_path = os.path.join(save_dir, save_detected_full_name)
-                processed_image_pil.save(save_detected_full_path)
-            
+                save_detected_full_path = sink.save_image(save_detected_full_name, processed_image_pil)
+
+            # Các dòng log CSV (ghi sau khi lưu ảnh xong, dưới khóa)
+            rows = []
+
+            # Nếu không có biển số nào
+            if not detections:
+                rows.append([now.strftime("%Y-%m-%d %H:%M:%S"), "No Plate", "", save_original_path, "", "", save_detected_full_path])
+
+            # 2. Lưu từng biển số cắt được (ROI)
+            for i, det in enumerate(detections):
+                plate_text = det.text
+                vehicle_type = det.vehicle_type
+
+                # Clean text cho tên file
+                clean_text = "".join(c for c in plate_text if c.isalnum())
+
+                # Lưu ảnh ROI (numpy RGB, None nếu kết quả không giữ ảnh)
+                # Tên file ROI: YYYYMMDD_HHMMSS_BienSo_Index.jpg
+                save_roi_path = ""
+                if sink is not None and det.roi is not None:
+                    save_roi_name = f"{timestamp}_{clean_text}_{i}.jpg"
+                    save_roi_path = sink.save_image(save_roi_name, det.roi)
+
+                # Lưu ảnh Preprocessed + các bước trung gian (chỉ mức debug)
+                save_preprocessed_path = ""
+                if is_debug and det.preprocessed is not None:
+                    # 1. Lưu ảnh kết quả cuối cùng (processed): ..._processed.jpg
+                    save_final_name = f"{timestamp}_{clean_text}_{i}_processed.jpg"
+                    save_preprocessed_path = sink.save_image(save_final_name, det.preprocessed)
+
+                    # 2. Lưu từng bước trung gian (intermediate preprocessing steps)
+                    for step_name, step_img in det.intermediates.items():
+                        # Tên file: YYYYMMDD_HHMMSS_BienSo_Index_step_name.jpg
+                        save_step_name = f"{timestamp}_{clean_text}_{i}_{step_name}.jpg"
+
+                        # Kiểm tra nếu step_img là numpy array
+                        if isinstance(step_img, np.ndarray):
+                            sink.save_image(save_step_name, step_img)
+
+                # Ghi log vào CSV
+                # LƯU Ý: Cột cuối cùng là đường dẫn ảnh toàn cảnh (processed_image_pil)
+                rows.append([
+                    now.strftime("%Y-%m-%d %H:%M:%S"),
+                    plate_text,
+                    vehicle_type,
+                    save_original_path,
+                    save_roi_path,
+                    save_preprocessed_path,
+                    save_detected_full_path
+                ])
+
             # File log CSV
             csv_file = os.path.join(self.base_dir, HISTORY_CSV_FILE)
-            file_exists = os.path.isfile(csv_file)
-            
-            with open(csv_file, mode='a', newline='', encoding='utf-8-sig') as f:
-                writer = csv.writer(f)
-                # Header - Cập nhật để bao gồm cột Detected Image Path
-                if not file_exists:
-                    writer.writerow(['Thời gian', 'Biển số xe', 'Loại xe', 'Đường dẫn ảnh gốc', 'Đường dẫn ảnh ROI', 'Đường dẫn ảnh đã qua tiền xử lý', 'Đường dẫn ảnh đã nhận diện'])
-                
-                # Nếu không có biển số nào
-                if not detections:
-                     writer.writerow([now.strftime("%Y-%m-%d %H:%M:%S"), "No Plate", "", save_original_path, "", "", save_detected_full_path])
-                
-                # 2. Lưu từng biển số cắt được (ROI)
-                for i, det in enumerate(detections):
-                    plate_text = det['text']
-                    vehicle_type = det['vehicle_type']
-                    roi = det['roi'] # numpy array (RGB)
-                    preprocessed_image = det.get('preprocessed_image')
-                    preprocessing_method = det.get('preprocessing_method', 'unknown')
-                    intermediate_images = det.get('intermediate_images', {})
-                    
-                    # Clean text cho tên file
-                    clean_text = "".join(c for c in plate_text if c.isalnum())
-                    
-                    # Tên file ROI: YYYYMMDD_HHMMSS_BienSo_Index.jpg
-                    save_roi_name = f"{timestamp}_{clean_text}_{i}.jpg"
-                    save_roi_path = os.path.join(save_dir, save_roi_name)
-                    
-                    # Lưu ảnh ROI
-                    roi_pil = Image.fromarray(roi)
-                    roi_pil.save(save_roi_path)
-                    
-                    # Lưu ảnh Preprocessed (nếu có)
-                    save_preprocessed_path = ""
-                    
-                    if preprocessed_image is not None:
-                        # 1. Lưu ảnh kết quả cuối cùng (processed): ..._processed.jpg
-                        save_final_name = f"{timestamp}_{clean_text}_{i}_processed.jpg"
-                        save_preprocessed_path = os.path.join(save_dir, save_final_name)
-                        Image.fromarray(preprocessed_image).save(save_preprocessed_path)
-                        
-                        # 2. Lưu từng bước trung gian (intermediate preprocessing steps)
-                        if intermediate_images:
-                            for step_name, step_img in intermediate_images.items():
-                                # Tên file: YYYYMMDD_HHMMSS_BienSo_Index_step_name.jpg
-                                save_step_name = f"{timestamp}_{clean_text}_{i}_{step_name}.jpg"
-                                save_step_path = os.path.join(save_dir, save_step_name)
-                                
-                                # Kiểm tra nếu step_img là numpy array
-                                if isinstance(step_img, np.ndarray):
-                                    Image.fromarray(step_img).save(save_step_path)
-                    
-                    # Ghi log vào CSV
-                    # LƯU Ý: Cột cuối cùng là đường dẫn ảnh toàn cảnh (processed_image_pil)
-                    writer.writerow([
-                        now.strftime("%Y-%m-%d %H:%M:%S"), 
-                        plate_text, 
-                        vehicle_type, 
-                        save_original_path, 
-                        save_roi_path, 
-                        save_preprocessed_path,
-                        save_detected_full_path
-                    ])
-                    
+            with self._csv_lock:
+                file_exists = os.path.isfile(csv_file)
+                with open(csv_file, mode='a', newline='', encoding='utf-8-sig') as f:
+                    writer = csv.writer(f)
+                    # Header - Cập nhật để bao gồm cột Detected Image Path
+                    if not file_exists:
+                        writer.writerow(CSV_HEADER)
+                    writer.writerows(rows)
+
+            return sink.location if sink is not None else ""
+
         except Exception as e:
-            print(f"Lỗi khi lưu lịch sử: {e}")
+            log.error("Lỗi khi lưu lịch sử: %s", e)
+            return None
@@ -0,0 +1,204 @@
+"""
+Module manifest cho batch job có thể chạy tiếp (resumable)
+- Nhật ký JSONL chỉ ghi thêm (append-only): mỗi dòng là 1 sự kiện của 1 ảnh
+  {"path", "hash", "stamp", "status", "attempt", "result", "error", "time"}
+- Chạy lại: ảnh đã "done" (nội dung không đổi) được bỏ qua, ảnh "failed"
+  được thử lại tới tối đa max_retries lần
+- Process chết giữa chừng chỉ làm mất dòng cuối (dòng hỏng được bỏ qua khi đọc)
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .config import MANIFEST_MAX_RETRIES, MANIFEST_FSYNC_EVERY
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+
+def content_hash(path: str) -> str:
+    """SHA-1 nội dung file"""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_stamp(path: str) -> str:
+    """Dấu (size:mtime_ns) để kiểm tra nhanh file có đổi hay không mà không cần đọc nội dung"""
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def read_manifest(path: str) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    """
+    Đọc manifest chỉ để đọc (không mở ghi, không sửa dòng cuối bị cắt dở)
+
+    Returns:
+        (trạng thái mới nhất của từng ảnh theo đường dẫn tuyệt đối, số dòng hỏng)
+    """
+    entries: Dict[str, Dict[str, Any]] = {}
+    corrupt_lines = 0
+    if not os.path.isfile(path):
+        return entries, corrupt_lines
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+                entries[os.path.abspath(entry['path'])] = entry
+            except (ValueError, KeyError, TypeError):
+                # Dòng ghi dở khi process bị kill
+                corrupt_lines += 1
+    return entries, corrupt_lines
+
+
+class JobManifest:
+    """
+    Nhật ký tiến độ của 1 batch job
+
+    Ví dụ:
+        manifest = JobManifest("job.jsonl")
+        todo = manifest.pending(paths)
+        ...
+        manifest.record_done(path, {'plates': [...]})
+        manifest.close()
+    """
+
+    def __init__(self, path: str, max_retries: int = MANIFEST_MAX_RETRIES, fsync_every: int = MANIFEST_FSYNC_EVERY):
+        """
+        Args:
+            path: File JSONL của manifest (tạo mới nếu chưa có)
+            max_retries: Số lần thử tối đa cho 1 ảnh lỗi
+            fsync_every: fsync xuống đĩa sau mỗi N dòng (close() luôn fsync)
+        """
+        self.path = path
+        self.max_retries = max_retries
+        self.fsync_every = max(1, fsync_every)
+        # Trạng thái mới nhất của từng ảnh (theo đường dẫn tuyệt đối)
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.corrupt_lines = 0
+        self._lock = threading.Lock()
+        self._unsynced = 0
+        self._load()
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        # Dòng cuối bị cắt dở (không có '\n') -> xuống dòng để dòng mới không dính vào
+        if self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write("\n")
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.abspath(path)
+
+    def _load(self):
+        self.entries, self.corrupt_lines = read_manifest(self.path)
+
+    def is_done(self, path: str) -> bool:
+        """Ảnh đã xử lý xong và nội dung không đổi kể từ đó"""
+        entry = self.entries.get(self._key(path))
+        if entry is None or entry.get('status') != STATUS_DONE:
+            return False
+        try:
+            if entry.get('stamp') == file_stamp(path):
+                return True
+            # Chỉ mtime đổi (touch, copy lại) -> so nội dung
+            return entry.get('hash') == content_hash(path)
+        except OSError:
+            return False
+
+    def attempts(self, path: str) -> int:
+        """Số lần đã xử lý ảnh (tính cả lần lỗi)"""
+        entry = self.entries.get(self._key(path))
+        return entry.get('attempt', 0) if entry else 0
+
+    def pending(self, paths: Iterable[str]) -> List[str]:
+        """
+        Lọc các ảnh cần xử lý: chưa xong, và chưa lỗi quá max_retries lần
+
+        Returns:
+            List đường dẫn (giữ thứ tự đầu vào)
+        """
+        todo = []
+        for path in paths:
+            if self.is_done(path):
+                continue
+            entry = self.entries.get(self._key(path))
+            if entry is not None and entry.get('status') == STATUS_FAILED and entry.get('attempt', 0) >= self.max_retries:
+                continue
+            todo.append(path)
+        return todo
+
+    def _append(self, path: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        try:
+            stamp = file_stamp(path)
+            digest = content_hash(path)
+        except OSError:
+            stamp, digest = None, None
+        key = self._key(path)
+        with self._lock:
+            previous = self.entries.get(key)
+            attempt = (previous.get('attempt', 0) if previous else 0) + 1
+            entry = {
+                'path': key,
+                'hash': digest,
+                'stamp': stamp,
+                'status': status,
+                'attempt': attempt,
+                'time': time.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            if result is not None:
+                entry['result'] = result
+            if error is not None:
+                entry['error'] = error
+            self._write(key, entry)
+
+    def _write(self, key: str, entry: Dict[str, Any]):
+        # Gọi khi đang giữ self._lock
+        self.entries[key] = entry
+        # 1 dòng = 1 lần write -> dòng không bị xen kẽ giữa các thread
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= self.fsync_every:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+
+    def append_entry(self, entry: Dict[str, Any]):
+        """Ghi nguyên 1 dòng đã có sẵn (ví dụ chép từ manifest khác khi gộp shard)"""
+        with self._lock:
+            self._write(self._key(entry['path']), dict(entry))
+
+    def record_done(self, path: str, result: Dict[str, Any]):
+        """Ghi nhận ảnh xử lý thành công"""
+        self._append(path, STATUS_DONE, result=result)
+
+    def record_failed(self, path: str, error: str):
+        """Ghi nhận ảnh xử lý lỗi"""
+        self._append(path, STATUS_FAILED, error=error)
+
+    def summary(self) -> Dict[str, int]:
+        """Số ảnh theo trạng thái"""
+        counts = {STATUS_DONE: 0, STATUS_FAILED: 0}
+        with self._lock:
+            for entry in self.entries.values():
+                counts[entry.get('status')] = counts.get(entry.get('status'), 0) + 1
+        return counts
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
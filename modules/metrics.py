@@ -0,0 +1,359 @@
+"""
+Module metrics vận hành (chỉ dùng thư viện chuẩn)
+- Counter / Gauge / Histogram có nhãn, ghi nhận bằng 1 phép cộng dưới khóa (~2µs), an toàn đa luồng
+- Các metric của hệ thống khai báo sẵn ở cuối module (ảnh vào, biển số phát hiện, số lần OCR mỗi biển số,
+  dừng sớm theo phương pháp, cache hit, latency từng giai đoạn, độ dài queue, RSS)
+- Xuất dạng text Prometheus: endpoint /metrics (server.py hoặc start_http_server) hoặc ghi file định kỳ
+  (MetricsDumper: .prom cho textfile collector của node_exporter, .json cho script khác)
+"""
+
+import bisect
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from .config import METRICS_HOST, METRICS_PORT, METRICS_DUMP_INTERVAL, METRICS_LATENCY_BUCKETS
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    """Phần chung: tên, mô tả, nhãn, các series theo giá trị nhãn"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: cần nhãn {self.labelnames}, nhận {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Bộ đếm chỉ tăng: inc(), hoặc hàm đọc bộ đếm có sẵn lúc xuất (set_function)"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable[[], float]] = None
+
+    def set_function(self, function: Callable[[], float]):
+        """Giá trị lấy từ hàm khi xuất (chỉ cho counter không nhãn, hàm phải trả giá trị không giảm)"""
+        self._function = function
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        if self._function is not None:
+            return self._function()
+        return self._series.get(self._key(labels), 0)
+
+    def _items(self):
+        if self._function is not None:
+            return [((), self._function())]
+        with self._lock:
+            items = sorted(self._series.items())
+        # Counter không nhãn luôn có giá trị (0 khi chưa tăng)
+        return items if items or self.labelnames else [((), 0)]
+
+    def _samples(self):
+        return [("", _format_labels(self.labelnames, key), value) for key, value in self._items()]
+
+    def snapshot(self):
+        items = self._items()
+        return {",".join(key): value for key, value in items} if self.labelnames else items[0][1]
+
+
+class Gauge(_Metric):
+    """Giá trị tức thời: set() trực tiếp, hoặc hàm đọc lúc xuất (set_function)"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable[[], Optional[float]]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def set_function(self, function: Callable[[], Optional[float]]):
+        """Giá trị lấy từ hàm khi xuất (chỉ cho gauge không nhãn, hàm trả None = bỏ qua)"""
+        self._function = function
+
+    def _values(self) -> List[Tuple[Tuple[str, ...], float]]:
+        if self._function is not None:
+            value = self._function()
+            return [((), value)] if value is not None else []
+        with self._lock:
+            return sorted(self._series.items())
+
+    def _samples(self):
+        return [("", _format_labels(self.labelnames, key), value) for key, value in self._values()]
+
+    def snapshot(self):
+        values = self._values()
+        if not self.labelnames:
+            return values[0][1] if values else None
+        return {",".join(key): value for key, value in values}
+
+
+class Histogram(_Metric):
+    """Phân bố giá trị theo bucket cố định (cộng dồn khi xuất như Prometheus)"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = METRICS_LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # [số lần theo bucket (+Inf cuối), tổng, số lần]
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def _copy(self):
+        with self._lock:
+            return sorted((key, ([*s[0]], s[1], s[2])) for key, s in self._series.items())
+
+    def _samples(self):
+        samples = []
+        for key, (counts, total, count) in self._copy():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float('inf')), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                samples.append(("_bucket", _format_labels(self.labelnames, key, le), cumulative))
+            samples.append(("_sum", _format_labels(self.labelnames, key), total))
+            samples.append(("_count", _format_labels(self.labelnames, key), count))
+        return samples
+
+    def snapshot(self):
+        result = {",".join(key): {'count': count, 'sum': total, 'avg': total / count if count else 0.0,
+                                  'buckets': dict(zip(map(_format_value, (*self.buckets, float('inf'))), counts))}
+                  for key, (counts, total, count) in self._copy()}
+        return result if self.labelnames else result.get("")
+
+
+class MetricsRegistry:
+    """Tập các metric (tạo 1 lần theo tên, gọi lại trả về metric đã có)"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} đã khai báo là {metric.kind}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = METRICS_LATENCY_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        """Text Prometheus (exposition format 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Dict JSON được: tên metric -> {nhãn nối bằng ',' -> giá trị}"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = MetricsRegistry()
+
+
+# ---------------------------------------------------------------------------
+# Tài nguyên process
+# ---------------------------------------------------------------------------
+
+def resident_memory_bytes() -> Optional[float]:
+    """RSS hiện tại (Linux: /proc, nơi khác: đỉnh RSS từ getrusage, Windows không có -> None)"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return float(int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE'))
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # macOS trả về byte, các hệ khác trả về KB
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return float(peak if os.uname().sysname == 'Darwin' else peak * 1024)
+
+
+# ---------------------------------------------------------------------------
+# Các metric của hệ thống
+# ---------------------------------------------------------------------------
+
+IMAGES_TOTAL = REGISTRY.counter('lpr_images_total', "Số ảnh đã chạy phát hiện biển số")
+PLATES_DETECTED = REGISTRY.counter('lpr_plates_detected_total', "Số vùng biển số phát hiện được")
+OCR_CALLS = REGISTRY.counter('lpr_ocr_calls_total', "Số lần gọi EasyOCR theo đường đọc (fast/full/batch)",
+                             ('path',))
+OCR_VARIANTS_PER_PLATE = REGISTRY.histogram('lpr_ocr_variants_per_plate', "Số biến thể tiền xử lý đã OCR cho 1 biển số",
+                                            buckets=(1, 2, 3, 4, 5, 6, 8, 10))
+OCR_PLATES = REGISTRY.counter('lpr_ocr_plates_total', "Số biển số đã OCR theo kết quả (read/unread)", ('result',))
+OCR_SELECTED = REGISTRY.counter('lpr_ocr_selected_total', "Số kết quả được chọn theo phương pháp tiền xử lý",
+                                ('method',))
+OCR_EARLY_EXIT = REGISTRY.counter('lpr_ocr_early_exit_total', "Số lần dừng sớm theo phương pháp tiền xử lý",
+                                  ('method',))
+CACHE_REQUESTS = REGISTRY.counter('lpr_cache_requests_total', "Số lần tra cache theo cache và kết quả (hit/miss)",
+                                  ('cache', 'result'))
+STAGE_SECONDS = REGISTRY.histogram('lpr_stage_seconds', "Thời gian xử lý 1 ảnh của từng giai đoạn pipeline",
+                                   ('stage',))
+STAGE_ERRORS = REGISTRY.counter('lpr_stage_errors_total', "Số ảnh lỗi theo giai đoạn pipeline", ('stage',))
+QUEUE_DEPTH = REGISTRY.gauge('lpr_queue_depth', "Số ảnh đang chờ trong queue vào của giai đoạn", ('stage',))
+REQUEST_SECONDS = REGISTRY.histogram('lpr_request_seconds', "Thời gian xử lý 1 request của server (từ lúc nhận ảnh)")
+BATCH_SIZE = REGISTRY.histogram('lpr_batch_size', "Số ảnh trong 1 micro-batch của server", buckets=(1, 2, 4, 8, 16, 32))
+RESIDENT_MEMORY = REGISTRY.gauge('process_resident_memory_bytes', "Bộ nhớ thường trú (RSS) của process")
+RESIDENT_MEMORY.set_function(resident_memory_bytes)
+CPU_SECONDS = REGISTRY.counter('process_cpu_seconds_total', "Thời gian CPU (user + system) của process")
+CPU_SECONDS.set_function(time.process_time)
+
+
+# ---------------------------------------------------------------------------
+# Xuất metrics
+# ---------------------------------------------------------------------------
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Prometheus scrape mỗi vài giây -> không log
+        pass
+
+
+def start_http_server(port: int = METRICS_PORT, host: str = METRICS_HOST,
+                      registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """
+    Mở endpoint http://host:port/metrics trong thread nền
+
+    Returns:
+        ThreadingHTTPServer (gọi shutdown() để dừng)
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    httpd = ThreadingHTTPServer((host, port), handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True, name="metrics-http").start()
+    print(f"📈 Metrics: http://{host}:{port}/metrics")
+    return httpd
+
+
+class MetricsDumper:
+    """
+    Ghi metrics ra file định kỳ (ghi file tạm rồi đổi tên, người đọc không thấy file dở)
+    - .json: snapshot dạng dict
+    - đuôi khác (vd. .prom): text Prometheus
+    """
+
+    def __init__(self, path: str, interval: float = METRICS_DUMP_INTERVAL, registry: MetricsRegistry = REGISTRY):
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="metrics-dump")
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+    def start(self) -> 'MetricsDumper':
+        self._thread.start()
+        return self
+
+    def dump(self):
+        """Ghi ngay 1 lần"""
+        if self.path.endswith('.json'):
+            content = json.dumps({'time': time.time(), 'metrics': self.registry.snapshot()}, ensure_ascii=False)
+        else:
+            content = self.registry.render()
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, self.path)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.dump()
+            except OSError as e:
+                print(f"⚠ Không ghi được metrics {self.path}: {e}")
+
+    def close(self):
+        """Dừng và ghi lần cuối"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.dump()
@@ -0,0 +1,203 @@
+"""
+Module cache model đã biên dịch (pre-serialized) để khởi động nhanh
+- YOLO: export TorchScript (đã fuse Conv+BN) -> load thẳng, không dựng lại graph
+- EasyOCR: lưu sẵn module detector (CRAFT) / recognizer / converter bằng torch.save
+  -> bỏ qua bước kiểm tra file model và dựng lại mạng của easyocr.Reader
+- Khóa cache = hash file model + phiên bản thư viện: đổi model hoặc nâng cấp
+  torch / ultralytics / easyocr thì cache cũ tự động không còn được dùng
+
+Bước "compile" là tùy chọn, chạy bằng: python compile_models.py
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional
+from .config import MODEL_CACHE_DIR, WARMUP_IMAGE_SIZE, OCR_GPU
+
+_VERSIONED_LIBRARIES = ('torch', 'ultralytics', 'easyocr')
+_HASH_INDEX_FILE = "hash_index.json"
+_hash_lock = threading.Lock()
+
+
+def library_versions() -> Dict[str, str]:
+    """Phiên bản các thư viện ảnh hưởng tới định dạng model đã biên dịch"""
+    from importlib import metadata
+    versions = {}
+    for name in _VERSIONED_LIBRARIES:
+        try:
+            versions[name] = metadata.version(name)
+        except metadata.PackageNotFoundError:
+            versions[name] = 'missing'
+    return versions
+
+
+def file_sha256(path: str, cache_dir: str = MODEL_CACHE_DIR) -> str:
+    """
+    SHA-256 của file model
+
+    Kết quả được ghi nhớ trong hash_index.json theo (size, mtime) để không phải
+    đọc lại hàng trăm MB mỗi lần khởi động.
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    stamp = f"{stat.st_size}:{stat.st_mtime_ns}"
+    index_path = os.path.join(cache_dir, _HASH_INDEX_FILE)
+
+    with _hash_lock:
+        index = {}
+        if os.path.isfile(index_path):
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+            except (OSError, ValueError):
+                index = {}
+        entry = index.get(path)
+        if entry and entry.get('stamp') == stamp:
+            return entry['sha256']
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        index[path] = {'stamp': stamp, 'sha256': digest.hexdigest()}
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(index_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f, indent=2)
+        except OSError:
+            pass
+        return index[path]['sha256']
+
+
+def cache_key(kind: str, model_hashes: List[str], **options) -> str:
+    """Khóa cache từ loại model, hash file model, tùy chọn và phiên bản thư viện"""
+    payload = {
+        'kind': kind,
+        'models': model_hashes,
+        'options': options,
+        'versions': library_versions(),
+    }
+    raw = json.dumps(payload, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()[:16]
+
+
+# ---------------------------------------------------------------------------
+# YOLO detector
+# ---------------------------------------------------------------------------
+
+def _detector_key(model_path: str, imgsz: int, cache_dir: str) -> str:
+    return cache_key('yolo-torchscript', [file_sha256(model_path, cache_dir)], imgsz=imgsz)
+
+
+def detector_artifact_path(model_path: str, imgsz: int = WARMUP_IMAGE_SIZE,
+                           cache_dir: str = MODEL_CACHE_DIR) -> Optional[str]:
+    """
+    Đường dẫn TorchScript đã biên dịch cho model YOLO (None nếu chưa compile / model không tồn tại)
+    """
+    if not os.path.isfile(model_path):
+        return None
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    path = os.path.join(cache_dir, f"{name}-{_detector_key(model_path, imgsz, cache_dir)}.torchscript")
+    return path if os.path.isfile(path) else None
+
+
+def compile_detector(model_path: str, imgsz: int = WARMUP_IMAGE_SIZE, cache_dir: str = MODEL_CACHE_DIR) -> str:
+    """
+    Export model YOLO sang TorchScript (Conv+BN đã fuse) và lưu vào cache
+
+    Returns:
+        Đường dẫn file TorchScript trong cache
+    """
+    from ultralytics import YOLO
+    os.makedirs(cache_dir, exist_ok=True)
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    target = os.path.join(cache_dir, f"{name}-{_detector_key(model_path, imgsz, cache_dir)}.torchscript")
+
+    # Ultralytics export ra cạnh file .pt -> copy sang bản sao tạm trong cache rồi export
+    staging = os.path.join(cache_dir, f"_staging_{name}.pt")
+    shutil.copyfile(model_path, staging)
+    try:
+        exported = YOLO(staging).export(format='torchscript', imgsz=imgsz, optimize=False)
+        os.replace(exported, target)
+    finally:
+        if os.path.exists(staging):
+            os.unlink(staging)
+    return target
+
+
+# ---------------------------------------------------------------------------
+# EasyOCR reader
+# ---------------------------------------------------------------------------
+
+def _easyocr_storage_files() -> List[str]:
+    """File trọng số trong thư mục mặc định của EasyOCR (không cần dựng Reader)"""
+    storage = os.environ.get('EASYOCR_MODULE_PATH', os.path.join(os.path.expanduser('~'), '.EasyOCR'))
+    storage = os.path.join(storage, 'model')
+    if not os.path.isdir(storage):
+        return []
+    return sorted(os.path.join(storage, name) for name in os.listdir(storage) if name.endswith('.pth'))
+
+
+def _ocr_artifact_name(languages: List[str], gpu: bool, cache_dir: str) -> Optional[str]:
+    model_files = _easyocr_storage_files()
+    if not model_files:
+        return None
+    hashes = [file_sha256(path, cache_dir) for path in model_files]
+    key = cache_key('easyocr-modules', hashes, languages=sorted(languages), gpu=bool(gpu))
+    return os.path.join(cache_dir, f"easyocr-{key}.pt")
+
+
+def ocr_artifact_path(languages: List[str], gpu: bool = OCR_GPU, cache_dir: str = MODEL_CACHE_DIR) -> Optional[str]:
+    """Đường dẫn bản lưu sẵn của EasyOCR (None nếu chưa compile)"""
+    path = _ocr_artifact_name(languages, gpu, cache_dir)
+    return path if path and os.path.isfile(path) else None
+
+
+def compile_ocr(languages: List[str], gpu: bool = OCR_GPU, cache_dir: str = MODEL_CACHE_DIR) -> str:
+    """
+    Dựng easyocr.Reader một lần (tải trọng số nếu thiếu) và lưu detector / recognizer / converter vào cache
+
+    Returns:
+        Đường dẫn file trong cache
+    """
+    import easyocr
+    import torch
+    reader = easyocr.Reader(languages, gpu=gpu)
+    os.makedirs(cache_dir, exist_ok=True)
+    target = _ocr_artifact_name(languages, gpu, cache_dir)
+    tmp_path = target + ".tmp"
+    torch.save({
+        'detector': reader.detector,
+        'recognizer': reader.recognizer,
+        'converter': reader.converter,
+    }, tmp_path)
+    os.replace(tmp_path, target)
+    return target
+
+
+def load_cached_reader(languages: List[str], gpu: bool, cache_dir: str = MODEL_CACHE_DIR):
+    """
+    Dựng easyocr.Reader từ bản lưu sẵn (không load lại trọng số từ .pth)
+
+    Returns:
+        easyocr.Reader, hoặc None nếu chưa có cache / cache không dùng được
+    """
+    try:
+        artifact = ocr_artifact_path(languages, gpu, cache_dir)
+        if artifact is None:
+            return None
+        import easyocr
+        import torch
+        # detector=False, recognizer=False: chỉ dựng phần cấu hình (charset, ngôn ngữ, ...)
+        reader = easyocr.Reader(languages, gpu=gpu, detector=False, recognizer=False, verbose=False)
+        modules = torch.load(artifact, map_location=reader.device, weights_only=False)
+        reader.detector = modules['detector'].to(reader.device).eval()
+        reader.recognizer = modules['recognizer'].to(reader.device).eval()
+        reader.converter = modules['converter']
+    except Exception as e:
+        print(f"⚠ Không dùng được cache EasyOCR, load lại từ đầu: {e}")
+        return None
+    return reader
@@ -4,13 +4,168 @@ Sử dụng EasyOCR với Warping (nắn thẳng biển số)
 """
 
 
+import logging
 import re
-from typing import List, Dict, Tuple, Optional, Any
+from typing import Dict, List, Tuple, Optional, Any
+import cv2
 import numpy as np
-import easyocr
-from .preprocessing import preprocess_for_ocr
-from .utils import classify_vehicle, fix_plate_chars, format_plate
-from .config import OCR_LANGUAGES, OCR_GPU
+from .preprocessing import preprocess_for_ocr, split_text_lines, group_by_shape_bucket
+from .utils import classify_vehicle, fix_plate_chars, format_plate, match_plate_pattern, PLATE_CHARSET
+from .decoding import build_symbol_map, decode_plate_lines
+from .results import OCRReading, RETENTION_ROI, RETENTION_DEBUG, retention_at_least
+from .config import OCR_LANGUAGES, OCR_GPU, GRAMMAR_DECODING, LINE_SPLIT_FAST_PATH, WARMUP_IMAGE_SIZE, USE_MODEL_CACHE, RESULT_RETENTION
+from .model_cache import load_cached_reader
+from .metrics import (OCR_CALLS, OCR_VARIANTS_PER_PLATE, OCR_PLATES, OCR_SELECTED, OCR_EARLY_EXIT,
+                      CACHE_REQUESTS)
+from .diagnostics import span, traced
+
+log = logging.getLogger(__name__)
+
+# Chiều cao ảnh đầu vào của recognizer EasyOCR
+RECOGNIZER_IMG_HEIGHT = 64
+
+# Allowlist cho recognizer: ký tự biển số + dấu phân cách in trên biển
+PLATE_OCR_ALLOWLIST = PLATE_CHARSET + '-.'
+
+# Biến thể đạt độ tin cậy này được chấp nhận ngay, không thử các biến thể còn lại
+EARLY_EXIT_CONFIDENCE = 0.8
+
+
+# --- Hậu xử lý & xếp hạng (hàm thuần, không cần model) ---
+# Dùng chung cho LicensePlateOCR và rescore.py (chạy lại luật trên raw OCR đã lưu)
+
+def sort_ocr_output(ocr_output: List[Any]) -> List[Any]:
+    """
+    Sắp xếp kết quả OCR theo thứ tự từ trên xuống dưới, trái qua phải
+
+    Đối với biển số 2 dòng, cần đọc dòng trên trước, sau đó dòng dưới.
+
+    Args:
+        ocr_output: Kết quả từ EasyOCR [[bbox, text, conf], ...]
+
+    Returns:
+        Kết quả đã được sắp xếp
+    """
+    if len(ocr_output) == 0:
+        return ocr_output
+
+    # Sắp xếp theo tọa độ Y (top) của bbox, sau đó theo X (left)
+    # bbox format: [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
+    # Lấy y_center = (y1 + y3) / 2, x_center = (x1 + x3) / 2
+
+    def get_sort_key(item):
+        bbox = item[0]
+        # Tính tọa độ trung tâm
+        y_center = (bbox[0][1] + bbox[2][1]) / 2
+        x_center = (bbox[0][0] + bbox[2][0]) / 2
+        # Sắp xếp theo Y trước (trên -> dưới), sau đó X (trái -> phải)
+        return (y_center, x_center)
+
+    return sorted(ocr_output, key=get_sort_key)
+
+
+def is_plate_text(text_lines: List[str]) -> bool:
+    """Chuỗi greedy (ghép các dòng) đã đúng ngữ pháp biển số chưa"""
+    return match_plate_pattern(re.sub(r'[^A-Z0-9]', '', "".join(text_lines).upper())) is not None
+
+
+def postprocess_lines(text_lines: List[str]) -> Tuple[str, bool, str, str, str]:
+    """
+    Phân loại xe + sửa lỗi ký tự + format từ các dòng text OCR
+
+    Returns:
+        (vehicle_type, is_50cc, raw_text, clean_text, formatted_text)
+    """
+    # Phân loại loại xe
+    vehicle_type = classify_vehicle(text_lines)
+
+    # Kiểm tra xe máy 50cc
+    is_50cc = False
+    if vehicle_type == "XE MÁY":
+        line1 = text_lines[0]
+        line1_clean = re.sub(r'[^A-Z0-9]', '', line1.upper())
+        if len(line1_clean) >= 4 and not line1_clean[-1].isdigit():
+            is_50cc = True
+
+    # Ghép và sửa lỗi
+    raw_text = "".join(text_lines)
+    clean_text = fix_plate_chars(raw_text, is_50cc=is_50cc)
+    formatted_text = format_plate(clean_text, vehicle_type)
+    return vehicle_type, is_50cc, raw_text, clean_text, formatted_text
+
+
+def is_valid_reading(plate_info: Optional[OCRReading]) -> bool:
+    """
+    Kiểm tra biển số có hợp lệ không
+    """
+    if plate_info is None:
+        return False
+
+    formatted_text = plate_info.formatted_text
+
+    # Kiểm tra độ dài tối thiểu
+    if len(formatted_text) <= 5:
+        return False
+
+    # Kiểm tra loại xe
+    vehicle_type = plate_info.vehicle_type
+    if vehicle_type == "KHÔNG RÕ":
+        return False
+
+    return True
+
+
+def calculate_smart_score(candidate: OCRReading) -> float:
+    """
+    CẢI TIẾN: Tính điểm thông minh cho candidate với xác thực chất lượng
+
+    Ưu tiên:
+    1. Điểm tin cậy (quan trọng nhất)
+    2. Độ hoàn chỉnh văn bản (phạt văn bản bị cắt)
+    3. Điểm thưởng phương pháp (vừa phải)
+    """
+    method = candidate.method
+    confidence = candidate.confidence
+    clean_text = candidate.clean_text
+
+    # Điểm cơ bản = confidence (0.0-1.0)
+    score = confidence
+
+    # KIỂM TRA CHẤT LƯỢNG
+    # 1. Kiểm tra độ hoàn chỉnh văn bản
+    if len(clean_text) < 6:  # Quá ngắn (phát hiện không đầy đủ)
+        score -= 0.2  # Phạt nặng
+    elif len(clean_text) < 8:  # Có thể không đầy đủ
+        score -= 0.1  # Phạt vừa
+
+    # 2. Kiểm tra ngưỡng tin cậy
+    if confidence < 0.2:  # Tin cậy rất thấp
+        score -= 0.15  # Phạt bổ sung
+    elif confidence < 0.3:  # Tin cậy thấp
+        score -= 0.05  # Phạt nhỏ
+
+    # ĐIỂM THƯỞNG PHƯƠNG PHÁP (GIẢM - bảo thủ hơn)
+    # Điểm thưởng vừa cho phương pháp warped (chỉ khi tin cậy tốt VÀ văn bản đầy đủ)
+    if ('warped' in method.lower() and confidence > 0.25 and len(clean_text) >= 7):
+        score += 0.08  # Giảm từ 0.15 xuống 0.08
+    # Phạt cho phương pháp warped với kết quả kém
+    elif 'warped' in method.lower() and (confidence < 0.3 or len(clean_text) < 6):
+        score -= 0.1  # Phạt cho warping kém
+
+    # Điểm thưởng vừa cho phương pháp binary
+    if 'otsu' in method.lower():
+        score += 0.08  # Giảm từ 0.15 xuống 0.08
+
+    # Điểm thưởng nhỏ kết hợp (chỉ khi cả tin cậy và độ dài văn bản tốt)
+    if ('warped' in method.lower() and 'otsu' in method.lower() and
+        confidence > 0.25 and len(clean_text) >= 7):
+        score += 0.05  # Giảm từ 0.10 xuống 0.05
+
+    # Phạt nhỏ cho grayscale thuần (không otsu)
+    if 'gray' in method.lower() and 'otsu' not in method.lower() and 'clahe' not in method.lower():
+        score -= 0.02  # Giảm phạt
+
+    return score
 
 
 class LicensePlateOCR:
@@ -27,9 +182,42 @@ class LicensePlateOCR:
             languages: Danh sách ngôn ngữ hỗ trợ
             gpu: Sử dụng GPU hay không
         """
-        self.reader = easyocr.Reader(languages, gpu=gpu)
+        # Import easyocr (kéo theo torch) lúc khởi tạo để import package nhanh
+        import easyocr
+        # Ưu tiên bản lưu sẵn từ compile_models.py (bỏ qua kiểm tra file + dựng lại mạng)
+        self.reader = load_cached_reader(languages, gpu) if USE_MODEL_CACHE else None
+        if USE_MODEL_CACHE:
+            CACHE_REQUESTS.inc(cache='ocr_model', result='hit' if self.reader is not None else 'miss')
+        if self.reader is not None:
+            print("✓ Load EasyOCR từ cache model")
+        else:
+            self.reader = easyocr.Reader(languages, gpu=gpu)
+        self.use_grammar_decoding = GRAMMAR_DECODING
+        self.use_fast_line_split = LINE_SPLIT_FAST_PATH
+        # Mức giữ ảnh trung gian trong OCRReading (xem RESULT_RETENTION)
+        self.retention = RESULT_RETENTION
+        self._symbol_map = None
+        # RawOCRWriter ghi kết quả thô từng biến thể (None = không ghi, xem rawocr.py)
+        self.raw_recorder = None
         print(f"✓ Đã khởi tạo EasyOCR (GPU: {gpu}) với Warping")
     
+    def warmup(self, size: int = WARMUP_IMAGE_SIZE):
+        """
+        Chạy thử detector (CRAFT) và recognizer trên ảnh giả để khởi tạo
+        kernel / cấp phát bộ nhớ trước khi xử lý ảnh thật
+        
+        Args:
+            size: Chiều rộng ảnh giả (chiều cao = size / 4, tỉ lệ gần biển số 1 dòng)
+        """
+        height = max(RECOGNIZER_IMG_HEIGHT, size // 4)
+        dummy = np.full((height, size, 3), 255, dtype=np.uint8)
+        cv2.putText(dummy, "30A12345", (10, height - 15), cv2.FONT_HERSHEY_SIMPLEX, height / 40.0, (0, 0, 0), 3)
+        self.reader.readtext(dummy, detail=0)
+        # CRAFT có thể không thấy chữ -> gọi thẳng recognizer trên toàn ảnh
+        self.reader.recognize(dummy, horizontal_list=[[0, size, 0, height]], free_list=[],
+                              allowlist=PLATE_OCR_ALLOWLIST, detail=0)
+    
+    @traced('ocr.read_text')
     def read_text(self, image: np.ndarray, detail: int = 1) -> List[Any]:
         """
         Đọc text từ ảnh sử dụng EasyOCR
@@ -41,42 +229,162 @@ class LicensePlateOCR:
         Returns:
             List kết quả
         """
+        OCR_CALLS.inc(path='full')
         return self.reader.readtext(image, detail=detail)
     
-    def _sort_ocr_results_top_to_bottom(self, ocr_output: List[Any]) -> List[Any]:
+    def read_text_batch(self, images: List[np.ndarray]) -> List[List[Any]]:
         """
-        Sắp xếp kết quả OCR theo thứ tự từ trên xuống dưới, trái qua phải
+        Đọc text từ nhiều ảnh, gom các ảnh cùng shape bucket vào một lần gọi batch
         
-        Đối với biển số 2 dòng, cần đọc dòng trên trước, sau đó dòng dưới.
+        Args:
+            images: Danh sách ảnh (nên đã qua normalize_roi_size)
+            
+        Returns:
+            List kết quả (cùng định dạng read_text(detail=1)) theo thứ tự images
+        """
+        outputs: List[List[Any]] = [[] for _ in images]
+        for _, indices in group_by_shape_bucket(images).items():
+            if len(indices) == 1:
+                outputs[indices[0]] = self.read_text(images[indices[0]], detail=1)
+                continue
+            OCR_CALLS.inc(len(indices), path='batch')
+            with span('ocr.read_text_batch', images=len(indices)):
+                batch_outputs = self.reader.readtext_batched([images[i] for i in indices], detail=1)
+            for i, output in zip(indices, batch_outputs):
+                outputs[i] = output
+        return outputs
+    
+    @traced('ocr.read_text_fast')
+    def read_text_fast(self, image: np.ndarray) -> Optional[List[Any]]:
+        """
+        Đọc text bằng đường nhanh: tách dòng bằng projection profile rồi đưa
+        thẳng các dòng vào recognizer (bỏ qua text detection CRAFT)
         
         Args:
-            ocr_output: Kết quả từ EasyOCR [[bbox, text, conf], ...]
+            image: Ảnh đầu vào (numpy array)
             
         Returns:
-            Kết quả đã được sắp xếp
+            List kết quả cùng định dạng với read_text(detail=1),
+            hoặc None nếu profile không rõ ràng (cần chạy đường đầy đủ)
         """
-        if len(ocr_output) == 0:
-            return ocr_output
+        lines = split_text_lines(image)
+        if lines is None:
+            return None
         
-        # Sắp xếp theo tọa độ Y (top) của bbox, sau đó theo X (left)
-        # bbox format: [[x1,y1], [x2,y2], [x3,y3], [x4,y4]]
-        # Lấy y_center = (y1 + y3) / 2, x_center = (x1 + x3) / 2
+        w = image.shape[1]
+        # horizontal_list format của EasyOCR: [x_min, x_max, y_min, y_max]
+        horizontal_list = [[0, w, y1, y2] for y1, y2 in lines]
+        OCR_CALLS.inc(path='fast')
+        return self.reader.recognize(
+            image,
+            horizontal_list=horizontal_list,
+            free_list=[],
+            allowlist=PLATE_OCR_ALLOWLIST,
+            detail=1
+        )
+    
+    @traced('ocr.read_char_probs')
+    def read_char_probs(self, image: np.ndarray, boxes: List[Any]) -> List[np.ndarray]:
+        """
+        Chạy recognizer trên từng box text để lấy ma trận xác suất ký tự (CTC)
         
-        def get_sort_key(item):
+        Args:
+            image: Ảnh đã tiền xử lý (numpy array)
+            boxes: Danh sách bbox 4 điểm từ EasyOCR
+            
+        Returns:
+            List ma trận (T, 1 + len(PLATE_CHARSET)) theo thứ tự boxes
+        """
+        import torch
+        import torch.nn.functional as F
+        
+        if self._symbol_map is None:
+            self._symbol_map = build_symbol_map(self.reader.converter.character)
+        
+        gray = image if len(image.shape) == 2 else cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        img_h, img_w = gray.shape[:2]
+        
+        line_probs = []
+        for box in boxes:
+            xs = [int(p[0]) for p in box]
+            ys = [int(p[1]) for p in box]
+            x1, x2 = max(0, min(xs)), min(img_w, max(xs))
+            y1, y2 = max(0, min(ys)), min(img_h, max(ys))
+            crop = gray[y1:y2, x1:x2]
+            if crop.size == 0:
+                continue
+            
+            # Resize giữ tỉ lệ về chiều cao chuẩn của recognizer, chuẩn hóa về [-1, 1]
+            ratio = crop.shape[1] / float(crop.shape[0])
+            resized_w = max(1, int(np.ceil(RECOGNIZER_IMG_HEIGHT * ratio)))
+            crop = cv2.resize(crop, (resized_w, RECOGNIZER_IMG_HEIGHT), interpolation=cv2.INTER_CUBIC)
+            tensor = torch.from_numpy(crop.astype(np.float32) / 255.0)
+            tensor = tensor.sub_(0.5).div_(0.5).unsqueeze(0).unsqueeze(0).to(self.reader.device)
+            
+            with torch.no_grad():
+                preds = self.reader.recognizer(tensor, None)
+            probs = F.softmax(preds, dim=2)[0].cpu().numpy()
+            
+            # Gộp về không gian ký tự biển số (blank + 0-9 + chữ series)
+            sym_probs = probs @ self._symbol_map
+            sym_probs /= np.maximum(sym_probs.sum(axis=1, keepdims=True), 1e-12)
+            line_probs.append(sym_probs)
+        
+        return line_probs
+    
+    def _group_boxes_into_lines(self, ocr_output: List[Any]) -> List[List[Any]]:
+        """
+        Gom các box (đã sắp xếp trên -> dưới) thành từng dòng text theo tọa độ Y
+        """
+        lines = []
+        for item in ocr_output:
             bbox = item[0]
-            # Tính tọa độ trung tâm
             y_center = (bbox[0][1] + bbox[2][1]) / 2
-            x_center = (bbox[0][0] + bbox[2][0]) / 2
-            # Sắp xếp theo Y trước (trên -> dưới), sau đó X (trái -> phải)
-            return (y_center, x_center)
+            height = abs(bbox[2][1] - bbox[0][1])
+            if lines:
+                last_bbox = lines[-1][-1][0]
+                last_center = (last_bbox[0][1] + last_bbox[2][1]) / 2
+                if abs(y_center - last_center) < 0.5 * max(height, 1):
+                    lines[-1].append(item)
+                    continue
+            lines.append([item])
         
-        sorted_output = sorted(ocr_output, key=get_sort_key)
-        return sorted_output
+        # Trong mỗi dòng sắp xếp trái -> phải
+        return [sorted(line, key=lambda item: item[0][0][0]) for line in lines]
+    
+    def _decode_with_grammar(self, image: np.ndarray, ocr_output: List[Any]) -> Optional[Tuple[List[str], float]]:
+        """
+        Giải mã lại biển số bằng beam search có ràng buộc ngữ pháp
+        
+        Returns:
+            (các dòng text, độ tin cậy), hoặc None nếu không giải mã được
+        """
+        try:
+            line_probs = []
+            for line in self._group_boxes_into_lines(ocr_output):
+                probs = self.read_char_probs(image, [item[0] for item in line])
+                if not probs:
+                    continue
+                # Chèn 1 frame blank giữa các box cùng dòng để không gộp ký tự lặp
+                blank = np.zeros((1, probs[0].shape[1]), dtype=probs[0].dtype)
+                blank[0, 0] = 1.0
+                parts = []
+                for p in probs:
+                    parts.extend([p, blank])
+                line_probs.append(np.concatenate(parts[:-1], axis=0))
+            return decode_plate_lines(line_probs)
+        except Exception as e:
+            log.warning("⚠️ Grammar decoding error: %s", e)
+            return None
+    
+    def _sort_ocr_results_top_to_bottom(self, ocr_output: List[Any]) -> List[Any]:
+        """Sắp xếp kết quả OCR từ trên xuống dưới, trái qua phải (xem sort_ocr_output)"""
+        return sort_ocr_output(ocr_output)
     
 
-    def _process_ocr_result(self, ocr_output: List[Any], preprocessed: np.ndarray, method: str, intermediates: Dict[str, np.ndarray]) -> Tuple[Optional[Dict[str, Any]], float]:
+    def _process_ocr_result(self, ocr_output: List[Any], preprocessed: np.ndarray, method: str) -> Tuple[Optional[OCRReading], float]:
         """
-        Xử lý kết quả raw từ EasyOCR -> plate_info
+        Xử lý kết quả raw từ EasyOCR -> OCRReading
         """
         if len(ocr_output) == 0:
             return None, 0.0
@@ -89,164 +397,188 @@ class LicensePlateOCR:
         text_lines = [item[1] for item in ocr_output]
         confidences = [item[2] for item in ocr_output]
         avg_conf = sum(confidences) / len(confidences) if confidences else 0.0
+        decoder = 'greedy'
+        
+        # Nếu chuỗi greedy chưa đúng ngữ pháp -> giải mã lại từ xác suất ký tự
+        if self.use_grammar_decoding and not is_plate_text(text_lines):
+            decoded = self._decode_with_grammar(preprocessed, ocr_output)
+            if decoded is not None:
+                text_lines, avg_conf = decoded
+                decoder = 'grammar'
         
-        # Phân loại loại xe
-        vehicle_type = classify_vehicle(text_lines)
-        
-        # Kiểm tra xe máy 50cc
-        is_50cc = False
-        if vehicle_type == "XE MÁY":
-            line1 = text_lines[0]
-            line1_clean = re.sub(r'[^A-Z0-9]', '', line1.upper())
-            if len(line1_clean) >= 4 and not line1_clean[-1].isdigit():
-                is_50cc = True
-        
-        # Ghép và sửa lỗi
-        raw_text = "".join(text_lines)
-        clean_text = fix_plate_chars(raw_text, is_50cc=is_50cc)
-        formatted_text = format_plate(clean_text, vehicle_type)
-        
-        plate_info = {
-            'raw_text': raw_text,
-            'vehicle_type': vehicle_type,
-            'clean_text': clean_text,
-            'formatted_text': formatted_text,
-            'is_50cc': is_50cc,
-            'ocr_lines': text_lines,
-            'preprocessed_image': preprocessed,
-            'preprocessing_method': method,
-            'intermediate_images': intermediates,
-            'confidence': avg_conf
-        }
+        # Phân loại loại xe, sửa lỗi ký tự, format
+        vehicle_type, is_50cc, raw_text, clean_text, formatted_text = postprocess_lines(text_lines)
+        
+        plate_info = OCRReading(
+            raw_text=raw_text,
+            vehicle_type=vehicle_type,
+            clean_text=clean_text,
+            formatted_text=formatted_text,
+            is_50cc=is_50cc,
+            ocr_lines=text_lines,
+            method=method,
+            confidence=avg_conf,
+            decoder=decoder,
+            # Ảnh tiền xử lý chỉ giữ khi cần lưu ROI/debug
+            preprocessed=preprocessed if retention_at_least(self.retention, RETENTION_ROI) else None,
+            # Kết quả thô chỉ giữ khi ghi raw OCR (rescore.py chạy lại luật trên đó)
+            raw_output=ocr_output if self.raw_recorder is not None else None,
+        )
         
         return plate_info, avg_conf
 
-    def process_plate(self, roi: np.ndarray, apply_warping: bool = True) -> Optional[Dict[str, Any]]:
+    def _ocr_variant(self, image: np.ndarray, method: str) -> Tuple[Optional[OCRReading], float]:
+        """
+        OCR một biến thể: thử đường nhanh (tách dòng, không chạy CRAFT) trước,
+        fallback về đường đầy đủ (detection + recognition)
+        """
+        plate_info, conf = None, 0.0
+        if self.use_fast_line_split:
+            ocr_output = self.read_text_fast(image)
+            if ocr_output:
+                plate_info, conf = self._process_ocr_result(ocr_output, image, method)
+        
+        if not self.is_valid_plate(plate_info):
+            ocr_output = self.read_text(image, detail=1)
+            plate_info, conf = self._process_ocr_result(ocr_output, image, method)
+        
+        return plate_info, conf
+
+    def process_plates(self, rois: List[np.ndarray], apply_warping: bool = True) -> List[Optional[OCRReading]]:
+        """
+        Xử lý nhiều ROI (của một ảnh hoặc cả batch ảnh)
+        
+        OCR theo từng lượt biến thể: lượt k xử lý biến thể thứ k của mọi ROI chưa dừng sớm.
+        Trong mỗi lượt, ROI không đọc được bằng đường nhanh được gom batch theo shape bucket
+        cho đường đầy đủ. Kết quả giống hệt gọi process_plate cho từng ROI.
+        
+        Returns:
+            List OCRReading (hoặc None) theo thứ tự rois
+        """
+        variant_lists = [preprocess_for_ocr(roi, apply_warping=apply_warping) for roi in rois]
+        variant_results: List[Dict[int, Tuple[Optional[OCRReading], float]]] = [{} for _ in rois]
+        active = [i for i, variants in enumerate(variant_lists) if variants]
+        
+        index = 0
+        while active:
+            with span('ocr.variant_round', index=index, rois=len(active)):
+                # Đường nhanh cho từng ROI
+                pending = []
+                for i in active:
+                    image, method = variant_lists[i][index]
+                    if self.use_fast_line_split:
+                        ocr_output = self.read_text_fast(image)
+                        if ocr_output:
+                            plate_info, conf = self._process_ocr_result(ocr_output, image, method)
+                            if self.is_valid_plate(plate_info):
+                                variant_results[i][index] = (plate_info, conf)
+                                continue
+                    pending.append(i)
+                
+                # Đường đầy đủ, gom batch theo shape bucket
+                if pending:
+                    outputs = self.read_text_batch([variant_lists[i][index][0] for i in pending])
+                    for i, ocr_output in zip(pending, outputs):
+                        image, method = variant_lists[i][index]
+                        variant_results[i][index] = self._process_ocr_result(ocr_output, image, method)
+            
+            # ROI dừng sớm hoặc hết biến thể không vào lượt sau (cùng điều kiện với process_plate)
+            index += 1
+            active = [i for i in active
+                      if not self._is_early_exit(*variant_results[i][index - 1]) and index < len(variant_lists[i])]
+        
+        return [
+            self.process_plate(roi, apply_warping=apply_warping, variants=variants, variant_results=results)
+            for roi, variants, results in zip(rois, variant_lists, variant_results)
+        ]
+
+    def _is_early_exit(self, plate_info: Optional[OCRReading], conf: float) -> bool:
+        """Kết quả đủ tốt để không thử các biến thể sau"""
+        return self.is_valid_plate(plate_info) and conf > EARLY_EXIT_CONFIDENCE
+
+    def process_plate(self, roi: np.ndarray, apply_warping: bool = True,
+                      variants: Optional[List[Tuple[np.ndarray, str]]] = None,
+                      variant_results: Optional[Dict[int, Tuple[Optional[OCRReading], float]]] = None
+                      ) -> Optional[OCRReading]:
         """
         Xử lý và nhận diện biển số từ ROI
         Chiến lược: Multi-Hypothesis (Thử nhiều cách tiền xử lý và chọn kết quả tốt nhất)
+        
+        Args:
+            roi: Ảnh vùng biển số
+            apply_warping: Có áp dụng warping hay không
+            variants: Các biến thể đã tiền xử lý sẵn (nếu None sẽ tự tính)
+            variant_results: Kết quả OCR đã có theo thứ tự biến thể (từ process_plates)
         """
         # Lấy danh sách các phiên bản ảnh đã tiền xử lý
-        variants = preprocess_for_ocr(roi, apply_warping=apply_warping)
+        if variants is None:
+            variants = preprocess_for_ocr(roi, apply_warping=apply_warping)
         
         candidates = []
-        all_intermediates = {}  # Collect all intermediate images
+        # Kết quả cuối của từng biến thể (kể cả không hợp lệ) để ghi raw OCR
+        attempts = [] if self.raw_recorder is not None else None
+        # Các biến thể đã thử chỉ giữ lại ở mức 'debug' (mỗi biến thể là 1 mảng ảnh)
+        all_intermediates = {} if retention_at_least(self.retention, RETENTION_DEBUG) else None
         
-        for image, method in variants:
-            # Lưu tất cả intermediate images
-            all_intermediates[method] = image
-            
-            # OCR
-            ocr_output = self.read_text(image, detail=1)
+        best_result = None
+        tried = 0
+        for index, (image, method) in enumerate(variants):
+            tried += 1
+            if all_intermediates is not None:
+                all_intermediates[method] = image
             
-            # Xử lý kết quả
-            plate_info, conf = self._process_ocr_result(ocr_output, image, method, all_intermediates)
+            if variant_results is not None and index in variant_results:
+                plate_info, conf = variant_results[index]
+            else:
+                with span('ocr.variant', method=method):
+                    plate_info, conf = self._ocr_variant(image, method)
+            if attempts is not None:
+                attempts.append((method, plate_info))
             
             if plate_info and self.is_valid_plate(plate_info):
-                # Ensure all intermediates are included
-                plate_info['intermediate_images'] = all_intermediates
+                plate_info.intermediates = all_intermediates
                 candidates.append(plate_info)
                 
                 # --- EARLY EXIT (Dừng sớm) ---
                 # Nếu độ tin cậy cao (> 0.8), chấp nhận ngay và không thử các phương pháp khác
-                if conf > 0.8:
-                    print(f"⚡ Early exit with '{method}' ({conf:.2f})")
-                    return plate_info
-                
+                if self._is_early_exit(plate_info, conf):
+                    log.debug("⚡ Early exit with '%s' (%.2f)", method, conf)
+                    OCR_EARLY_EXIT.inc(method=method)
+                    best_result = plate_info
+                    break
+        
         # Chọn kết quả tốt nhất với SMART RANKING
-        if not candidates:
-            return None
+        # Smart ranking: Ưu tiên warped methods và binary images (calculate_smart_score)
+        if best_result is None and candidates:
+            # Sort by smart score (descending)
+            candidates.sort(key=calculate_smart_score, reverse=True)
             
-        # Smart ranking: Ưu tiên warped methods và binary images
-        def calculate_smart_score(candidate):
-            """
-            CẢI TIẾN: Tính điểm thông minh cho candidate với xác thực chất lượng
+            best_result = candidates[0]
             
-            Ưu tiên:
-            1. Điểm tin cậy (quan trọng nhất)
-            2. Độ hoàn chỉnh văn bản (phạt văn bản bị cắt)
-            3. Điểm thưởng phương pháp (vừa phải)
-            """
-            method = candidate['preprocessing_method']
-            confidence = candidate['confidence']
-            raw_text = candidate.get('raw_text', '')
-            clean_text = candidate.get('clean_text', '')
-            
-            # Điểm cơ bản = confidence (0.0-1.0)
-            score = confidence
-            
-            # KIỂM TRA CHẤT LƯỢNG
-            # 1. Kiểm tra độ hoàn chỉnh văn bản
-            if len(clean_text) < 6:  # Quá ngắn (phát hiện không đầy đủ)
-                score -= 0.2  # Phạt nặng
-            elif len(clean_text) < 8:  # Có thể không đầy đủ
-                score -= 0.1  # Phạt vừa
-                
-            # 2. Kiểm tra ngưỡng tin cậy
-            if confidence < 0.2:  # Tin cậy rất thấp
-                score -= 0.15  # Phạt bổ sung
-            elif confidence < 0.3:  # Tin cậy thấp
-                score -= 0.05  # Phạt nhỏ
-                
-            # ĐIỂM THƯỞNG PHƯƠNG PHÁP (GIẢM - bảo thủ hơn)
-            # Điểm thưởng vừa cho phương pháp warped (chỉ khi tin cậy tốt VÀ văn bản đầy đủ)
-            if ('warped' in method.lower() and confidence > 0.25 and len(clean_text) >= 7):
-                score += 0.08  # Giảm từ 0.15 xuống 0.08
-            # Phạt cho phương pháp warped với kết quả kém
-            elif 'warped' in method.lower() and (confidence < 0.3 or len(clean_text) < 6):
-                score -= 0.1  # Phạt cho warping kém
+            # Enhanced debug log (chỉ tính điểm khi bật DEBUG)
+            if log.isEnabledFor(logging.DEBUG):
+                smart_score = calculate_smart_score(best_result)
+                log.debug("Selected '%s' (conf: %.2f, smart_score: %.2f) from %d candidates.",
+                          best_result.method, best_result.confidence, smart_score, len(candidates))
                 
-            # Điểm thưởng vừa cho phương pháp binary
-            if 'otsu' in method.lower():
-                score += 0.08  # Giảm từ 0.15 xuống 0.08
-                
-            # Điểm thưởng nhỏ kết hợp (chỉ khi cả tin cậy và độ dài văn bản tốt)
-            if ('warped' in method.lower() and 'otsu' in method.lower() and 
-                confidence > 0.25 and len(clean_text) >= 7):
-                score += 0.05  # Giảm từ 0.10 xuống 0.05
-                
-            # Phạt nhỏ cho grayscale thuần (không otsu)
-            if 'gray' in method.lower() and 'otsu' not in method.lower() and 'clahe' not in method.lower():
-                score -= 0.02  # Giảm phạt
-                
-            return score
-        
-        # Sort by smart score (descending)
-        candidates.sort(key=calculate_smart_score, reverse=True)
+                # Show all candidates for debugging
+                if len(candidates) > 1:
+                    log.debug("📊 All candidates:")
+                    for i, candidate in enumerate(candidates[:3]):  # Show top 3
+                        c_score = calculate_smart_score(candidate)
+                        log.debug("  %d. %s: conf=%.2f, smart_score=%.2f",
+                                  i + 1, candidate.method, candidate.confidence, c_score)
         
-        best_result = candidates[0]
-        # Ensure all intermediates are included in final result
-        best_result['intermediate_images'] = all_intermediates
-        
-        # Enhanced debug log
-        smart_score = calculate_smart_score(best_result)
-        print(f"Selected '{best_result['preprocessing_method']}' (conf: {best_result['confidence']:.2f}, smart_score: {smart_score:.2f}) from {len(candidates)} candidates.")
-        
-        # Show all candidates for debugging
-        if len(candidates) > 1:
-            print("📊 All candidates:")
-            for i, candidate in enumerate(candidates[:3]):  # Show top 3
-                c_score = calculate_smart_score(candidate)
-                print(f"  {i+1}. {candidate['preprocessing_method']}: conf={candidate['confidence']:.2f}, smart_score={c_score:.2f}")
-            
+        OCR_VARIANTS_PER_PLATE.observe(tried)
+        OCR_PLATES.inc(result='read' if best_result is not None else 'unread')
+        if best_result is not None:
+            OCR_SELECTED.inc(method=best_result.method)
+        if attempts is not None:
+            self.raw_recorder.record(attempts, best_result)
         return best_result
     
-    def is_valid_plate(self, plate_info: Optional[Dict[str, Any]]) -> bool:
+    def is_valid_plate(self, plate_info: Optional[OCRReading]) -> bool:
         """
-        Kiểm tra biển số có hợp lệ không
+        Kiểm tra biển số có hợp lệ không (xem is_valid_reading)
         """
-        if plate_info is None:
-            return False
-        
-        formatted_text = plate_info.get('formatted_text', '')
-        
-        # Kiểm tra độ dài tối thiểu
-        if len(formatted_text) <= 5:
-            return False
-        
-        # Kiểm tra loại xe
-        vehicle_type = plate_info.get('vehicle_type', '')
-        if vehicle_type == "KHÔNG RÕ":
-            return False
-            
-        return True
+        return is_valid_reading(plate_info)
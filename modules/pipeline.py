@@ -0,0 +1,375 @@
+"""
+Module pipeline xử lý ảnh theo từng giai đoạn (producer/consumer)
+decode -> detect -> OCR -> render -> persist, nối với nhau bằng queue có giới hạn
+để I/O (đọc/ghi ảnh) chạy chồng lên inference thay vì chạy tuần tự
+"""
+
+import logging
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from .config import PIPELINE_QUEUE_SIZE, PIPELINE_WORKERS, RESULT_RETENTION
+from .image_io import DecodedImage
+from .metrics import STAGE_SECONDS, STAGE_ERRORS, QUEUE_DEPTH
+from .diagnostics import span
+from .results import OCRReading, PlateResult, RETENTION_NONE
+
+log = logging.getLogger(__name__)
+
+# Tín hiệu kết thúc luồng dữ liệu
+_SENTINEL = object()
+
+
+def recognize_plates(detector, ocr, image_np: np.ndarray, plate_regions: List[Tuple[np.ndarray, Tuple[int, int, int, int]]],
+                     decoded: Optional[DecodedImage] = None,
+                     plate_infos: Optional[List[Optional[OCRReading]]] = None,
+                     retention: str = RESULT_RETENTION) -> Tuple[List[str], List[PlateResult]]:
+    """
+    OCR các vùng biển số của một ảnh và chuẩn bị kết quả cho UI / History
+
+    Args:
+        detector: LicensePlateDetector (dùng cho cascade khi OCR thất bại)
+        ocr: LicensePlateOCR
+        image_np: Ảnh đưa vào detector (numpy RGB)
+        plate_regions: List (roi, bbox) từ detector.get_plate_regions
+        decoded: DecodedImage nếu image_np là preview giảm độ phân giải
+                 (ROI của cascade sẽ được cắt lại từ ảnh gốc)
+        plate_infos: Kết quả ocr.process_plates đã có sẵn (vd. OCR gom batch nhiều ảnh),
+                     None = tự OCR các ROI
+        retention: Mức giữ ảnh trung gian trong PlateResult ('none' / 'roi' / 'debug')
+
+    Returns:
+        tuple: (detected_plates_list, detections)
+    """
+    valid_plates = []
+
+    # Bước 1: Thu thập tất cả các biển số hợp lệ
+    # OCR và xử lý biển số (với warping), gom batch các ROI cùng shape
+    if plate_infos is None:
+        rois = [roi for roi, _ in plate_regions]
+        plate_infos = ocr.process_plates(rois, apply_warping=True)
+
+    for (roi, bbox), plate_info in zip(plate_regions, plate_infos):
+        # Cascade: OCR thất bại -> chạy lại model nặng quanh vùng này
+        if not ocr.is_valid_plate(plate_info) and detector.cascade:
+            refined = detector.refine_region(image_np, bbox)
+            if refined is not None:
+                roi, bbox = refined
+                if decoded is not None and decoded.is_reduced:
+                    roi = decoded.crop_full_res([bbox])[0]
+                plate_info = ocr.process_plate(roi, apply_warping=True)
+
+        if plate_info and ocr.is_valid_plate(plate_info):
+            valid_plates.append((plate_info, bbox, roi))
+
+    # Bước 2: Format kết quả và thêm vào danh sách detections
+    num_plates = len(valid_plates)
+    detected_plates = []
+    detections = []
+
+    for i, (plate_info, bbox, roi) in enumerate(valid_plates):
+        vehicle_type = plate_info.vehicle_type
+        formatted_text = plate_info.formatted_text
+
+        # Chuẩn bị text cho UI
+        prefix = f"#{i+1} " if num_plates > 1 else ""
+        detected_plates.append(f"{prefix}[{vehicle_type}] {formatted_text}")
+
+        # Thêm vào danh sách detection để vẽ
+        detections.append(PlateResult.from_reading(plate_info, bbox, roi, retention=retention))
+
+    return detected_plates, detections
+
+
+@dataclass
+class PipelineItem:
+    """
+    Một ảnh đi qua pipeline. Mỗi giai đoạn đọc/ghi các trường tương ứng.
+    """
+    index: int
+    file_path: str
+    decoded: Optional[DecodedImage] = None
+    image_pil: Optional[Image.Image] = None
+    image_np: Optional[np.ndarray] = None
+    plate_regions: List[Any] = field(default_factory=list)
+    plates: List[str] = field(default_factory=list)
+    detections: List[PlateResult] = field(default_factory=list)
+    result_pil: Optional[Image.Image] = None
+    history_dir: Optional[str] = None
+    watch_matches: List[Any] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+    error: Optional[BaseException] = None
+
+    @property
+    def stt(self) -> int:
+        """Số thứ tự hiển thị (bắt đầu từ 1)"""
+        return self.index + 1
+
+
+class Stage:
+    """
+    Một giai đoạn của pipeline: N worker thread đọc từ queue vào, ghi ra queue kế tiếp
+    """
+
+    def __init__(self, name: str, func: Callable[[PipelineItem], None], workers: int = 1):
+        """
+        Args:
+            name: Tên giai đoạn (dùng cho metrics và timings)
+            func: Hàm xử lý item tại chỗ (in-place)
+            workers: Số worker thread của giai đoạn
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.in_queue: Optional[queue.Queue] = None
+        self.out_queue: Optional[queue.Queue] = None
+        self.next_stage: Optional['Stage'] = None
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._alive = 0
+        # Metrics
+        self.processed = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.max_depth = 0
+
+    def start(self):
+        """Khởi động các worker thread"""
+        self._alive = self.workers
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"pipeline-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        """Chờ các worker kết thúc"""
+        for thread in self._threads:
+            thread.join()
+
+    def _sample_depth(self):
+        depth = self.in_queue.qsize()
+        with self._lock:
+            self.depth_samples += 1
+            self.depth_total += depth
+            self.max_depth = max(self.max_depth, depth)
+        QUEUE_DEPTH.set(depth, stage=self.name)
+
+    def _run(self):
+        while True:
+            self._sample_depth()
+            item = self.in_queue.get()
+            if item is _SENTINEL:
+                with self._lock:
+                    self._alive -= 1
+                    last_worker = self._alive == 0
+                # Worker cuối cùng báo cho giai đoạn sau (mỗi worker 1 tín hiệu)
+                if last_worker and self.out_queue is not None:
+                    receivers = self.next_stage.workers if self.next_stage is not None else 1
+                    for _ in range(receivers):
+                        self.out_queue.put(_SENTINEL)
+                return
+
+            # Item đã lỗi ở giai đoạn trước -> chỉ chuyển tiếp
+            if item.error is None:
+                start = time.perf_counter()
+                try:
+                    with span(self.name, 'pipeline', image=item.stt):
+                        self.func(item)
+                except Exception as e:
+                    item.error = e
+                    with self._lock:
+                        self.errors += 1
+                    STAGE_ERRORS.inc(stage=self.name)
+                    log.error("❌ Lỗi giai đoạn '%s' (ảnh #%d): %s", self.name, item.stt, e, exc_info=True)
+                elapsed = time.perf_counter() - start
+                item.timings[self.name] = elapsed
+                STAGE_SECONDS.observe(elapsed, stage=self.name)
+                with self._lock:
+                    self.processed += 1
+                    self.busy_seconds += elapsed
+
+            if self.out_queue is not None:
+                self.out_queue.put(item)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Metrics của giai đoạn"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'processed': self.processed,
+                'errors': self.errors,
+                'busy_seconds': self.busy_seconds,
+                'avg_latency': self.busy_seconds / self.processed if self.processed else 0.0,
+                'queue_depth': self.in_queue.qsize() if self.in_queue is not None else 0,
+                'max_queue_depth': self.max_depth,
+                'avg_queue_depth': self.depth_total / self.depth_samples if self.depth_samples else 0.0
+            }
+
+
+class Pipeline:
+    """
+    Chuỗi các Stage nối bằng queue có giới hạn (bounded queue)
+
+    Queue có giới hạn tạo back-pressure: giai đoạn nhanh (decode) không thể
+    đọc trước quá nhiều ảnh vào RAM khi giai đoạn chậm (OCR) chưa xử lý kịp.
+    """
+
+    def __init__(self, stages: List[Stage], on_result: Optional[Callable[[PipelineItem], None]] = None,
+                 queue_size: int = PIPELINE_QUEUE_SIZE):
+        """
+        Args:
+            stages: Các giai đoạn theo thứ tự
+            on_result: Callback nhận item sau giai đoạn cuối (chạy trên thread của pipeline)
+            queue_size: Kích thước tối đa của mỗi queue giữa các giai đoạn
+        """
+        self.stages = stages
+        self.on_result = on_result
+        self._results: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._collector: Optional[threading.Thread] = None
+        self._started = False
+
+        for stage in stages:
+            stage.in_queue = queue.Queue(maxsize=queue_size)
+        for i, stage in enumerate(stages):
+            if i + 1 < len(stages):
+                stage.next_stage = stages[i + 1]
+                stage.out_queue = stages[i + 1].in_queue
+            else:
+                stage.out_queue = self._results
+
+    def start(self):
+        """Khởi động tất cả giai đoạn"""
+        if self._started:
+            return
+        self._started = True
+        for stage in self.stages:
+            stage.start()
+        self._collector = threading.Thread(target=self._collect, name="pipeline-collector", daemon=True)
+        self._collector.start()
+
+    def _collect(self):
+        while True:
+            item = self._results.get()
+            if item is _SENTINEL:
+                return
+            if self.on_result is not None:
+                try:
+                    self.on_result(item)
+                except Exception as e:
+                    log.error("❌ Lỗi callback kết quả (ảnh #%d): %s", item.stt, e, exc_info=True)
+
+    def submit(self, item: PipelineItem):
+        """Đưa một item vào pipeline (block nếu queue đầu vào đầy)"""
+        self.start()
+        self.stages[0].in_queue.put(item)
+
+    def close(self):
+        """Báo hết dữ liệu đầu vào"""
+        self.start()
+        for _ in range(self.stages[0].workers):
+            self.stages[0].in_queue.put(_SENTINEL)
+
+    def join(self):
+        """Chờ toàn bộ item được xử lý xong"""
+        for stage in self.stages:
+            stage.join()
+        if self._collector is not None:
+            self._collector.join()
+
+    def run(self, file_paths: List[str]):
+        """Xử lý một danh sách file: submit tất cả, đóng đầu vào và chờ xong"""
+        for index, file_path in enumerate(file_paths):
+            self.submit(PipelineItem(index=index, file_path=file_path))
+        self.close()
+        self.join()
+
+    def get_metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Metrics theo từng giai đoạn (processed, latency, queue depth, ...)"""
+        return {stage.name: stage.get_metrics() for stage in self.stages}
+
+    def print_metrics(self):
+        """In bảng metrics của các giai đoạn"""
+        print("PIPELINE:")
+        for name, m in self.get_metrics().items():
+            print(f"   • {name:<8} x{m['workers']}: {m['processed']} ảnh, "
+                  f"TB {m['avg_latency'] * 1000:.0f}ms/ảnh, "
+                  f"queue TB {m['avg_queue_depth']:.1f} / max {m['max_queue_depth']}, "
+                  f"lỗi {m['errors']}")
+
+
+def build_recognition_pipeline(detector, ocr, logger=None, on_result: Optional[Callable[[PipelineItem], None]] = None,
+                               workers: Optional[Dict[str, int]] = None,
+                               queue_size: int = PIPELINE_QUEUE_SIZE, retention: Optional[str] = None,
+                               watchlist=None) -> Pipeline:
+    """
+    Tạo pipeline nhận diện chuẩn: decode -> detect -> ocr -> render -> persist
+
+    Args:
+        detector: LicensePlateDetector
+        ocr: LicensePlateOCR
+        logger: HistoryLogger (None = không lưu lịch sử)
+        on_result: Callback nhận PipelineItem đã xử lý xong
+        workers: Số worker cho từng giai đoạn (mặc định PIPELINE_WORKERS)
+        queue_size: Kích thước queue giữa các giai đoạn
+        retention: Mức giữ ảnh trung gian (None = theo mức lưu của logger, 'none' khi không lưu History)
+        watchlist: Watchlist tra từng biển số ngay sau OCR (None = không tra)
+
+    Returns:
+        Pipeline (chưa start, tự start khi submit)
+    """
+    counts = dict(PIPELINE_WORKERS)
+    if workers:
+        counts.update(workers)
+    if retention is None:
+        retention = logger.required_retention if logger is not None else RETENTION_NONE
+
+    def decode(item: PipelineItem):
+        # Preview giảm độ phân giải (đã xoay EXIF) cho detect / vẽ / thumbnail
+        item.decoded = DecodedImage(item.file_path)
+        item.image_pil = item.decoded.preview
+        item.image_np = item.decoded.preview_array()
+
+    def detect(item: PipelineItem):
+        regions = detector.get_plate_regions(item.image_np, image_index=item.stt)
+        # ROI cho OCR được cắt từ ảnh gốc full-resolution (bbox giữ tọa độ preview)
+        if item.decoded is not None and item.decoded.is_reduced and regions:
+            crops = item.decoded.crop_full_res([bbox for _, bbox in regions])
+            regions = [(crop, bbox) for crop, (_, bbox) in zip(crops, regions)]
+        item.plate_regions = regions
+
+    def recognize(item: PipelineItem):
+        # Ghi raw OCR (nếu bật) kèm đường dẫn ảnh nguồn
+        recorder = ocr.raw_recorder
+        with recorder.source(item.file_path) if recorder is not None else nullcontext():
+            item.plates, item.detections = recognize_plates(detector, ocr, item.image_np, item.plate_regions,
+                                                            decoded=item.decoded, retention=retention)
+        item.plate_regions = []
+        if watchlist is not None and item.detections:
+            item.watch_matches = watchlist.check_plates(item.detections, source=item.file_path)
+
+    def render(item: PipelineItem):
+        item.result_pil = Image.fromarray(detector.draw_detections(item.image_np, item.detections))
+
+    def persist(item: PipelineItem):
+        if logger is not None:
+            item.history_dir = logger.save_result(item.file_path, item.image_pil, item.detections,
+                                                  processed_image_pil=item.result_pil)
+        # Ảnh trung gian đã ghi xong (hoặc không cần ghi) -> giải phóng trước khi trả kết quả
+        for det in item.detections:
+            det.release_images()
+
+    stages = [
+        Stage('decode', decode, counts.get('decode', 1)),
+        Stage('detect', detect, counts.get('detect', 1)),
+        Stage('ocr', recognize, counts.get('ocr', 1)),
+        Stage('render', render, counts.get('render', 1)),
+        Stage('persist', persist, counts.get('persist', 1)),
+    ]
+    return Pipeline(stages, on_result=on_result, queue_size=queue_size)
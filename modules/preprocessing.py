@@ -3,15 +3,32 @@ Module tiền xử lý ảnh cho nhận diện biển số xe
 Bao gồm: Grayscale conversion, Warping (nắn thẳng), và các kỹ thuật nâng cao
 """
 
+import logging
 import cv2
 import numpy as np
-from typing import List, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 from .config import (
     CLAHE_CLIP_LIMIT, 
     CLAHE_TILE_GRID_SIZE, 
     UPSCALE_SCALE, 
-    WARP_PADDING
+    WARP_PADDING,
+    WARP_SKEW_GATE,
+    WARP_SKEW_THRESHOLD_DEG,
+    WARP_PERSPECTIVE_THRESHOLD,
+    WARP_DOMINANT_CONTOUR_RATIO,
+    OCR_NORMALIZE_ROI,
+    OCR_HEIGHT_BUCKETS,
+    OCR_WIDTH_STEP,
+    OCR_MAX_ASPECT_RATIO,
+    LINE_SPLIT_MIN_INK,
+    LINE_SPLIT_BORDER_INK,
+    LINE_SPLIT_MIN_LINE_RATIO,
+    LINE_SPLIT_MAX_HEIGHT_RATIO,
+    LINE_SPLIT_MARGIN
 )
+from .diagnostics import span
+
+log = logging.getLogger(__name__)
 
 
 def order_points(pts: np.ndarray) -> np.ndarray:
@@ -67,12 +84,12 @@ def four_point_transform(image: np.ndarray, pts: np.ndarray) -> np.ndarray:
         
         # Minimum size validation
         if maxWidth < 10 or maxHeight < 10:
-            print(f"⚠️ Warped size too small: {maxWidth}x{maxHeight}")
+            log.debug("⚠️ Warped size too small: %dx%d", maxWidth, maxHeight)
             return image
         
         # Maximum size validation (prevent memory issues)
         if maxWidth > 2000 or maxHeight > 2000:
-            print(f"⚠️ Warped size too large: {maxWidth}x{maxHeight}")
+            log.debug("⚠️ Warped size too large: %dx%d", maxWidth, maxHeight)
             return image
         
         # Tạo điểm đích cho perspective transform
@@ -89,7 +106,7 @@ def four_point_transform(image: np.ndarray, pts: np.ndarray) -> np.ndarray:
         
         return warped
     except Exception as e:
-        print(f"⚠️ Four point transform error: {e}")
+        log.debug("⚠️ Four point transform error: %s", e)
         return image
 
 
@@ -147,6 +164,222 @@ def apply_super_resolution(image: np.ndarray, scale: int = UPSCALE_SCALE) -> np.
     return image
 
 
+def normalize_roi_size(image: np.ndarray,
+                       height_buckets: Sequence[int] = OCR_HEIGHT_BUCKETS,
+                       width_step: int = OCR_WIDTH_STEP) -> np.ndarray:
+    """
+    Chuẩn hóa kích thước ROI về một tập nhỏ các shape cố định (size buckets)
+    
+    - Chiều cao: resize (giữ tỉ lệ) về chiều cao chuẩn gần nhất trong height_buckets
+      (ROI nhỏ được phóng to như apply_super_resolution, ROI lớn được thu nhỏ)
+    - ROI quá dài (vượt OCR_MAX_ASPECT_RATIO): thu nhỏ giữ tỉ lệ cho vừa chiều rộng tối đa
+      rồi pad chiều cao, không kéo giãn ký tự
+    - Chiều rộng: pad lên bội số của width_step
+    
+    Pad bằng 1 màu cố định (trung vị viền ROI, gần màu nền biển) thay vì lặp lại mép ảnh
+    để ký tự sát mép không bị kéo thành vệt.
+    
+    Nhờ vậy chi phí OCR dự đoán được và các ROI cùng shape có thể gom batch.
+    
+    Args:
+        image: Ảnh ROI (numpy array)
+        height_buckets: Các chiều cao chuẩn
+        width_step: Bước làm tròn chiều rộng
+        
+    Returns:
+        Ảnh đã chuẩn hóa kích thước
+    """
+    h, w = image.shape[:2]
+    if h == 0 or w == 0:
+        return image
+    
+    bucket_h = min(height_buckets, key=lambda b: abs(b - h))
+    max_w = int(bucket_h * OCR_MAX_ASPECT_RATIO)
+    scale = min(bucket_h / float(h), max_w / float(w))
+    target_h = max(1, min(bucket_h, int(round(h * scale))))
+    target_w = max(1, min(max_w, int(round(w * scale))))
+    
+    if (target_h, target_w) != (h, w):
+        interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_CUBIC
+        image = cv2.resize(image, (target_w, target_h), interpolation=interpolation)
+    
+    padded_w = max(width_step, int(np.ceil(target_w / float(width_step))) * width_step)
+    pad_h = bucket_h - target_h
+    if padded_w != target_w or pad_h:
+        image = cv2.copyMakeBorder(image, pad_h // 2, pad_h - pad_h // 2, 0, padded_w - target_w,
+                                   cv2.BORDER_CONSTANT, value=_border_color(image))
+    
+    return image
+
+
+def _border_color(image: np.ndarray):
+    """Màu trung vị của viền ảnh (dùng làm màu pad)"""
+    border = np.concatenate([image[0], image[-1], image[:, 0], image[:, -1]])
+    color = np.median(border.reshape(-1, image.shape[2] if image.ndim == 3 else 1), axis=0)
+    return [float(c) for c in np.atleast_1d(color)]
+
+
+def shape_bucket(image: np.ndarray) -> Tuple[int, int]:
+    """Khóa bucket (height, width) của một ảnh đã chuẩn hóa"""
+    return image.shape[0], image.shape[1]
+
+
+def group_by_shape_bucket(images: Sequence[np.ndarray]) -> Dict[Tuple[int, int], List[int]]:
+    """
+    Gom các ảnh cùng shape để xử lý theo batch
+    
+    Returns:
+        Dict bucket -> list chỉ số ảnh (giữ thứ tự xuất hiện)
+    """
+    groups: Dict[Tuple[int, int], List[int]] = {}
+    for i, image in enumerate(images):
+        groups.setdefault(shape_bucket(image), []).append(i)
+    return groups
+
+
+def split_text_lines(image: np.ndarray) -> Optional[List[Tuple[int, int]]]:
+    """
+    Tách các dòng text của biển số bằng horizontal projection profile
+    
+    Biển số Việt Nam chỉ có 1 hoặc 2 dòng, nên có thể tìm dòng bằng cách
+    đếm điểm chữ theo từng hàng trên ảnh nhị phân thay vì chạy text detection.
+    
+    Args:
+        image: Ảnh biển số (gray, màu hoặc nhị phân)
+        
+    Returns:
+        List (y1, y2) của từng dòng (trên -> dưới), hoặc None nếu profile không rõ ràng
+    """
+    if len(image.shape) == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image
+    
+    h, w = gray.shape[:2]
+    if h < 10 or w < 10:
+        return None
+    
+    # Nhị phân hóa, đảm bảo chữ = 1 (chữ tối trên nền sáng là đa số)
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    if binary.mean() > 0.5:
+        binary = 1 - binary
+    
+    # Bỏ 5% mỗi cạnh trái/phải để giảm ảnh hưởng của viền dọc
+    margin_x = w // 20
+    profile = binary[:, margin_x:w - margin_x].mean(axis=1)
+    # Làm mượt profile
+    profile = np.convolve(profile, np.ones(3) / 3.0, mode='same')
+    
+    is_text = (profile >= LINE_SPLIT_MIN_INK) & (profile <= LINE_SPLIT_BORDER_INK)
+    
+    # Tìm các đoạn hàng liên tiếp có chữ
+    runs = []
+    start = None
+    for y, flag in enumerate(is_text):
+        if flag and start is None:
+            start = y
+        elif not flag and start is not None:
+            runs.append((start, y))
+            start = None
+    if start is not None:
+        runs.append((start, h))
+    
+    min_line_h = LINE_SPLIT_MIN_LINE_RATIO * h
+    lines = [(y1, y2) for y1, y2 in runs if (y2 - y1) >= min_line_h]
+    
+    # Kiểm tra tính rõ ràng của profile
+    if len(lines) not in (1, 2):
+        return None
+    # Không có khoảng trống nào giữa các dòng/viền -> nhiễu hoặc crop quá sát
+    if sum(y2 - y1 for y1, y2 in lines) > 0.9 * h:
+        return None
+    if len(lines) == 2:
+        h1 = lines[0][1] - lines[0][0]
+        h2 = lines[1][1] - lines[1][0]
+        if max(h1, h2) / float(min(h1, h2)) > LINE_SPLIT_MAX_HEIGHT_RATIO:
+            return None
+    
+    return [
+        (max(0, y1 - LINE_SPLIT_MARGIN), min(h, y2 + LINE_SPLIT_MARGIN))
+        for y1, y2 in lines
+    ]
+
+
+def _normalize_rect_angle(rect) -> float:
+    """Đưa góc của cv2.minAreaRect về khoảng [-45, 45] độ (không phụ thuộc phiên bản OpenCV)"""
+    (_, _), (rw, rh), angle = rect
+    if rw < rh:
+        angle -= 90
+    while angle <= -45:
+        angle += 90
+    while angle > 45:
+        angle -= 90
+    return angle
+
+
+def estimate_plate_distortion(roi: np.ndarray) -> Tuple[float, float]:
+    """
+    Ước lượng nhanh độ nghiêng và độ méo phối cảnh của biển số
+    
+    - Góc nghiêng: cv2.minAreaRect trên tập điểm chữ của ảnh nhị phân (Otsu)
+    - Méo phối cảnh: contour chính (viền biển số) lệch bao nhiêu so với
+      hình chữ nhật minAreaRect của nó (hình thang -> tỉ lệ lấp đầy thấp)
+    
+    Chỉ tốn 1 lần threshold + 1 lần findContours, rẻ hơn nhiều so với chuỗi warping.
+    
+    Args:
+        roi: Ảnh vùng biển số
+        
+    Returns:
+        (góc nghiêng tuyệt đối (độ), độ méo phối cảnh 0.0-1.0)
+    """
+    if len(roi.shape) == 3:
+        gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = roi
+    
+    h, w = gray.shape[:2]
+    if h < 10 or w < 10:
+        return 0.0, 0.0
+    
+    # Chữ = 255 (thường là phần thiểu số của ảnh)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    if cv2.countNonZero(binary) > 0.5 * h * w:
+        binary = cv2.bitwise_not(binary)
+    
+    # 1. Góc nghiêng của khối chữ
+    angle = 0.0
+    points = cv2.findNonZero(binary)
+    if points is not None and len(points) >= 10:
+        angle = abs(_normalize_rect_angle(cv2.minAreaRect(points)))
+    
+    # 2. Méo phối cảnh của contour chính (nền biển số)
+    perspective = 0.0
+    contours, _ = cv2.findContours(cv2.bitwise_not(binary), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if contours:
+        dominant = max(contours, key=cv2.contourArea)
+        area = cv2.contourArea(dominant)
+        if area >= WARP_DOMINANT_CONTOUR_RATIO * h * w:
+            rect = cv2.minAreaRect(dominant)
+            rect_area = rect[1][0] * rect[1][1]
+            if rect_area > 0:
+                perspective = max(0.0, 1.0 - area / rect_area)
+            angle = max(angle, abs(_normalize_rect_angle(rect)))
+    
+    return angle, perspective
+
+
+def needs_warping(roi: np.ndarray) -> bool:
+    """
+    Quyết định có cần chạy chuỗi warping (edge -> corner -> contour) hay không
+    
+    Returns:
+        True nếu độ nghiêng hoặc méo phối cảnh vượt ngưỡng trong config
+    """
+    angle, perspective = estimate_plate_distortion(roi)
+    return angle > WARP_SKEW_THRESHOLD_DEG or perspective > WARP_PERSPECTIVE_THRESHOLD
+
+
 def detect_and_warp_plate(roi: np.ndarray) -> Tuple[np.ndarray, str]:
     """
     ENHANCED: Tự động phát hiện góc biển số và nắn thẳng với thuật toán mạnh hơn
@@ -165,17 +398,20 @@ def detect_and_warp_plate(roi: np.ndarray) -> Tuple[np.ndarray, str]:
         Ảnh đã được nắn thẳng, hoặc ảnh gốc nếu không phát hiện được góc
     """
     # Phương pháp 1: Edge-based warping (HIỆU QUẢ NHẤT)
-    warped, method = edge_based_warping(roi)
+    with span('warp.edge'):
+        warped, method = edge_based_warping(roi)
     if method == "edge_warped":
         return warped, method
     
     # Phương pháp 2: Corner-based warping
-    warped, method = corner_based_warping(roi)
+    with span('warp.corner'):
+        warped, method = corner_based_warping(roi)
     if method == "corner_warped":
         return warped, method
     
     # Phương pháp 3: Improved contour-based (dự phòng)
-    warped, method = improved_contour_warping(roi)
+    with span('warp.contour'):
+        warped, method = improved_contour_warping(roi)
     if method == "contour_warped":
         return warped, method
     
@@ -478,7 +714,9 @@ def four_point_transform_enhanced(image: np.ndarray, pts: np.ndarray) -> np.ndar
     return warped
 
 
-def preprocess_for_ocr(roi: np.ndarray, apply_warping: bool = True) -> List[Tuple[np.ndarray, str]]:
+def preprocess_for_ocr(roi: np.ndarray, apply_warping: bool = True,
+                       normalize: bool = OCR_NORMALIZE_ROI,
+                       skew_gate: bool = WARP_SKEW_GATE) -> List[Tuple[np.ndarray, str]]:
     """
     Tiền xử lý ảnh ROI (Region of Interest) của biển số
     Trả về nhiều phiên bản xử lý khác nhau để OCR thử nghiệm.
@@ -486,18 +724,29 @@ def preprocess_for_ocr(roi: np.ndarray, apply_warping: bool = True) -> List[Tupl
     Args:
         roi: Ảnh vùng biển số (numpy array)
         apply_warping: Có áp dụng warping hay không
+        normalize: Chuẩn hóa kích thước ROI về size bucket trước khi xử lý
+        skew_gate: Bỏ qua warping nếu biển số gần như thẳng (needs_warping)
         
     Returns:
         List các tuple (image, method_name)
     """
     variants = []
     
-    # 1. Warped (Nếu được yêu cầu)
+    # 0. Chuẩn hóa kích thước (thu nhỏ ROI lớn, phóng to ROI nhỏ)
+    if normalize:
+        roi = normalize_roi_size(roi)
+    
+    # 1. Warped (Nếu được yêu cầu và biển số thực sự bị nghiêng/méo)
     warped_roi = None
     warped_method = None
+    if apply_warping and skew_gate and not needs_warping(roi):
+        apply_warping = False
     if apply_warping:
-        warped, method = detect_and_warp_plate(roi)
+        with span('warp'):
+            warped, method = detect_and_warp_plate(roi)
         if method != "original":  # Any successful warping method
+            if normalize:
+                warped = normalize_roi_size(warped)
             warped_roi = warped
             warped_method = method
             # Thêm bản Warped + Gray (Ưu tiên cao nhất)
@@ -0,0 +1,244 @@
+"""
+Module lưu kết quả thô của EasyOCR (box, text, confidence của từng biến thể tiền xử lý)
+để chạy lại hậu xử lý / xếp hạng mà không cần chạy lại model (xem rescore.py)
+- File segment .rawocr chỉ ghi thêm, mỗi process 1 file mỗi giờ: {RAW_OCR_DIR}/{YYYYmmdd_HH}_{pid}.rawocr
+- Mỗi bản ghi = 1 lần process_plate (1 ROI): MAGIC + độ dài + payload nhị phân (struct),
+  process bị kill giữa chừng chỉ để lại bản ghi dở ở cuối file (reader bỏ qua, writer cắt bỏ khi mở lại)
+- Khoảng 60-80 byte cho 1 biến thể 2 dòng (tọa độ box lưu int16, confidence float32)
+"""
+
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+from .config import RAW_OCR_DIR
+
+RAW_OCR_EXT = '.rawocr'
+
+# Khung bản ghi: MAGIC (4 byte) + độ dài payload (uint32)
+_MAGIC = b'ROC1'
+_FRAME = struct.Struct('<4sI')
+# Đầu payload: thời điểm (float64), thứ tự ROI trong ảnh (uint16), số biến thể (uint8)
+_RECORD = struct.Struct('<dHB')
+# Sau đầu payload (gom theo cột để giải mã bằng vài lần unpack):
+# - mỗi biến thể: decoder, số dòng, số box (3 x uint8)
+# - float32: confidence từng biến thể, rồi confidence từng box
+# - int16: tọa độ 4 điểm (x, y) từng box (pixel)
+# - 1 khối chuỗi UTF-8 nối bằng _SEP: nguồn, kết quả đã chọn, rồi mỗi biến thể: method, các dòng, text các box
+#   (giải mã greedy: các dòng trùng text các box nên bỏ trống)
+_SEP = '\x1f'
+_INT16_MIN, _INT16_MAX = -32768, 32767
+
+_DECODERS = ('greedy', 'grammar')
+
+
+@dataclass(slots=True)
+class RawVariant:
+    """Kết quả thô của EasyOCR cho 1 biến thể tiền xử lý"""
+    method: str
+    decoder: str                                    # 'greedy' / 'grammar'
+    confidence: float                               # Confidence sau giải mã (trung bình box hoặc grammar)
+    lines: List[str]                                # Các dòng text sau giải mã (= ocr_lines)
+    boxes: List[Tuple[list, str, float]]            # [[bbox 4 điểm, text, conf], ...] như EasyOCR
+
+
+@dataclass(slots=True)
+class RawRecord:
+    """1 lần OCR 1 ROI: mọi biến thể đã thử + kết quả đã chọn lúc ghi"""
+    time: float
+    source: str
+    index: int                                      # Thứ tự lần OCR trong ảnh nguồn
+    selected: str                                   # formatted_text đã chọn ("" = không đọc được)
+    variants: List[RawVariant]
+
+
+def _clamp(value) -> int:
+    return max(_INT16_MIN, min(_INT16_MAX, int(round(float(value)))))
+
+
+def encode_record(record: RawRecord) -> bytes:
+    """RawRecord -> payload nhị phân"""
+    variants = record.variants[:0xFF]
+    meta, confs, box_confs, coords = [], [], [], []
+    strings = [record.source, record.selected]
+    for variant in variants:
+        lines, boxes = variant.lines[:0xFF], variant.boxes[:0xFF]
+        # Greedy: các dòng chính là text các box (đã sắp xếp) -> không lưu lặp lại
+        if variant.decoder != 'grammar' and lines == [text for _, text, _ in boxes]:
+            lines = []
+        meta += [_DECODERS.index(variant.decoder) if variant.decoder in _DECODERS else 0, len(lines), len(boxes)]
+        confs.append(float(variant.confidence))
+        strings.append(variant.method)
+        strings.extend(lines)
+        for bbox, text, conf in boxes:
+            points = [_clamp(v) for point in list(bbox)[:4] for v in list(point)[:2]]
+            coords += points + [0] * (8 - len(points))
+            box_confs.append(float(conf))
+            strings.append(text)
+    n_floats = len(confs) + len(box_confs)
+    blob = _SEP.join(s.replace(_SEP, ' ') for s in strings).encode('utf-8')
+    return b''.join((
+        _RECORD.pack(record.time, min(record.index, 0xFFFF), len(variants)),
+        bytes(meta),
+        struct.pack(f'<{n_floats}f', *confs, *box_confs),
+        struct.pack(f'<{len(coords)}h', *coords),
+        blob,
+    ))
+
+
+def decode_record(payload: bytes) -> RawRecord:
+    """Payload nhị phân -> RawRecord"""
+    record_time, index, count = _RECORD.unpack_from(payload, 0)
+    offset = _RECORD.size
+    meta = payload[offset:offset + 3 * count]
+    offset += 3 * count
+    n_boxes = sum(meta[2::3])
+    floats = struct.unpack_from(f'<{count + n_boxes}f', payload, offset)
+    offset += 4 * (count + n_boxes)
+    coords = struct.unpack_from(f'<{8 * n_boxes}h', payload, offset)
+    offset += 16 * n_boxes
+    strings = payload[offset:].decode('utf-8', errors='replace').split(_SEP)
+
+    variants = []
+    s = 2
+    box = 0
+    for v in range(count):
+        decoder, lines_count, boxes_count = meta[3 * v:3 * v + 3]
+        method = strings[s]
+        lines = strings[s + 1:s + 1 + lines_count]
+        s += 1 + lines_count
+        boxes = []
+        for _ in range(boxes_count):
+            c = coords[8 * box:8 * box + 8]
+            bbox = [[c[0], c[1]], [c[2], c[3]], [c[4], c[5]], [c[6], c[7]]]
+            boxes.append((bbox, strings[s], floats[count + box]))
+            s += 1
+            box += 1
+        if not lines and boxes:
+            lines = [text for _, text, _ in boxes]
+        variants.append(RawVariant(method, _DECODERS[decoder], floats[v], lines, boxes))
+    return RawRecord(record_time, strings[0], index, strings[1], variants)
+
+
+def iter_payloads(path: str) -> Iterator[bytes]:
+    """Duyệt payload các bản ghi trong 1 segment, dừng ở bản ghi dở cuối file"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    position = 0
+    end = len(data)
+    while position + _FRAME.size <= end:
+        magic, length = _FRAME.unpack_from(data, position)
+        start = position + _FRAME.size
+        if magic != _MAGIC or start + length > end:
+            break
+        yield data[start:start + length]
+        position = start + length
+
+
+def iter_records(path: str) -> Iterator[RawRecord]:
+    """Duyệt các bản ghi trong 1 segment"""
+    for payload in iter_payloads(path):
+        yield decode_record(payload)
+
+
+def valid_length(path: str) -> int:
+    """Độ dài phần đầu file gồm các bản ghi trọn vẹn"""
+    position = 0
+    for payload in iter_payloads(path):
+        position += _FRAME.size + len(payload)
+    return position
+
+
+def find_segments(directory: str = RAW_OCR_DIR) -> List[str]:
+    """Các file segment trong thư mục (sắp theo tên = theo thời gian)"""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(RAW_OCR_EXT))
+
+
+class RawOCRWriter:
+    """
+    Ghi kết quả thô của OCR (gắn vào LicensePlateOCR.raw_recorder)
+
+    Ví dụ:
+        ocr.raw_recorder = RawOCRWriter()
+        with ocr.raw_recorder.source("cam1/xe.jpg"):
+            ocr.process_plates(rois)
+        ocr.raw_recorder.close()
+    """
+
+    def __init__(self, directory: str = RAW_OCR_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._file = None
+        self._hour = None
+        self.records = 0
+
+    @contextmanager
+    def source(self, path: str):
+        """Gắn ảnh nguồn cho các lần OCR trong khối with (theo thread)"""
+        self._local.source = path
+        self._local.index = 0
+        try:
+            yield self
+        finally:
+            self._local.source = ""
+
+    def _open_segment(self, hour: str):
+        path = os.path.join(self.directory, f"{hour}_{os.getpid()}{RAW_OCR_EXT}")
+        # Chạy tiếp segment đã có (cùng giờ, cùng pid): cắt bản ghi dở ở cuối
+        if os.path.isfile(path):
+            length = valid_length(path)
+            if length < os.path.getsize(path):
+                os.truncate(path, length)
+        self._file = open(path, 'ab')
+        self._hour = hour
+
+    def record(self, attempts: List[Tuple[str, Optional[object]]], selected: Optional[object]):
+        """
+        Ghi 1 lần process_plate
+
+        Args:
+            attempts: List (method, OCRReading hoặc None) theo thứ tự đã thử
+            selected: OCRReading đã chọn (None = không đọc được)
+        """
+        variants = []
+        for method, reading in attempts:
+            if reading is None:
+                variants.append(RawVariant(method, 'greedy', 0.0, [], []))
+            else:
+                variants.append(RawVariant(method, reading.decoder, float(reading.confidence),
+                                           list(reading.ocr_lines), list(reading.raw_output or [])))
+        index = getattr(self._local, 'index', 0)
+        self._local.index = index + 1
+        record = RawRecord(time.time(), getattr(self._local, 'source', ""), index,
+                           selected.formatted_text if selected is not None else "", variants)
+        payload = encode_record(record)
+        hour = datetime.now().strftime("%Y%m%d_%H")
+        with self._lock:
+            if self._file is None or hour != self._hour:
+                if self._file is not None:
+                    self._file.close()
+                self._open_segment(hour)
+            # 1 lần write cho cả khung + payload
+            self._file.write(_FRAME.pack(_MAGIC, len(payload)) + payload)
+            self.records += 1
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
@@ -0,0 +1,159 @@
+"""
+Module chạy lại hậu xử lý + xếp hạng trên kết quả thô OCR đã lưu (rawocr.py)
+- Dùng đúng các hàm của ocr.py (sort_ocr_output, postprocess_lines, is_valid_reading,
+  calculate_smart_score) -> sửa luật trong utils.py / ocr.py rồi chạy lại là thấy ngay kết quả mới
+- Không cần model: hàng triệu bản ghi trong vài giây (nhiều process + cache theo chuỗi dòng)
+- Giới hạn: giải mã grammar (cần xác suất ký tự của model) không chạy lại được, dùng kết quả đã lưu;
+  chỉ các biến thể đã thử lúc ghi (dừng sớm) mới có để chọn lại
+"""
+
+import multiprocessing
+import os
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+from .ocr import (sort_ocr_output, is_plate_text, postprocess_lines, is_valid_reading, calculate_smart_score,
+                  EARLY_EXIT_CONFIDENCE)
+from .rawocr import RawRecord, RawVariant, decode_record, iter_payloads
+from .results import OCRReading
+from .config import RESCORE_CHUNK_SIZE
+
+# Cache trong mỗi process: cùng các dòng text -> cùng kết quả hậu xử lý
+_postprocess_cache: Dict[Tuple[str, ...], Tuple[str, bool, str, str, str]] = {}
+_pattern_cache: Dict[Tuple[str, ...], bool] = {}
+
+
+def _postprocess(lines: Tuple[str, ...]) -> Tuple[str, bool, str, str, str]:
+    result = _postprocess_cache.get(lines)
+    if result is None:
+        result = _postprocess_cache[lines] = postprocess_lines(list(lines))
+    return result
+
+
+def _is_plate_text(lines: Tuple[str, ...]) -> bool:
+    result = _pattern_cache.get(lines)
+    if result is None:
+        result = _pattern_cache[lines] = is_plate_text(list(lines))
+    return result
+
+
+def replay_variant(variant: RawVariant) -> Optional[OCRReading]:
+    """Hậu xử lý lại 1 biến thể (như LicensePlateOCR._process_ocr_result)"""
+    if not variant.boxes:
+        return None
+    ocr_output = sort_ocr_output(variant.boxes)
+    lines = tuple(item[1] for item in ocr_output)
+    confidence = sum(item[2] for item in ocr_output) / len(ocr_output)
+    decoder = 'greedy'
+    # Lúc ghi đã giải mã grammar và chuỗi greedy vẫn chưa đúng ngữ pháp -> dùng kết quả grammar đã lưu
+    if variant.decoder == 'grammar' and not _is_plate_text(lines):
+        lines, confidence, decoder = tuple(variant.lines), variant.confidence, 'grammar'
+    vehicle_type, is_50cc, raw_text, clean_text, formatted_text = _postprocess(lines)
+    return OCRReading(raw_text=raw_text, vehicle_type=vehicle_type, clean_text=clean_text,
+                      formatted_text=formatted_text, is_50cc=is_50cc, ocr_lines=list(lines),
+                      method=variant.method, confidence=confidence, decoder=decoder)
+
+
+def replay_record(record: RawRecord) -> Optional[OCRReading]:
+    """Chọn lại kết quả cho 1 ROI (như LicensePlateOCR.process_plate, không in log)"""
+    candidates = []
+    for variant in record.variants:
+        reading = replay_variant(variant)
+        if is_valid_reading(reading):
+            candidates.append(reading)
+            if reading.confidence > EARLY_EXIT_CONFIDENCE:
+                return reading
+    if not candidates:
+        return None
+    return max(candidates, key=calculate_smart_score)
+
+
+@dataclass
+class RescoreReport:
+    """Thống kê so sánh kết quả đã lưu với kết quả chạy lại"""
+    total: int = 0
+    unchanged: int = 0
+    changed: int = 0          # Đọc được cả 2 lần nhưng khác nhau
+    gained: int = 0           # Trước không đọc được, giờ đọc được
+    lost: int = 0             # Trước đọc được, giờ không
+    transitions: Counter = field(default_factory=Counter)     # (cũ, mới) -> số lần
+    diffs: List[Tuple[str, int, str, str]] = field(default_factory=list)
+
+    def merge(self, other: 'RescoreReport', max_diffs: int):
+        self.total += other.total
+        self.unchanged += other.unchanged
+        self.changed += other.changed
+        self.gained += other.gained
+        self.lost += other.lost
+        self.transitions.update(other.transitions)
+        room = max_diffs - len(self.diffs)
+        if room > 0:
+            self.diffs.extend(other.diffs[:room])
+
+
+def rescore_payloads(payloads: List[bytes], max_diffs: int = 0) -> RescoreReport:
+    """Chạy lại 1 nhóm bản ghi (payload nhị phân), trả về thống kê"""
+    report = RescoreReport()
+    for payload in payloads:
+        record = decode_record(payload)
+        reading = replay_record(record)
+        new = reading.formatted_text if reading is not None else ""
+        old = record.selected
+        report.total += 1
+        if new == old:
+            report.unchanged += 1
+            continue
+        if not old:
+            report.gained += 1
+        elif not new:
+            report.lost += 1
+        else:
+            report.changed += 1
+        report.transitions[(old, new)] += 1
+        if len(report.diffs) < max_diffs:
+            report.diffs.append((record.source, record.index, old, new))
+    return report
+
+
+def _chunks(paths: Iterable[str], size: int) -> Iterable[List[bytes]]:
+    chunk = []
+    for path in paths:
+        for payload in iter_payloads(path):
+            chunk.append(payload)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _rescore_chunk(args):
+    payloads, max_diffs = args
+    return rescore_payloads(payloads, max_diffs)
+
+
+def rescore_segments(paths: List[str], workers: Optional[int] = None, max_diffs: int = 1000,
+                     chunk_size: int = RESCORE_CHUNK_SIZE) -> RescoreReport:
+    """
+    Chạy lại hậu xử lý trên các segment .rawocr
+
+    Args:
+        paths: Các file segment
+        workers: Số process (None = số CPU, 1 = chạy trong process hiện tại)
+        max_diffs: Số dòng khác biệt tối đa giữ lại trong report.diffs
+        chunk_size: Số bản ghi mỗi lần gửi cho 1 process
+
+    Returns:
+        RescoreReport
+    """
+    workers = workers or os.cpu_count() or 1
+    report = RescoreReport()
+    jobs = ((chunk, max_diffs) for chunk in _chunks(paths, chunk_size))
+    if workers == 1:
+        for job in jobs:
+            report.merge(_rescore_chunk(job), max_diffs)
+        return report
+    with multiprocessing.Pool(workers) as pool:
+        for part in pool.imap(_rescore_chunk, jobs):
+            report.merge(part, max_diffs)
+    return report
@@ -0,0 +1,80 @@
+"""
+Module kiểu dữ liệu kết quả nhận diện (dataclass có __slots__, gọn bộ nhớ)
+- OCRReading: kết quả OCR của 1 ROI (thay cho dict plate_info)
+- PlateResult: 1 biển số đã nhận diện trong ảnh (thay cho dict detection)
+- Ảnh trung gian (ROI, ảnh tiền xử lý, các biến thể) chỉ được giữ theo mức lưu giữ
+  (RESULT_RETENTION) và được giải phóng ngay sau khi ghi History
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .config import RESULT_RETENTION
+
+# Mức lưu giữ ảnh trung gian (tăng dần)
+RETENTION_NONE = 'none'     # Chỉ giữ text/bbox/điểm số
+RETENTION_ROI = 'roi'       # Giữ thêm ảnh ROI + ảnh tiền xử lý được chọn
+RETENTION_DEBUG = 'debug'   # Giữ thêm mọi biến thể tiền xử lý đã thử
+RETENTION_LEVELS = (RETENTION_NONE, RETENTION_ROI, RETENTION_DEBUG)
+
+
+def retention_at_least(level: str, required: str) -> bool:
+    """Mức lưu giữ level có bao gồm required không"""
+    return RETENTION_LEVELS.index(level) >= RETENTION_LEVELS.index(required)
+
+
+@dataclass(slots=True)
+class OCRReading:
+    """Kết quả OCR của 1 ROI với 1 phương pháp tiền xử lý"""
+    raw_text: str
+    vehicle_type: str
+    clean_text: str
+    formatted_text: str
+    is_50cc: bool
+    ocr_lines: List[str]
+    method: str
+    confidence: float
+    decoder: str
+    # Ảnh đã đưa vào OCR / các biến thể đã thử (None nếu mức lưu giữ không cần)
+    preprocessed: Optional[np.ndarray] = None
+    intermediates: Optional[Dict[str, np.ndarray]] = None
+    # Kết quả thô của EasyOCR [[bbox, text, conf], ...] (chỉ giữ khi ghi raw OCR, xem rawocr.py)
+    raw_output: Optional[List] = None
+
+
+@dataclass(slots=True)
+class PlateResult:
+    """Một biển số đã nhận diện trong ảnh"""
+    bbox: Tuple[int, int, int, int]
+    text: str
+    vehicle_type: str
+    confidence: Optional[float] = None
+    method: Optional[str] = None
+    decoder: Optional[str] = None
+    roi: Optional[np.ndarray] = None
+    preprocessed: Optional[np.ndarray] = None
+    intermediates: Dict[str, np.ndarray] = field(default_factory=dict)
+
+    @classmethod
+    def from_reading(cls, reading: OCRReading, bbox: Tuple[int, int, int, int], roi: Optional[np.ndarray],
+                     retention: str = RESULT_RETENTION) -> 'PlateResult':
+        """Tạo kết quả từ OCRReading, chỉ giữ ảnh theo mức lưu giữ"""
+        keep_roi = retention_at_least(retention, RETENTION_ROI)
+        keep_debug = retention_at_least(retention, RETENTION_DEBUG)
+        return cls(
+            bbox=bbox,
+            text=reading.formatted_text,
+            vehicle_type=reading.vehicle_type,
+            confidence=reading.confidence,
+            method=reading.method,
+            decoder=reading.decoder,
+            roi=roi if keep_roi else None,
+            preprocessed=reading.preprocessed if keep_roi else None,
+            intermediates=dict(reading.intermediates or {}) if keep_debug else {},
+        )
+
+    def release_images(self):
+        """Giải phóng ảnh trung gian (gọi sau khi đã ghi History)"""
+        self.roi = None
+        self.preprocessed = None
+        self.intermediates = {}
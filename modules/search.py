@@ -0,0 +1,375 @@
+"""
+Module tìm kiếm gần đúng biển số trong lịch sử (history.csv)
+- Khoảng cách: edit distance có trọng số theo cặp ký tự OCR hay nhầm
+  (dict_char_to_num, dict_num_to_char, INVALID_CHAR_MAPPING: 8/B, 0/D, 5/S, ...)
+  thay thế cặp hay nhầm = 0.5, thay thế khác / thêm / bớt ký tự = 1
+- Chỉ mục: dict biển số -> offset dòng, kèm tập ký tự đã gặp ở từng vị trí.
+  Truy vấn sinh các biển số trong ngưỡng khoảng cách (chỉ thay bằng cặp hay nhầm trực tiếp,
+  không bắc cầu, và chỉ dùng ký tự từng xuất hiện ở vị trí đó) rồi tra dict
+  -> ~1ms ở max_distance=1 dù lịch sử có hàng triệu dòng
+- Chỉ mục lưu offset dòng trong history.csv (không giữ cả dòng trong RAM),
+  cache ra file và chỉ đọc thêm phần CSV mới ghi khi chạy lại
+"""
+
+import csv
+import hashlib
+import itertools
+import os
+import pickle
+from array import array
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Sequence, Set, Tuple
+from .utils import dict_char_to_num, dict_num_to_char, INVALID_CHAR_MAPPING
+from .config import HISTORY_DIR, HISTORY_CSV_FILE, SEARCH_MAX_DISTANCE, SEARCH_LIMIT, SEARCH_CACHE_FILE
+
+# Ký tự đại diện trong truy vấn: khớp mọi ký tự (ký tự không đọc được)
+WILDCARD = '?'
+MAX_WILDCARDS = 2
+
+# Số byte đầu / cuối phần CSV đã chỉ mục dùng để nhận ra CSV bị ghi lại
+_FINGERPRINT_BYTES = 4096
+# Đổi khi cấu trúc chỉ mục thay đổi (cache cũ bị bỏ qua)
+_CACHE_VERSION = 2
+
+# Chi phí tính theo nửa đơn vị (số nguyên): cặp hay nhầm = 1, còn lại = 2
+CONFUSION_COST = 1
+EDIT_COST = 2
+
+# Cặp ký tự OCR hay nhầm (2 chiều)
+CONFUSION_PAIRS: Set[Tuple[str, str]] = set()
+for _mapping in (dict_char_to_num, dict_num_to_char, INVALID_CHAR_MAPPING):
+    for _a, _b in _mapping.items():
+        CONFUSION_PAIRS.add((_a, _b))
+        CONFUSION_PAIRS.add((_b, _a))
+
+# Ký tự -> các ký tự hay nhầm trực tiếp với nó (không bắc cầu: 0/D và D/O không kéo theo 0/... của O)
+CONFUSABLE: Dict[str, FrozenSet[str]] = {}
+for _a, _b in CONFUSION_PAIRS:
+    CONFUSABLE[_a] = CONFUSABLE.get(_a, frozenset()) | {_b}
+
+
+def normalize_plate(text: str) -> str:
+    """Bỏ dấu phân cách, viết hoa: '51A-123.45' -> '51A12345' (giữ ký tự đại diện '?')"""
+    return ''.join(c for c in text.upper() if c.isalnum() or c == WILDCARD)
+
+
+def weighted_distance(a: str, b: str, limit: Optional[int] = None) -> int:
+    """
+    Edit distance có trọng số (nửa đơn vị) giữa 2 biển số đã normalize
+
+    limit: dừng sớm và trả về limit + 1 khi chắc chắn vượt quá
+    """
+    if a == b:
+        return 0
+    previous = list(range(0, EDIT_COST * (len(b) + 1), EDIT_COST))
+    for i, ca in enumerate(a, 1):
+        current = [EDIT_COST * i]
+        row_min = current[0]
+        for j, cb in enumerate(b, 1):
+            if ca == cb or ca == WILDCARD:
+                cost = previous[j - 1]
+            elif (ca, cb) in CONFUSION_PAIRS:
+                cost = previous[j - 1] + CONFUSION_COST
+            else:
+                cost = previous[j - 1] + EDIT_COST
+            cost = min(cost, previous[j] + EDIT_COST, current[j - 1] + EDIT_COST)
+            current.append(cost)
+            row_min = min(row_min, cost)
+        if limit is not None and row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+def plate_distance(a: str, b: str) -> float:
+    """Khoảng cách giữa 2 biển số (đơn vị: 1 lần sửa ký tự; cặp hay nhầm = 0.5)"""
+    return weighted_distance(normalize_plate(a), normalize_plate(b)) / EDIT_COST
+
+
+def substitution_variants(plate: str, budget: int, chars_at: Optional[Sequence[Set[str]]] = None,
+                          hard: bool = True) -> List[Tuple[str, int]]:
+    """
+    Các chuỗi có được khi thay ký tự cùng vị trí với tổng chi phí <= budget (nửa đơn vị)
+
+    Args:
+        plate: Biển số đã normalize (vị trí '?' được giữ nguyên)
+        budget: Chi phí tối đa
+        chars_at: Tập ký tự được phép ở từng vị trí (None = không giới hạn, chỉ thay cặp hay nhầm)
+        hard: Cho phép thay ký tự bất kỳ trong chars_at (chi phí EDIT_COST)
+
+    Returns:
+        List (chuỗi, chi phí), gồm cả chính plate với chi phí 0
+    """
+    options = []
+    for i, c in enumerate(plate):
+        if c == WILDCARD:
+            continue
+        allowed = chars_at[i] if chars_at is not None else None
+        partners = CONFUSABLE.get(c, frozenset())
+        opts = [(CONFUSION_COST, x) for x in sorted(partners) if allowed is None or x in allowed]
+        if hard and budget >= EDIT_COST and allowed:
+            opts += [(EDIT_COST, x) for x in sorted(allowed) if x != c and x not in partners]
+        if opts:
+            options.append((i, opts))
+
+    results = [(plate, 0)]
+    frontier = [(plate, 0, 0)]
+    while frontier:
+        next_frontier = []
+        for text, start, spent in frontier:
+            for k in range(start, len(options)):
+                i, opts = options[k]
+                for cost, x in opts:
+                    total = spent + cost
+                    if total > budget:
+                        break
+                    variant = text[:i] + x + text[i + 1:]
+                    results.append((variant, total))
+                    next_frontier.append((variant, k + 1, total))
+        frontier = next_frontier
+    return results
+
+
+def _edit_templates(query: str, max_edits: int) -> Dict[str, int]:
+    """
+    Mẫu sau khi bớt / thêm tối đa max_edits ký tự (ký tự thêm vào là '?')
+
+    Returns:
+        Mẫu -> số lần thêm / bớt ít nhất
+    """
+    templates: Dict[str, int] = {}
+    for deleted in range(max_edits + 1):
+        for positions in itertools.combinations(range(len(query)), deleted):
+            base = ''.join(c for i, c in enumerate(query) if i not in positions)
+            # Thêm đúng chỗ vừa bớt = thay ký tự (đã tính ở bước thay, rẻ hơn)
+            gaps = {p - n for n, p in enumerate(positions)}
+            for inserted in range(max_edits - deleted + 1):
+                for slots in itertools.combinations_with_replacement(range(len(base) + 1), inserted):
+                    if gaps.intersection(slots):
+                        continue
+                    template = base
+                    for slot in reversed(slots):
+                        template = template[:slot] + WILDCARD + template[slot:]
+                    edits = deleted + inserted
+                    if templates.get(template, edits + 1) > edits:
+                        templates[template] = edits
+    return templates
+
+
+@dataclass(slots=True)
+class SearchHit:
+    """1 biển số tìm được"""
+    plate: str                 # Biển số như trong lịch sử (đã format)
+    distance: float            # Khoảng cách tới truy vấn
+    count: int                 # Số dòng lịch sử có biển số này
+    refs: List[int]            # Offset các dòng trong history.csv
+
+
+class PlateIndex:
+    """
+    Chỉ mục biển số: biển số -> offset dòng, kèm tập ký tự đã gặp ở từng vị trí
+
+    Ví dụ:
+        index = PlateIndex()
+        index.add("51A-123.45", 0)
+        index.search("51A-l23.4S")   # l/1 và S/5 là cặp hay nhầm -> khoảng cách 1.0
+    """
+
+    def __init__(self):
+        # Biển số đã normalize -> (biển số hiển thị, offset các dòng)
+        self.plates: Dict[str, Tuple[str, array]] = {}
+        # Vị trí -> các ký tự từng xuất hiện ở vị trí đó (giới hạn ký tự khi sinh biển số lân cận)
+        self.chars_at: List[Set[str]] = []
+        self.rows = 0
+
+    def __len__(self) -> int:
+        return len(self.plates)
+
+    def add(self, plate_text: str, ref: int):
+        """Thêm 1 dòng lịch sử (ref: offset dòng trong CSV)"""
+        plate = normalize_plate(plate_text).replace(WILDCARD, '')
+        if not plate:
+            return
+        entry = self.plates.get(plate)
+        if entry is None:
+            entry = self.plates[plate] = (plate_text, array('q'))
+            while len(self.chars_at) < len(plate):
+                self.chars_at.append(set())
+            for chars, c in zip(self.chars_at, plate):
+                chars.add(c)
+        entry[1].append(ref)
+        self.rows += 1
+
+    def search(self, query: str, max_distance: float = SEARCH_MAX_DISTANCE, limit: int = SEARCH_LIMIT) -> List[SearchHit]:
+        """
+        Tìm biển số gần với query
+
+        Args:
+            query: Biển số cần tìm (có thể thiếu/sai ký tự, '?' = ký tự không đọc được)
+            max_distance: Khoảng cách tối đa (1 = sai 1 ký tự; cặp hay nhầm chỉ tính 0.5)
+            limit: Số kết quả tối đa
+
+        Returns:
+            List SearchHit, gần nhất trước (cùng khoảng cách: nhiều dòng trước)
+        """
+        query = normalize_plate(query)
+        if not query:
+            return []
+        if query.count(WILDCARD) > MAX_WILDCARDS:
+            raise ValueError(f"Truy vấn chỉ được có tối đa {MAX_WILDCARDS} ký tự '{WILDCARD}'")
+        limit_cost = int(max_distance * EDIT_COST)
+        plates = self.plates
+        chars_at = self.chars_at
+        width = len(chars_at)
+
+        # Sinh mọi biển số trong ngưỡng: thêm / bớt ký tự -> thay ký tự -> điền '?' rồi tra dict
+        candidates: Set[str] = set()
+        for template, edits in _edit_templates(query, limit_cost // EDIT_COST).items():
+            if not template or len(template) > width:
+                continue
+            fills = [sorted(chars_at[i]) for i, c in enumerate(template) if c == WILDCARD]
+            for variant, _ in substitution_variants(template, limit_cost - edits * EDIT_COST, chars_at):
+                if not fills:
+                    if variant in plates:
+                        candidates.add(variant)
+                    continue
+                parts = variant.split(WILDCARD)
+                texts = [parts[0]]
+                for chars, part in zip(fills, parts[1:]):
+                    texts = [text + c + part for text in texts for c in chars]
+                candidates.update(filter(plates.__contains__, texts))
+
+        # Khoảng cách chính xác (bước sinh có thể đi đường vòng, vd. thêm rồi thay)
+        hits = []
+        for plate in candidates:
+            cost = weighted_distance(query, plate, limit_cost)
+            if cost <= limit_cost:
+                display, refs = plates[plate]
+                hits.append(SearchHit(display, cost / EDIT_COST, len(refs), list(refs)))
+        hits.sort(key=lambda hit: (hit.distance, -hit.count, hit.plate))
+        return hits[:limit]
+
+
+class HistorySearch:
+    """
+    Tìm kiếm trong history.csv, chỉ mục được cache và cập nhật tăng dần
+
+    Ví dụ:
+        search = HistorySearch()
+        for hit, rows in search.search("51A12345"):
+            print(hit.plate, hit.distance, rows[0])
+    """
+
+    def __init__(self, csv_path: str = os.path.join(HISTORY_DIR, HISTORY_CSV_FILE),
+                 cache_path: Optional[str] = SEARCH_CACHE_FILE):
+        """
+        Args:
+            csv_path: File history.csv
+            cache_path: File cache chỉ mục (None = không cache)
+        """
+        self.csv_path = csv_path
+        self.cache_path = cache_path
+        self.index = PlateIndex()
+        self.header: Optional[List[str]] = None
+        # Số byte CSV đã đưa vào chỉ mục
+        self.consumed = 0
+        self._load_cache()
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'rb') as f:
+                state = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError) as e:
+            print(f"⚠ Bỏ qua cache chỉ mục hỏng: {e}")
+            return
+        # Cache của chỉ mục kiểu cũ, hoặc CSV bị xóa / ghi lại (clear_history.py, unpack_history.py, merge_shards.py)
+        # -> offset cũ không còn đúng
+        if state.get('version') != _CACHE_VERSION or state.get('csv_path') != os.path.abspath(self.csv_path) or \
+                not os.path.isfile(self.csv_path) or os.path.getsize(self.csv_path) < state['consumed']:
+            return
+        with open(self.csv_path, 'rb') as f:
+            if self._fingerprint(f, state['consumed']) != state.get('fingerprint'):
+                return
+        self.index, self.header, self.consumed = state['index'], state['header'], state['consumed']
+
+    @staticmethod
+    def _fingerprint(f, length: int) -> str:
+        """Hash khối đầu và khối cuối của `length` byte đầu file"""
+        digest = hashlib.sha1(str(length).encode())
+        f.seek(0)
+        digest.update(f.read(min(length, _FINGERPRINT_BYTES)))
+        if length > _FINGERPRINT_BYTES:
+            f.seek(max(_FINGERPRINT_BYTES, length - _FINGERPRINT_BYTES))
+            digest.update(f.read(length - f.tell()))
+        return digest.hexdigest()
+
+    def save_cache(self):
+        """Ghi cache chỉ mục (ghi file tạm rồi đổi tên)"""
+        if not self.cache_path:
+            return
+        folder = os.path.dirname(self.cache_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        fingerprint = None
+        if os.path.isfile(self.csv_path):
+            with open(self.csv_path, 'rb') as f:
+                fingerprint = self._fingerprint(f, self.consumed)
+        tmp_path = self.cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump({'version': _CACHE_VERSION, 'csv_path': os.path.abspath(self.csv_path), 'index': self.index,
+                         'header': self.header, 'consumed': self.consumed, 'fingerprint': fingerprint},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.cache_path)
+
+    def refresh(self) -> int:
+        """
+        Đưa các dòng CSV mới ghi (từ lần trước) vào chỉ mục
+
+        Returns:
+            Số dòng mới
+        """
+        if not os.path.isfile(self.csv_path):
+            return 0
+        added = 0
+        with open(self.csv_path, 'rb') as f:
+            f.seek(self.consumed)
+            offset = self.consumed
+            for raw in f:
+                # Dòng cuối đang ghi dở (chưa có '\n') -> để lần sau
+                if not raw.endswith(b'\n'):
+                    break
+                row_offset = offset
+                offset += len(raw)
+                row = next(csv.reader([raw.decode('utf-8-sig', errors='replace')]), None)
+                if not row:
+                    continue
+                if self.header is None and row_offset == 0:
+                    self.header = row
+                    continue
+                if len(row) > 1 and row[1] and row[1] != "No Plate":
+                    self.index.add(row[1], row_offset)
+                    added += 1
+            self.consumed = offset
+        return added
+
+    def read_rows(self, refs: List[int]) -> List[List[str]]:
+        """Đọc các dòng CSV theo offset"""
+        rows = []
+        with open(self.csv_path, 'rb') as f:
+            for ref in refs:
+                f.seek(ref)
+                rows.append(next(csv.reader([f.readline().decode('utf-8-sig', errors='replace')])))
+        return rows
+
+    def search(self, query: str, max_distance: float = SEARCH_MAX_DISTANCE, limit: int = SEARCH_LIMIT,
+               rows_per_plate: int = 5) -> List[Tuple[SearchHit, List[List[str]]]]:
+        """
+        Tìm biển số, kèm các dòng lịch sử mới nhất của mỗi biển số
+
+        Returns:
+            List (SearchHit, rows), rows gồm tối đa rows_per_plate dòng mới nhất
+        """
+        hits = self.index.search(query, max_distance=max_distance, limit=limit)
+        return [(hit, self.read_rows(hit.refs[-rows_per_plate:][::-1]) if rows_per_plate else []) for hit in hits]
@@ -0,0 +1,231 @@
+"""
+Module dịch vụ nhận diện dùng chung cho server HTTP
+- Model được giữ sẵn trong RAM (warm), mọi lời gọi model chạy trên 1 thread
+- Request đồng thời được gom thành micro-batch: detect 1 lần cho cả batch,
+  OCR gom ROI của mọi ảnh trong batch theo shape bucket
+- Kết quả dạng dict (JSON được) kèm thời gian từng giai đoạn
+"""
+
+import logging
+import time
+from typing import Any, Dict, List, Optional, Union
+from PIL import Image
+from .batching import MicroBatcher
+from .image_io import DecodedImage
+from .pipeline import recognize_plates
+from .results import RETENTION_NONE
+from .metrics import REQUEST_SECONDS, BATCH_SIZE
+from .config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+
+log = logging.getLogger(__name__)
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000.0, 2)
+
+
+class RecognitionService:
+    """
+    Nhận diện biển số theo request, có micro-batching
+
+    Ví dụ:
+        service = RecognitionService(detector, ocr)
+        result = service.recognize("xe.jpg")          # đường dẫn
+        result = service.recognize(open("xe.jpg", "rb").read())  # nội dung file
+    """
+
+    def __init__(self, detector, ocr, logger=None, max_batch_size: int = BATCH_MAX_SIZE,
+                 max_wait_ms: float = BATCH_MAX_WAIT_MS, watchlist=None):
+        """
+        Args:
+            detector: LicensePlateDetector (đã load)
+            ocr: LicensePlateOCR (đã load)
+            logger: HistoryLogger (None = không lưu lịch sử)
+            max_batch_size: Số request tối đa trong 1 batch
+            max_wait_ms: Thời gian gom batch tối đa (ms)
+            watchlist: Watchlist tra từng biển số (None = không tra)
+        """
+        self.detector = detector
+        self.ocr = ocr
+        self.logger = logger
+        self.watchlist = watchlist
+        # Không lưu History -> không cần giữ ảnh ROI trong kết quả
+        self.retention = logger.required_retention if logger is not None else RETENTION_NONE
+        self.batcher = MicroBatcher(self._process_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+    def recognize(self, source: Union[str, bytes], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Nhận diện biển số trong 1 ảnh (block tới khi batch chứa ảnh xử lý xong)
+
+        Args:
+            source: Đường dẫn ảnh hoặc nội dung file ảnh (bytes)
+            timeout: Thời gian chờ tối đa (giây)
+
+        Returns:
+            Dict: plates, image_size, batch_size, timings (ms)
+        """
+        start = time.perf_counter()
+        # Giải mã ngay trên thread của request -> chạy song song giữa các request
+        decoded = DecodedImage(source)
+        decode_time = time.perf_counter() - start
+
+        payload = {'decoded': decoded, 'submitted': time.perf_counter()}
+        result = self.batcher.submit(payload).result(timeout)
+        result['timings']['decode'] = _ms(decode_time)
+        total = time.perf_counter() - start
+        result['timings']['total'] = _ms(total)
+        REQUEST_SECONDS.observe(total)
+        return result
+
+    def _process_batch(self, payloads: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Xử lý 1 micro-batch. Lỗi của 1 ảnh chỉ làm hỏng ảnh đó: vị trí tương ứng
+        trong kết quả là exception (MicroBatcher chuyển vào future của request đó),
+        các ảnh còn lại vẫn chạy tiếp
+        """
+        batch_start = time.perf_counter()
+        BATCH_SIZE.observe(len(payloads))
+        decoded_list: List[DecodedImage] = [payload['decoded'] for payload in payloads]
+        errors: List[Optional[Exception]] = [None] * len(payloads)
+
+        def fail(i: int, stage: str, e: Exception):
+            log.error("❌ Lỗi giai đoạn '%s' (ảnh %d/%d trong batch): %s", stage, i + 1, len(payloads), e,
+                      exc_info=True)
+            errors[i] = e
+
+        images_np = []
+        for i, decoded in enumerate(decoded_list):
+            try:
+                images_np.append(decoded.preview_array())
+            except Exception as e:
+                fail(i, 'decode', e)
+                images_np.append(None)
+
+        # 1. Detect: 1 lần gọi model cho cả batch, lỗi -> chạy lại từng ảnh để tìm ảnh hỏng
+        start = time.perf_counter()
+        regions_list: List[list] = [[] for _ in payloads]
+        ok = [i for i in range(len(payloads)) if errors[i] is None]
+        try:
+            for i, regions in zip(ok, self.detector.get_plate_regions_batch([images_np[i] for i in ok])):
+                regions_list[i] = regions
+            batch_failed = False
+        except Exception:
+            batch_failed = True
+        if batch_failed:
+            for i in ok:
+                try:
+                    regions_list[i] = self.detector.get_plate_regions_batch([images_np[i]])[0]
+                except Exception as e:
+                    fail(i, 'detect', e)
+        for i, (decoded, regions) in enumerate(zip(decoded_list, regions_list)):
+            if errors[i] is None and decoded.is_reduced and regions:
+                try:
+                    crops = decoded.crop_full_res([bbox for _, bbox in regions])
+                    regions_list[i] = [(crop, bbox) for crop, (_, bbox) in zip(crops, regions)]
+                except Exception as e:
+                    fail(i, 'detect', e)
+        detect_time = time.perf_counter() - start
+
+        # 2. OCR: gom ROI của tất cả ảnh trong batch, lỗi -> chạy lại từng ảnh
+        start = time.perf_counter()
+        ok = [i for i in range(len(payloads)) if errors[i] is None]
+        infos_list: List[list] = [[] for _ in payloads]
+        try:
+            all_rois = [roi for i in ok for roi, _ in regions_list[i]]
+            all_infos = self.ocr.process_plates(all_rois, apply_warping=True)
+            offset = 0
+            for i in ok:
+                infos_list[i] = all_infos[offset:offset + len(regions_list[i])]
+                offset += len(regions_list[i])
+            batch_failed = False
+        except Exception:
+            batch_failed = True
+        if batch_failed:
+            for i in ok:
+                try:
+                    infos_list[i] = self.ocr.process_plates([roi for roi, _ in regions_list[i]],
+                                                            apply_warping=True)
+                except Exception as e:
+                    fail(i, 'ocr', e)
+        detections_list: List[list] = [[] for _ in payloads]
+        watch_matches: List[list] = [[] for _ in payloads]
+        for i, decoded in enumerate(decoded_list):
+            if errors[i] is not None:
+                continue
+            try:
+                _, detections = recognize_plates(self.detector, self.ocr, images_np[i], regions_list[i],
+                                                 decoded=decoded, plate_infos=infos_list[i],
+                                                 retention=self.retention)
+                detections_list[i] = detections
+                if self.watchlist is not None and detections:
+                    source = decoded.file_path if isinstance(decoded.file_path, str) else "upload"
+                    watch_matches[i] = self.watchlist.check_plates(detections, source=source)
+            except Exception as e:
+                fail(i, 'ocr', e)
+        ocr_time = time.perf_counter() - start
+
+        # 3. (Tùy chọn) Lưu History
+        persist_time = 0.0
+        if self.logger is not None:
+            start = time.perf_counter()
+            for i, (image_np, decoded, detections) in enumerate(zip(images_np, decoded_list, detections_list)):
+                if errors[i] is not None:
+                    continue
+                try:
+                    result_pil = Image.fromarray(self.detector.draw_detections(image_np, detections))
+                    # Ảnh upload: không có file nguồn, ghi nguyên nội dung đã nhận (độ phân giải đầy đủ)
+                    if isinstance(decoded.file_path, str):
+                        self.logger.save_result(decoded.file_path, decoded.preview, detections,
+                                                processed_image_pil=result_pil)
+                    else:
+                        self.logger.save_result(None, decoded.preview, detections, processed_image_pil=result_pil,
+                                                original_bytes=bytes(decoded.file_path))
+                except Exception as e:
+                    fail(i, 'persist', e)
+                finally:
+                    for det in detections:
+                        det.release_images()
+            persist_time = time.perf_counter() - start
+
+        results: List[Any] = []
+        for i, (payload, decoded, detections, matches) in enumerate(
+                zip(payloads, decoded_list, detections_list, watch_matches)):
+            if errors[i] is not None:
+                results.append(errors[i])
+                continue
+            plates = []
+            for det in detections:
+                # bbox trả về theo tọa độ ảnh gốc (detector chạy trên preview)
+                x1, y1, x2, y2 = det.bbox
+                plates.append({
+                    'text': det.text,
+                    'vehicle_type': det.vehicle_type,
+                    'confidence': round(float(det.confidence), 4) if det.confidence is not None else None,
+                    'bbox': [int(round(v * decoded.scale)) for v in (x1, y1, x2, y2)],
+                })
+            timings = {
+                'queue': _ms(batch_start - payload['submitted']),
+                'detect': _ms(detect_time),
+                'ocr': _ms(ocr_time),
+            }
+            if self.logger is not None:
+                timings['persist'] = _ms(persist_time)
+            results.append({
+                'plates': plates,
+                'image_size': list(decoded.full_size),
+                'watchlist': [{'plate': m.plate, 'matched': m.entry.plate, 'list': m.entry.list_name,
+                               'note': m.entry.note, 'distance': m.distance} for m in matches],
+                'batch_size': len(payloads),
+                'timings': timings,
+            })
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Thống kê batching và cascade"""
+        return {
+            'batching': self.batcher.get_stats(),
+            'cascade': self.detector.get_routing_stats(),
+        }
+
+    def close(self):
+        self.batcher.close()
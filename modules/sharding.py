@@ -0,0 +1,301 @@
+"""
+Module chia 1 batch job cho nhiều máy (shard) và gộp kết quả
+- Danh sách ảnh: file text (1 đường dẫn/dòng) hoặc JSONL ({"path": ...} mỗi dòng)
+- Shard của 1 ảnh = SHA-1(đường dẫn) % N -> mọi máy tự tính ra cùng kết quả,
+  không cần dịch vụ điều phối, chỉ cần dùng chung danh sách
+- Mỗi shard chỉ ghi vào thư mục riêng {output}/shard-i-of-N/ (history/ + manifest.jsonl)
+  nên các máy không bao giờ ghi đè lên nhau trên ổ mạng dùng chung
+- merge_shards() gộp History, CSV và manifest của các shard thành 1 kho, không trùng lặp
+"""
+
+import csv
+import hashlib
+import json
+import os
+import re
+import shutil
+from typing import Dict, List, Optional, Tuple
+from .manifest import JobManifest, read_manifest, STATUS_DONE
+from .archive import is_archive_ref, split_ref, make_ref, index_path
+from .config import HISTORY_CSV_FILE, SHARD_MANIFEST_FILE, HISTORY_PACK_DIR
+
+_SHARD_DIR_PATTERN = re.compile(r'^shard-(\d+)-of-(\d+)$')
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """
+    Phân tích chuỗi 'i/N' (i tính từ 0)
+
+    Raises:
+        ValueError: Chuỗi sai định dạng hoặc i ngoài khoảng [0, N)
+    """
+    index, sep, count = value.partition('/')
+    if not sep:
+        raise ValueError(f"shard phải có dạng i/N, nhận được: {value}")
+    index, count = int(index), int(count)
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"shard {index}/{count} không hợp lệ (cần 0 <= i < N)")
+    return index, count
+
+
+def shard_of(path: str, count: int) -> int:
+    """Shard chứa ảnh: chỉ phụ thuộc chuỗi đường dẫn (không dùng hash() vì bị ngẫu nhiên theo process)"""
+    key = os.path.normpath(path).replace('\\', '/')
+    return int(hashlib.sha1(key.encode('utf-8')).hexdigest(), 16) % count
+
+
+def select_shard(paths: List[str], index: int, count: int) -> List[str]:
+    """Các ảnh thuộc shard index/count (giữ thứ tự đầu vào)"""
+    return [path for path in paths if shard_of(path, count) == index]
+
+
+def read_path_list(list_file: str) -> List[str]:
+    """
+    Đọc danh sách ảnh
+
+    - .jsonl: mỗi dòng là {"path": "..."} hoặc chuỗi JSON
+    - Còn lại: mỗi dòng 1 đường dẫn, bỏ qua dòng trống và dòng bắt đầu bằng '#'
+    """
+    paths = []
+    is_jsonl = list_file.lower().endswith('.jsonl')
+    with open(list_file, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if not is_jsonl:
+                paths.append(line)
+                continue
+            try:
+                item = json.loads(line)
+                paths.append(item if isinstance(item, str) else item['path'])
+            except (ValueError, KeyError, TypeError):
+                print(f"⚠ {list_file}:{line_no}: dòng không hợp lệ, bỏ qua")
+    return paths
+
+
+def shard_dir(output_dir: str, index: int, count: int) -> str:
+    """Thư mục kết quả của 1 shard"""
+    return os.path.join(output_dir, f"shard-{index}-of-{count}")
+
+
+def find_shard_dirs(output_dir: str) -> List[str]:
+    """
+    Tìm các thư mục shard-i-of-N trong output_dir, cảnh báo nếu thiếu shard
+    """
+    found: Dict[int, Dict[int, str]] = {}
+    for name in sorted(os.listdir(output_dir)):
+        match = _SHARD_DIR_PATTERN.match(name)
+        if match and os.path.isdir(os.path.join(output_dir, name)):
+            index, count = int(match.group(1)), int(match.group(2))
+            found.setdefault(count, {})[index] = os.path.join(output_dir, name)
+    dirs = []
+    for count, by_index in sorted(found.items()):
+        missing = [i for i in range(count) if i not in by_index]
+        if missing:
+            print(f"⚠ Thiếu shard {', '.join(f'{i}/{count}' for i in missing)} trong {output_dir}")
+        dirs.extend(by_index[i] for i in sorted(by_index))
+    return dirs
+
+
+def _unique_dir(parent: str, name: str) -> str:
+    path = os.path.join(parent, name)
+    suffix = 0
+    while os.path.exists(path):
+        suffix += 1
+        path = os.path.join(parent, f"{name}_{suffix}")
+    return path
+
+
+def _location_key(directory: str, value: str) -> Tuple[str, Optional[str], str]:
+    """
+    Khóa vị trí của 1 ảnh History trong shard:
+    (shard, None, tên thư mục) hoặc (shard, tên gói, tiền tố thành viên) khi lưu dạng gói
+
+    Chỉ dựa vào tên: đường dẫn gốc có thể là tương đối theo máy đã chạy shard
+    """
+    if is_archive_ref(value):
+        pack_path, member = split_ref(value)
+        return directory, os.path.basename(pack_path), member.split('/', 1)[0]
+    return directory, None, os.path.basename(os.path.normpath(value))
+
+
+def _relocate(value: str, target: str) -> str:
+    """Đổi đường dẫn ảnh sang vị trí mới trong kho (thư mục hoặc gói)"""
+    if is_archive_ref(value):
+        return make_ref(target, split_ref(value)[1])
+    return os.path.join(target, os.path.basename(value))
+
+
+def _better(entry: Dict, current: Optional[Dict]) -> bool:
+    """Chọn bản ghi đại diện cho 1 ảnh: ưu tiên 'done', sau đó bản mới nhất"""
+    if current is None:
+        return True
+    entry_done = entry.get('status') == STATUS_DONE
+    current_done = current.get('status') == STATUS_DONE
+    if entry_done != current_done:
+        return entry_done
+    return entry.get('time', '') > current.get('time', '')
+
+
+def merge_shards(shard_dirs: List[str], dest_dir: str, move: bool = False) -> Dict[str, int]:
+    """
+    Gộp kết quả các shard vào dest_dir (history/ + history.csv + manifest.jsonl)
+
+    - Mỗi ảnh (theo đường dẫn) chỉ giữ 1 bản ghi: bản 'done' mới nhất, nếu không có thì bản lỗi mới nhất
+    - Thư mục History của bản ghi bị loại (xử lý trùng ở shard khác) không được chép sang
+    - Chạy lại nhiều lần được: ảnh đã có trong kho với cùng nội dung (hash) sẽ bỏ qua
+
+    Args:
+        shard_dirs: Các thư mục shard-i-of-N
+        dest_dir: Thư mục kho đã gộp
+        move: Di chuyển thư mục History thay vì copy (nhanh khi cùng ổ đĩa)
+
+    Returns:
+        Dict thống kê: images, folders, packs, rows, duplicates, skipped
+    """
+    stats = {'images': 0, 'folders': 0, 'packs': 0, 'rows': 0, 'duplicates': 0, 'skipped': 0}
+    dest_history = os.path.join(dest_dir, 'history')
+    os.makedirs(dest_history, exist_ok=True)
+    dest_manifest = JobManifest(os.path.join(dest_dir, SHARD_MANIFEST_FILE))
+
+    # 1. Chọn bản ghi đại diện cho mỗi ảnh trên tất cả shard
+    chosen: Dict[str, Tuple[str, Dict]] = {}
+    for directory in shard_dirs:
+        manifest_path = os.path.join(directory, SHARD_MANIFEST_FILE)
+        if not os.path.isfile(manifest_path):
+            print(f"⚠ {directory}: không có {SHARD_MANIFEST_FILE}, bỏ qua")
+            continue
+        # Chỉ đọc: không được ghi vào manifest của shard (kể cả sửa dòng cuối cắt dở)
+        shard_entries, _ = read_manifest(manifest_path)
+        for key, entry in shard_entries.items():
+            current = chosen.get(key)
+            if current is not None:
+                stats['duplicates'] += 1
+            if _better(entry, current[1] if current else None):
+                chosen[key] = (directory, entry)
+
+    # 2. Chép thư mục History + ghi manifest kho
+    # Khóa vị trí cũ (_location_key) -> thư mục / gói mới trong kho
+    folder_map: Dict[Tuple[str, Optional[str], str], str] = {}
+    # (shard, tên gói) -> gói đã chép sang kho (1 gói chứa nhiều ảnh, chỉ chép 1 lần)
+    pack_map: Dict[Tuple[str, str], str] = {}
+    # Ảnh đã gộp -> shard được chọn (cho dòng CSV không có thư mục History, vd. mức lưu 'text')
+    merged_sources: Dict[str, str] = {}
+    try:
+        for key, (directory, entry) in sorted(chosen.items()):
+            existing = dest_manifest.entries.get(key)
+            if existing is not None and existing.get('hash') == entry.get('hash') and not _better(entry, existing):
+                stats['skipped'] += 1
+                continue
+            entry = dict(entry)
+            result = dict(entry.get('result') or {})
+            old_dir = result.get('history_dir')
+            if old_dir:
+                location = _location_key(directory, old_dir)
+                # Nhiều ảnh có thể cùng 1 thư mục History (gộp sighting) -> chỉ chép 1 lần
+                target = folder_map.get(location) or _copy_location(location, dest_history, move, pack_map, stats)
+                if target is not None:
+                    folder_map[location] = target
+                    result['history_dir'] = _relocate(old_dir, target) if location[1] else target
+                else:
+                    result['history_dir'] = None
+                entry['result'] = result
+            dest_manifest.append_entry(entry)
+            merged_sources[key] = directory
+            stats['images'] += 1
+    finally:
+        dest_manifest.close()
+
+    # 3. Gộp CSV: chỉ giữ dòng của bản ghi được chọn, đổi đường dẫn sang kho
+    if merged_sources:
+        stats['rows'] = _merge_csv(shard_dirs, folder_map, merged_sources, os.path.join(dest_history, HISTORY_CSV_FILE))
+    return stats
+
+
+def _copy_location(location: Tuple[str, Optional[str], str], dest_history: str, move: bool,
+                   pack_map: Dict[Tuple[str, str], str], stats: Dict[str, int]) -> Optional[str]:
+    """Chép thư mục History / gói .pack của shard sang kho, trả về vị trí mới (None nếu thiếu)"""
+    directory, pack_name, name = location
+    if pack_name is None:
+        source = os.path.join(directory, 'history', name)
+        if not os.path.isdir(source):
+            print(f"⚠ {directory}: thiếu thư mục History {name}")
+            return None
+        target = _unique_dir(dest_history, name)
+        if move:
+            shutil.move(source, target)
+        else:
+            shutil.copytree(source, target)
+        stats['folders'] += 1
+        return target
+
+    target = pack_map.get((directory, pack_name))
+    if target is not None:
+        return target
+    source = os.path.join(directory, 'history', HISTORY_PACK_DIR, pack_name)
+    if not os.path.isfile(source):
+        print(f"⚠ {directory}: thiếu gói {pack_name}")
+        return None
+    os.makedirs(os.path.join(dest_history, HISTORY_PACK_DIR), exist_ok=True)
+    stem = os.path.splitext(pack_name)[0]
+    target = os.path.join(dest_history, HISTORY_PACK_DIR, pack_name)
+    suffix = 0
+    while os.path.exists(target):
+        suffix += 1
+        target = os.path.join(dest_history, HISTORY_PACK_DIR, f"{stem}_{suffix}.pack")
+    transfer = shutil.move if move else shutil.copyfile
+    transfer(source, target)
+    if os.path.isfile(index_path(source)):
+        transfer(index_path(source), index_path(target))
+    pack_map[(directory, pack_name)] = target
+    stats['packs'] += 1
+    return target
+
+
+def _merge_csv(shard_dirs: List[str], folder_map: Dict[Tuple[str, Optional[str], str], str],
+               merged_sources: Dict[str, str], dest_csv: str) -> int:
+    header = None
+    rows = []
+    for directory in shard_dirs:
+        csv_path = os.path.join(directory, 'history', HISTORY_CSV_FILE)
+        if not os.path.isfile(csv_path):
+            continue
+        with open(csv_path, 'r', newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            shard_header = next(reader, None)
+            header = header or shard_header
+            for row in reader:
+                if len(row) < 4:
+                    continue
+                # Các cột từ cột 4 là đường dẫn ảnh: History/{thư mục}/{file}, tham chiếu gói
+                # hoặc file nguồn (ảnh gốc ở chế độ 'reference' / mức lưu 'text')
+                locations = [_location_key(directory, value if is_archive_ref(value) else os.path.dirname(value))
+                             if value else None for value in row[3:]]
+                location = next((loc for loc in locations if loc in folder_map), None)
+                if location is not None:
+                    target = folder_map[location]
+                    new_row = row[:3]
+                    for value, value_location in zip(row[3:], locations):
+                        new_row.append(_relocate(value, target) if value_location == location else value)
+                    rows.append(new_row)
+                elif row[3] and merged_sources.get(os.path.abspath(row[3])) == directory:
+                    rows.append(row)
+
+    file_exists = os.path.isfile(dest_csv)
+    seen = set()
+    if file_exists:
+        with open(dest_csv, 'r', newline='', encoding='utf-8-sig') as f:
+            seen = {tuple(row) for row in csv.reader(f)}
+    written = 0
+    with open(dest_csv, mode='a', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        if not file_exists and header:
+            writer.writerow(header)
+        for row in rows:
+            if tuple(row) in seen:
+                continue
+            seen.add(tuple(row))
+            writer.writerow(row)
+            written += 1
+    return written
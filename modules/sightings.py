@@ -0,0 +1,286 @@
+"""
+Module gộp các lần đọc lặp lại của cùng 1 biển số (sighting)
+- Xe đứng chờ ở cổng tạo ra hàng chục ảnh liên tiếp cùng biển số
+- Các lần đọc cùng (nguồn, biển số) cách nhau không quá SIGHTING_WINDOW giây được gộp thành 1 sự kiện
+- Mỗi sự kiện chỉ ghi History 1 lần (ảnh có confidence cao nhất) và 1 dòng JSONL
+  (số lần đọc, thời điểm thấy đầu tiên / cuối cùng) vào {History}/sightings.jsonl
+- Sự kiện đang mở của ảnh có file trên đĩa chỉ giữ đường dẫn + PlateResult (bbox, ROI),
+  ảnh preview / ảnh đã vẽ được giải mã và vẽ lại lúc ghi History
+"""
+
+import dataclasses
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from .config import SIGHTING_WINDOW, SIGHTING_MAX_OPEN, SIGHTING_EVENTS_FILE
+from .image_io import DecodedImage
+from .results import PlateResult, RETENTION_DEBUG
+from .search import normalize_plate
+
+log = logging.getLogger(__name__)
+
+
+def default_source(file_path: str) -> str:
+    """Nguồn của ảnh: thư mục chứa ảnh (mỗi camera / làn 1 thư mục)"""
+    return os.path.dirname(os.path.abspath(file_path))
+
+
+def capture_time(file_path: str) -> float:
+    """Thời điểm chụp: mtime của file ảnh, không có file (ảnh upload) thì lấy giờ hiện tại"""
+    try:
+        return os.path.getmtime(file_path)
+    except OSError:
+        return time.time()
+
+
+@dataclass
+class Sighting:
+    """1 lần xe xuất hiện trước 1 nguồn (gộp nhiều lần đọc)"""
+    source: str
+    plate: str                             # Biển số đã normalize (khóa gộp)
+    first_seen: float
+    last_seen: float
+    count: int = 0
+    # Lần đọc tốt nhất: (đường dẫn ảnh, ảnh PIL, PlateResult, ảnh đã vẽ)
+    # Ảnh có file trên đĩa: ảnh PIL / ảnh đã vẽ là None (giải mã lại khi ghi History)
+    best: Optional[Tuple[str, Any, PlateResult, Any]] = None
+    best_confidence: float = -1.0
+    # time.monotonic() lần cập nhật cuối (để biết sự kiện đã hết hay chưa)
+    touched: float = field(default_factory=time.monotonic)
+    # Ảnh của từng lần đọc (báo on_saved khi sự kiện đã ghi History)
+    files: List[str] = field(default_factory=list)
+
+    def accepts(self, seen: float, window: float) -> bool:
+        """Lần đọc lúc seen thuộc sự kiện này (ảnh có thể đến không theo thứ tự thời gian)"""
+        return self.first_seen - window <= seen <= self.last_seen + window
+
+    def add(self, file_path, image_pil, det: PlateResult, processed_pil, seen: float):
+        self.count += 1
+        self.files.append(file_path)
+        self.first_seen = min(self.first_seen, seen)
+        self.last_seen = max(self.last_seen, seen)
+        self.touched = time.monotonic()
+        confidence = det.confidence if det.confidence is not None else 0.0
+        if self.best is None or confidence > self.best_confidence:
+            if file_path and os.path.isfile(file_path):
+                # Không giữ ảnh toàn cảnh: 256 sự kiện mở x (preview + ảnh đã vẽ) có thể lên tới GB
+                image_pil = processed_pil = None
+            # Bản sao nông: pipeline gọi release_images() trên bản gốc ngay sau khi lưu
+            self.best = (file_path, image_pil, dataclasses.replace(det), processed_pil)
+            self.best_confidence = confidence
+
+
+class SightingAggregator:
+    """
+    Bọc HistoryLogger: gộp các lần đọc lặp lại trước khi ghi History
+
+    Dùng thay cho logger trong pipeline (cùng giao diện save_result / close):
+        aggregator = SightingAggregator(HistoryLogger())
+        pipeline = build_recognition_pipeline(detector, ocr, aggregator)
+        ...
+        aggregator.close()   # ghi nốt các sự kiện đang mở
+
+    History của 1 ảnh chỉ được ghi khi các sự kiện chứa ảnh đó kết thúc. Cần biết lúc nào ảnh
+    đã thực sự được lưu (vd. đánh dấu xong trong manifest) thì truyền on_saved.
+    """
+
+    def __init__(self, logger, window: float = SIGHTING_WINDOW, max_open: int = SIGHTING_MAX_OPEN,
+                 events_path: Optional[str] = None, source_of: Callable[[str], str] = default_source,
+                 on_saved: Optional[Callable[[str, Optional[str], List[str]], None]] = None,
+                 draw: Optional[Callable[[np.ndarray, List[PlateResult]], np.ndarray]] = None):
+        """
+        Args:
+            logger: HistoryLogger ghi lần đọc tốt nhất của mỗi sự kiện
+            window: Khoảng cách tối đa (giây) giữa 2 lần đọc để gộp vào cùng 1 sự kiện
+            max_open: Số sự kiện mở tối đa (vượt quá -> ghi sự kiện cũ nhất)
+            events_path: File JSONL sự kiện (None = {logger.base_dir}/sightings.jsonl)
+            source_of: Hàm lấy nguồn (camera / làn) từ đường dẫn ảnh
+            on_saved: Hàm (đường dẫn ảnh, thư mục History hoặc None nếu lỗi, biển số) gọi khi mọi
+                      lần đọc của ảnh đã được ghi History
+            draw: Hàm vẽ kết quả lên ảnh (vd. detector.draw_detections) để vẽ lại ảnh toàn cảnh
+                  lúc ghi History ở mức debug (None = không lưu ảnh toàn cảnh cho sự kiện)
+        """
+        self.logger = logger
+        self.window = window
+        self.max_open = max_open
+        self.events_path = events_path or os.path.join(logger.base_dir, SIGHTING_EVENTS_FILE)
+        self.source_of = source_of
+        self.on_saved = on_saved
+        self.draw = draw
+        # Ảnh còn lần đọc chưa ghi: đường dẫn -> [số lần đọc chưa ghi, thư mục History, biển số, lỗi]
+        self._pending: Dict[str, list] = {}
+        self._open: Dict[Tuple[str, str], Sighting] = {}
+        self._lock = threading.Lock()
+        self._events_lock = threading.Lock()
+        self._events = None
+        self.reads = 0
+        self.sightings = 0
+        # Ghi các sự kiện đã hết hạn cả khi không có ảnh mới (làn vắng xe)
+        self._stop = threading.Event()
+        self._sweeper = threading.Thread(target=self._sweep_loop, daemon=True, name="sighting-sweeper")
+        self._sweeper.start()
+
+    @property
+    def base_dir(self):
+        return self.logger.base_dir
+
+    @property
+    def required_retention(self):
+        return self.logger.required_retention
+
+    def new_batch(self):
+        self.logger.new_batch()
+
+    def save_result(self, original_image_path, original_image_pil, detections, processed_image_pil=None):
+        """
+        Ghi nhận kết quả 1 ảnh (cùng tham số với HistoryLogger.save_result)
+
+        Ảnh không có biển số được ghi thẳng. Các biển số được gộp vào sự kiện đang mở,
+        History chỉ được ghi khi sự kiện kết thúc.
+
+        Returns:
+            "" (kết quả đã được ghi nhận, History ghi sau, thư mục thật báo qua on_saved)
+            hoặc kết quả của logger khi ghi thẳng
+        """
+        if not detections:
+            history = self.logger.save_result(original_image_path, original_image_pil, detections,
+                                              processed_image_pil=processed_image_pil)
+            if self.on_saved is not None:
+                self.on_saved(original_image_path, history, [])
+            return history
+        source = self.source_of(original_image_path)
+        seen = capture_time(original_image_path)
+        finished = []
+        with self._lock:
+            for det in detections:
+                key = (source, normalize_plate(det.text))
+                sighting = self._open.get(key)
+                if sighting is not None and not sighting.accepts(seen, self.window):
+                    finished.append(self._open.pop(key))
+                    sighting = None
+                if sighting is None:
+                    sighting = self._open[key] = Sighting(source, key[1], seen, seen)
+                sighting.add(original_image_path, original_image_pil, det, processed_image_pil, seen)
+                pending = self._pending.setdefault(original_image_path, [0, None, [], False])
+                pending[0] += 1
+                pending[2].append(det.text)
+                self.reads += 1
+            finished.extend(self._pop_expired())
+        self._flush(finished)
+        return ""
+
+    def _pop_expired(self, force: bool = False) -> List[Sighting]:
+        """Lấy ra các sự kiện đã hết (gọi khi đang giữ self._lock)"""
+        deadline = time.monotonic() - self.window
+        expired = [key for key, s in self._open.items() if force or s.touched < deadline]
+        finished = [self._open.pop(key) for key in expired]
+        if len(self._open) > self.max_open:
+            oldest = sorted(self._open, key=lambda key: self._open[key].touched)
+            finished.extend(self._open.pop(key) for key in oldest[:len(self._open) - self.max_open])
+        return finished
+
+    def _sweep_loop(self):
+        interval = max(min(self.window, 1.0), 0.1)
+        while not self._stop.wait(interval):
+            with self._lock:
+                finished = self._pop_expired()
+            self._flush(finished)
+
+    def _flush(self, finished: List[Sighting]):
+        """Ghi History (lần đọc tốt nhất) và dòng sự kiện cho các sự kiện đã kết thúc"""
+        for sighting in finished:
+            file_path, image_pil, det, processed_pil = sighting.best
+            if image_pil is None:
+                image_pil, processed_pil = self._reload(file_path, det)
+            history = self.logger.save_result(file_path, image_pil, [det], processed_image_pil=processed_pil)
+            det.release_images()
+            sighting.best = None
+            self._write_event({
+                'source': sighting.source,
+                'plate': det.text,
+                'vehicle_type': det.vehicle_type,
+                'count': sighting.count,
+                'first_seen': datetime.fromtimestamp(sighting.first_seen).isoformat(timespec='seconds'),
+                'last_seen': datetime.fromtimestamp(sighting.last_seen).isoformat(timespec='seconds'),
+                'confidence': round(float(det.confidence), 4) if det.confidence is not None else None,
+                'image': file_path,
+                'history': history,
+            })
+            self.sightings += 1
+            self._mark_saved(sighting.files, history)
+
+    def _reload(self, file_path: str, det: PlateResult):
+        """
+        Giải mã lại preview (cùng tọa độ bbox) và vẽ lại ảnh toàn cảnh cho lần đọc tốt nhất
+
+        File nguồn còn trên đĩa thì logger chỉ cần ảnh PIL khi lưu ảnh toàn cảnh (mức debug).
+        """
+        needs_image = not os.path.isfile(file_path) or (
+            self.draw is not None and self.logger.required_retention == RETENTION_DEBUG)
+        if not needs_image:
+            return None, None
+        try:
+            preview = DecodedImage(file_path).preview
+        except OSError as e:
+            log.error("❌ Không giải mã lại được ảnh %s: %s", file_path, e)
+            return None, None
+        if self.draw is None:
+            return preview, None
+        return preview, Image.fromarray(self.draw(np.array(preview), [det]))
+
+    def _mark_saved(self, files: List[str], history: Optional[str]):
+        """Trừ các lần đọc đã ghi, báo on_saved cho ảnh không còn lần đọc nào chờ"""
+        done = []
+        with self._lock:
+            for file_path in files:
+                pending = self._pending.get(file_path)
+                if pending is None:
+                    continue
+                pending[0] -= 1
+                if history is None:
+                    pending[3] = True
+                elif not pending[1]:
+                    pending[1] = history
+                if pending[0] <= 0:
+                    del self._pending[file_path]
+                    done.append((file_path, None if pending[3] else pending[1], pending[2]))
+        if self.on_saved is not None:
+            for file_path, history_dir, plates in done:
+                self.on_saved(file_path, history_dir, plates)
+
+    def _write_event(self, event: Dict[str, Any]):
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with self._events_lock:
+            if self._events is None:
+                folder = os.path.dirname(self.events_path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                self._events = open(self.events_path, 'a', encoding='utf-8')
+            self._events.write(line)
+            self._events.flush()
+
+    def flush(self):
+        """Ghi ngay mọi sự kiện đang mở"""
+        with self._lock:
+            finished = self._pop_expired(force=True)
+        self._flush(finished)
+
+    def close(self):
+        """Ghi nốt các sự kiện đang mở rồi đóng logger"""
+        self._stop.set()
+        self._sweeper.join()
+        self.flush()
+        with self._events_lock:
+            if self._events is not None:
+                self._events.close()
+                self._events = None
+        self.logger.close()
+        if self.reads:
+            print(f"🚗 Gộp {self.reads} lần đọc biển số thành {self.sightings} sự kiện")
@@ -0,0 +1,131 @@
+"""
+Module cache thumbnail cho giao diện kết quả
+- LRU trong RAM có giới hạn số lượng
+- (Tùy chọn) cache trên đĩa: thumbnail bị đẩy khỏi RAM vẫn lấy lại được rẻ
+- Tạo thumbnail trên worker của pipeline, không chạy trên Tk main thread
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+from PIL import Image
+from .metrics import CACHE_REQUESTS
+from .config import THUMBNAIL_HEIGHT, THUMBNAIL_CACHE_SIZE, THUMBNAIL_CACHE_DIR
+
+
+def make_thumbnail(image: Image.Image, height: int = THUMBNAIL_HEIGHT) -> Image.Image:
+    """
+    Resize ảnh về chiều cao cố định, giữ nguyên tỉ lệ
+
+    Args:
+        image: Ảnh PIL
+        height: Chiều cao thumbnail
+
+    Returns:
+        Ảnh thumbnail (RGB)
+    """
+    h_percent = height / float(image.size[1])
+    w_size = max(1, int(float(image.size[0]) * h_percent))
+    # Thu nhỏ nhiều lần: reduce() theo hệ số nguyên trước rồi mới LANCZOS -> rẻ hơn nhiều
+    factor = int(image.size[1] // (2 * height))
+    if factor >= 2:
+        image = image.reduce(factor)
+    thumb = image.resize((w_size, height), Image.Resampling.LANCZOS)
+    if thumb.mode != 'RGB':
+        thumb = thumb.convert('RGB')
+    return thumb
+
+
+class ThumbnailCache:
+    """
+    Cache thumbnail có giới hạn (LRU trong RAM + thư mục trên đĩa)
+    """
+
+    def __init__(self, max_items: int = THUMBNAIL_CACHE_SIZE, cache_dir: Optional[str] = THUMBNAIL_CACHE_DIR,
+                 height: int = THUMBNAIL_HEIGHT):
+        """
+        Args:
+            max_items: Số thumbnail tối đa giữ trong RAM
+            cache_dir: Thư mục cache trên đĩa (None = thư mục tạm, xóa khi close)
+            height: Chiều cao thumbnail
+        """
+        self.max_items = max_items
+        self.height = height
+        self._owns_dir = cache_dir is None
+        self.cache_dir = cache_dir or tempfile.mkdtemp(prefix="lpr_thumbs_")
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._memory: "OrderedDict[str, Image.Image]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _disk_path(self, key: str) -> str:
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.jpg")
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """
+        Lấy thumbnail (RAM trước, sau đó đĩa)
+
+        Returns:
+            Ảnh PIL hoặc None nếu chưa có
+        """
+        with self._lock:
+            thumb = self._memory.get(key)
+            if thumb is not None:
+                self._memory.move_to_end(key)
+                CACHE_REQUESTS.inc(cache='thumbnail_memory', result='hit')
+                return thumb
+        CACHE_REQUESTS.inc(cache='thumbnail_memory', result='miss')
+
+        path = self._disk_path(key)
+        if not os.path.isfile(path):
+            CACHE_REQUESTS.inc(cache='thumbnail_disk', result='miss')
+            return None
+        try:
+            with Image.open(path) as f:
+                thumb = f.convert('RGB')
+        except Exception:
+            CACHE_REQUESTS.inc(cache='thumbnail_disk', result='miss')
+            return None
+        CACHE_REQUESTS.inc(cache='thumbnail_disk', result='hit')
+        self._remember(key, thumb)
+        return thumb
+
+    def _remember(self, key: str, thumb: Image.Image):
+        with self._lock:
+            self._memory[key] = thumb
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def put(self, key: str, thumb: Image.Image):
+        """Lưu thumbnail vào RAM và đĩa"""
+        self._remember(key, thumb)
+        try:
+            thumb.save(self._disk_path(key), quality=85)
+        except Exception as e:
+            print(f"⚠️ Không ghi được thumbnail cache: {e}")
+
+    def render(self, key: str, image: Image.Image) -> Image.Image:
+        """Tạo thumbnail từ ảnh và lưu vào cache (chạy trên thread gọi)"""
+        thumb = make_thumbnail(image, self.height)
+        self.put(key, thumb)
+        return thumb
+
+    def clear(self):
+        """Xóa toàn bộ thumbnail (RAM và đĩa)"""
+        with self._lock:
+            self._memory.clear()
+        for name in os.listdir(self.cache_dir):
+            try:
+                os.unlink(os.path.join(self.cache_dir, name))
+            except OSError:
+                pass
+
+    def close(self):
+        """Xóa thư mục tạm (nếu do cache tự tạo)"""
+        if self._owns_dir:
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
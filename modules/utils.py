@@ -4,7 +4,7 @@ Bao gồm: validation, formatting, character mapping, và phân loại xe
 """
 
 import re
-from typing import List
+from typing import List, Optional, Tuple
 from .config import VALID_PROVINCE_START, VALID_PROVINCE_END
 
 # --- MÃ TỈNH THÀNH VIỆT NAM (11-99, trừ 13) ---
@@ -14,6 +14,21 @@ VALID_PROVINCE_CODES.discard(13)  # Loại bỏ mã 13
 # --- CHỮ CÁI SERIES HỢP LỆ (20 chữ, không có I, J, O, Q, R, W) ---
 VALID_SERIES_LETTERS = set('ABCDEFGHKLMNPSTUVXYZ')
 
+# --- NGỮ PHÁP BIỂN SỐ (dùng cho giải mã có ràng buộc) ---
+# Ký hiệu mẫu: 'D' = chữ số, 'L' = chữ cái series hợp lệ
+# Dòng 1: Ô tô (NNL), Xe máy thường (NNLN), Xe máy 50cc (NNLL)
+PLATE_LINE1_PATTERNS = ('DDL', 'DDLD', 'DDLL')
+# Dòng số (serial): 4 số (biển cũ) hoặc 5 số (biển mới)
+PLATE_SERIAL_LENGTHS = (4, 5)
+# Mẫu đầy đủ của biển số (ghép dòng 1 + dòng số)
+PLATE_PATTERNS = tuple(
+    line1 + 'D' * n
+    for line1 in PLATE_LINE1_PATTERNS
+    for n in PLATE_SERIAL_LENGTHS
+)
+# Các ký tự có thể xuất hiện trên biển số (dùng làm allowlist cho OCR)
+PLATE_CHARSET = '0123456789' + ''.join(sorted(VALID_SERIES_LETTERS))
+
 # --- MAPPING CHỮ CÁI KHÔNG HỢP LỆ THÀNH HỢP LỆ ---
 # Sửa các chữ cái không có trong biển số VN thành chữ tương tự
 INVALID_CHAR_MAPPING = {
@@ -169,6 +184,69 @@ def validate_province_code(code_str: str) -> bool:
         return False
 
 
+def _province_strings():
+    """Tập mã tỉnh hợp lệ dạng chuỗi 2 ký tự ('11', '12', '14', ...)"""
+    return {f"{code:02d}" for code in VALID_PROVINCE_CODES}
+
+
+VALID_PROVINCE_STRINGS = _province_strings()
+_VALID_PROVINCE_FIRST_DIGITS = {code[0] for code in VALID_PROVINCE_STRINGS}
+
+
+def _char_matches_slot(char: str, slot: str) -> bool:
+    """Kiểm tra một ký tự có khớp với ô trong mẫu ('D' hoặc 'L') không"""
+    if slot == 'D':
+        return char.isdigit()
+    return char in VALID_SERIES_LETTERS
+
+
+def is_plate_prefix(text: str, patterns: Tuple[str, ...] = PLATE_PATTERNS) -> bool:
+    """
+    Kiểm tra text có thể là phần đầu của một biển số hợp lệ không
+    
+    Dùng để cắt tỉa beam trong giải mã có ràng buộc: chỉ mở rộng các
+    tiền tố còn khả năng trở thành biển số đúng ngữ pháp.
+    
+    Args:
+        text: Tiền tố (chỉ gồm A-Z, 0-9)
+        patterns: Danh sách mẫu ('D'/'L') được phép
+        
+    Returns:
+        True nếu tồn tại ít nhất một mẫu nhận tiền tố này
+    """
+    # Ràng buộc mã tỉnh (11-99, trừ 13)
+    if len(text) >= 1 and text[0] not in _VALID_PROVINCE_FIRST_DIGITS:
+        return False
+    if len(text) >= 2 and text[:2] not in VALID_PROVINCE_STRINGS:
+        return False
+    
+    for pattern in patterns:
+        if len(text) > len(pattern):
+            continue
+        if all(_char_matches_slot(c, slot) for c, slot in zip(text, pattern)):
+            return True
+    return False
+
+
+def match_plate_pattern(text: str, patterns: Tuple[str, ...] = PLATE_PATTERNS) -> Optional[str]:
+    """
+    Tìm mẫu biển số khớp hoàn toàn với text
+    
+    Args:
+        text: Text biển số (chỉ gồm A-Z, 0-9)
+        patterns: Danh sách mẫu ('D'/'L') được phép
+        
+    Returns:
+        Mẫu khớp (ví dụ 'DDLDDDDD'), hoặc None nếu không khớp mẫu nào
+    """
+    if len(text) < 2 or text[:2] not in VALID_PROVINCE_STRINGS:
+        return None
+    for pattern in patterns:
+        if len(text) == len(pattern) and all(_char_matches_slot(c, slot) for c, slot in zip(text, pattern)):
+            return pattern
+    return None
+
+
 def fix_plate_chars(raw_text: str, is_50cc: bool = False) -> str:
     """
     Sửa lỗi ký tự dựa trên pattern biển số Việt Nam
@@ -0,0 +1,399 @@
+"""
+Module theo dõi thư mục ảnh (watch folder) và xử lý ảnh mới liên tục
+- Linux: inotify (qua ctypes, không cần thư viện ngoài) -> gần như 0% CPU khi rảnh
+- Hệ điều hành khác / thư mục mạng: quét định kỳ (polling)
+- Chỉ xử lý file đã ghi xong (kích thước + mtime không đổi trong WATCH_STABLE_SECONDS)
+- Lưu con trỏ (cursor) theo từng thư mục: khởi động lại không xử lý lại ảnh cũ
+- Ảnh mới trong lúc chạy được xử lý kể cả khi mtime cũ hơn cursor (lệch giờ camera, mv / cp -p)
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+from .config import (IMAGE_EXTENSIONS, WATCH_POLL_INTERVAL, WATCH_STABLE_SECONDS, WATCH_CURSOR_FILE,
+                     WATCH_PROCESSED_MAX)
+from .pipeline import PipelineItem, build_recognition_pipeline
+
+# Khóa sắp xếp / con trỏ của 1 file: (mtime_ns, tên file)
+FileKey = Tuple[int, str]
+
+# inotify (xem <sys/inotify.h>)
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_NONBLOCK = os.O_NONBLOCK
+_IN_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_image_file(name: str) -> bool:
+    return name.lower().endswith(IMAGE_EXTENSIONS) and not name.startswith('.')
+
+
+def scan_images(directory: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Quét thư mục (không đệ quy)
+
+    Returns:
+        Dict path -> (size, mtime_ns)
+    """
+    found = {}
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and is_image_file(entry.name):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    found[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    except OSError as e:
+        print(f"⚠ Không quét được thư mục {directory}: {e}")
+    return found
+
+
+class PollingWatcher:
+    """Phát hiện file mới / thay đổi bằng cách quét định kỳ"""
+
+    def __init__(self, directories: List[str], interval: float = WATCH_POLL_INTERVAL):
+        self.directories = directories
+        self.interval = interval
+        self._known: Dict[str, Tuple[int, int]] = {}
+        for directory in directories:
+            self._known.update(scan_images(directory))
+
+    def wait(self, timeout: Optional[float] = None) -> List[Tuple[str, bool]]:
+        """
+        Chờ tối đa timeout (hoặc interval) rồi trả về các file mới / thay đổi
+
+        Returns:
+            List (path, closed). Polling không biết file đã đóng chưa -> luôn True,
+            việc chờ ghi xong dựa hoàn toàn vào kiểm tra kích thước ổn định.
+        """
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        changed = []
+        current = {}
+        for directory in self.directories:
+            current.update(scan_images(directory))
+        for path, stat in current.items():
+            if self._known.get(path) != stat:
+                changed.append((path, True))
+        self._known = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Phát hiện file mới bằng inotify (Linux), block trong kernel khi không có sự kiện"""
+
+    MASK = _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE | _IN_MODIFY
+
+    def __init__(self, directories: List[str]):
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 thất bại")
+        self.directories = directories
+        self._wd_to_dir: Dict[int, str] = {}
+        for directory in directories:
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), self.MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                os.close(self._fd)
+                raise OSError(err, f"inotify_add_watch thất bại: {directory}")
+            self._wd_to_dir[wd] = directory
+
+    def wait(self, timeout: Optional[float] = None) -> List[Tuple[str, bool]]:
+        """
+        Chờ sự kiện (tối đa timeout giây) và trả về các file liên quan
+
+        Returns:
+            List (path, closed): closed = True khi file đã được đóng sau khi ghi
+            (IN_CLOSE_WRITE) hoặc được move vào thư mục (IN_MOVED_TO)
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        changed = []
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b'\0').decode(errors='surrogateescape')
+            offset += name_len
+            if mask & _IN_Q_OVERFLOW:
+                # Tràn hàng đợi sự kiện -> quét lại toàn bộ
+                for directory in self.directories:
+                    changed.extend((path, True) for path in scan_images(directory))
+                continue
+            directory = self._wd_to_dir.get(wd)
+            if directory is not None and name and is_image_file(name):
+                closed = bool(mask & (_IN_CLOSE_WRITE | _IN_MOVED_TO))
+                changed.append((os.path.join(directory, name), closed))
+        return changed
+
+    def close(self):
+        os.close(self._fd)
+
+
+def create_watcher(directories: List[str], force_polling: bool = False):
+    """inotify nếu có (Linux), ngược lại polling"""
+    if not force_polling and hasattr(select, 'select') and os.name == 'posix':
+        try:
+            watcher = InotifyWatcher(directories)
+            print("👀 Theo dõi thư mục bằng inotify")
+            return watcher
+        except (OSError, AttributeError) as e:
+            print(f"⚠ Không dùng được inotify ({e}), chuyển sang polling")
+    print(f"👀 Theo dõi thư mục bằng polling ({WATCH_POLL_INTERVAL}s)")
+    return PollingWatcher(directories)
+
+
+class WatchCursor:
+    """
+    Con trỏ tiến độ theo từng thư mục, lưu ra file JSON
+
+    Con trỏ là (mtime_ns, tên file) của file cuối cùng đã xử lý xong, file có
+    khóa nhỏ hơn hoặc bằng được coi là đã xử lý. Chỉ dùng để bỏ qua tồn đọng lúc
+    khởi động: file được chép vào lúc daemon dừng mà giữ nguyên mtime cũ hơn cursor
+    sẽ bị bỏ qua (lúc đang chạy thì daemon nhớ theo tên file, xem FolderWatchDaemon).
+    """
+
+    def __init__(self, path: str = WATCH_CURSOR_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cursors: Dict[str, FileKey] = {}
+        if os.path.isfile(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    raw = json.load(f)
+                self._cursors = {d: (int(v['mtime_ns']), v['name']) for d, v in raw.items()}
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"⚠ Không đọc được cursor {path}, bắt đầu lại từ đầu: {e}")
+
+    def get(self, directory: str) -> Optional[FileKey]:
+        with self._lock:
+            return self._cursors.get(os.path.abspath(directory))
+
+    def is_done(self, directory: str, key: FileKey) -> bool:
+        cursor = self.get(directory)
+        return cursor is not None and key <= cursor
+
+    def advance(self, directory: str, key: FileKey):
+        """Tiến con trỏ và ghi file (ghi atomic qua file tạm)"""
+        with self._lock:
+            directory = os.path.abspath(directory)
+            current = self._cursors.get(directory)
+            if current is not None and key <= current:
+                return
+            self._cursors[directory] = key
+            data = {d: {'mtime_ns': k[0], 'name': k[1]} for d, k in self._cursors.items()}
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class FolderWatchDaemon:
+    """
+    Theo dõi thư mục và đưa ảnh mới vào pipeline nhận diện
+
+    - Khởi động: xử lý hết tồn đọng (ảnh mới hơn cursor) với toàn bộ throughput của pipeline
+    - Sau đó: chờ sự kiện, đợi file ghi xong rồi xử lý
+    - Cursor chỉ tiến qua đoạn liên tục đã xử lý xong (pipeline có thể trả kết quả không theo thứ tự).
+      Ảnh lỗi chặn cursor tại đó để lần khởi động sau xử lý lại, trừ khi chính ảnh đó được xử lý lại
+      thành công trong phiên (file bị ghi lại)
+    - Ảnh mới lúc đang chạy không so với cursor mà với tập (đường dẫn, mtime) đã xử lý thành công
+    """
+
+    def __init__(self, directories: List[str], detector, ocr, logger=None, cursor: Optional[WatchCursor] = None,
+                 force_polling: bool = False, stable_seconds: float = WATCH_STABLE_SECONDS, on_result=None,
+                 watchlist=None):
+        """
+        Args:
+            directories: Các thư mục cần theo dõi
+            detector: LicensePlateDetector
+            ocr: LicensePlateOCR
+            logger: HistoryLogger (None = không lưu lịch sử)
+            cursor: WatchCursor (None = WATCH_CURSOR_FILE)
+            force_polling: Dùng polling kể cả khi có inotify
+            stable_seconds: File phải không đổi trong khoảng này mới được xử lý
+            on_result: Callback nhận PipelineItem sau khi xử lý xong
+            watchlist: Watchlist tra từng biển số (None = không tra)
+        """
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.cursor = cursor or WatchCursor()
+        self.stable_seconds = stable_seconds
+        self.on_result = on_result
+        self.force_polling = force_polling
+        self.pipeline = build_recognition_pipeline(detector, ocr, logger, on_result=self._handle_result,
+                                                   watchlist=watchlist)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._next_index = 0
+        self._submitted: Dict[str, deque] = {d: deque() for d in self.directories}
+        # Các (khóa, path) đã xong nhưng chưa tới lượt tiến cursor
+        self._completed: Dict[str, set] = {d: set() for d in self.directories}
+        # path -> các (khóa, path) bị lỗi (chặn cursor tới khi file được xử lý lại thành công)
+        self._failed: Dict[str, Dict[str, list]] = {d: {} for d in self.directories}
+        # path -> khóa đang trong pipeline
+        self._in_flight: Dict[str, FileKey] = {}
+        # path -> mtime_ns đã xử lý thành công (giới hạn WATCH_PROCESSED_MAX, cũ nhất bị bỏ trước)
+        self._processed: 'OrderedDict[str, int]' = OrderedDict()
+        # path -> (size, mtime_ns, thời điểm quan sát lần cuối thấy thay đổi, đã đóng file chưa)
+        self._pending: Dict[str, Tuple[int, int, float, bool]] = {}
+        self.processed = 0
+
+    @staticmethod
+    def _file_key(path: str, mtime_ns: int) -> FileKey:
+        return (mtime_ns, os.path.basename(path))
+
+    def _submit(self, path: str, mtime_ns: int):
+        directory = os.path.dirname(path)
+        key = self._file_key(path, mtime_ns)
+        with self._lock:
+            if path in self._in_flight:
+                return
+            self._in_flight[path] = key
+            self._submitted[directory].append((key, path))
+            item = PipelineItem(index=self._next_index, file_path=path)
+            self._next_index += 1
+        self.pipeline.submit(item)
+
+    def _handle_result(self, item: PipelineItem):
+        directory = os.path.dirname(item.file_path)
+        with self._lock:
+            entry = (self._in_flight.pop(item.file_path), item.file_path)
+            completed = self._completed[directory]
+            failed = self._failed[directory]
+            self.processed += 1
+            if item.error is None:
+                completed.add(entry)
+                # Xử lý lại thành công thay cho các lần lỗi trước của cùng file
+                completed.update(failed.pop(item.file_path, ()))
+                self._processed[item.file_path] = entry[0][0]
+                self._processed.move_to_end(item.file_path)
+                while len(self._processed) > WATCH_PROCESSED_MAX:
+                    self._processed.popitem(last=False)
+            else:
+                failed.setdefault(item.file_path, []).append(entry)
+            # Tiến cursor qua đoạn đầu đã xong liên tục (dừng ở ảnh lỗi)
+            submitted = self._submitted[directory]
+            last_key = None
+            while submitted and submitted[0] in completed:
+                completed.discard(submitted[0])
+                last_key, _ = submitted.popleft()
+        if last_key is not None:
+            self.cursor.advance(directory, last_key)
+        if self.on_result is not None:
+            self.on_result(item)
+
+    def drain_backlog(self) -> int:
+        """
+        Đưa tất cả ảnh chưa xử lý (mới hơn cursor) vào pipeline
+
+        Returns:
+            Số ảnh đã đưa vào
+        """
+        backlog = []
+        for directory in self.directories:
+            for path, (size, mtime_ns) in scan_images(directory).items():
+                if not self.cursor.is_done(directory, self._file_key(path, mtime_ns)):
+                    backlog.append((mtime_ns, path, size))
+        backlog.sort()
+        now = time.time()
+        for mtime_ns, path, size in backlog:
+            # File vừa sửa gần đây có thể còn đang được ghi -> để vòng theo dõi xử lý
+            if now - mtime_ns / 1e9 < self.stable_seconds:
+                self._pending[path] = (size, mtime_ns, time.monotonic(), True)
+                continue
+            self._submit(path, mtime_ns)
+        return len(backlog)
+
+    def _check_pending(self) -> Optional[float]:
+        """
+        Đưa các file đã ổn định vào pipeline
+
+        Returns:
+            Thời gian (giây) tới lần kiểm tra tiếp theo, None nếu không còn file chờ
+        """
+        now = time.monotonic()
+        ready = []
+        next_check = None
+        for path, (size, mtime_ns, seen_at, closed) in list(self._pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # File bị xóa / đổi tên trước khi ghi xong
+                del self._pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self._pending[path] = (stat.st_size, stat.st_mtime_ns, now, closed)
+                wait = self.stable_seconds
+            elif not closed:
+                # inotify: file còn đang mở để ghi -> chờ IN_CLOSE_WRITE
+                continue
+            elif now - seen_at >= self.stable_seconds and stat.st_size > 0:
+                ready.append((mtime_ns, path))
+                del self._pending[path]
+                continue
+            else:
+                wait = self.stable_seconds - (now - seen_at)
+            next_check = wait if next_check is None else min(next_check, wait)
+
+        for mtime_ns, path in sorted(ready):
+            # Không so với cursor: file mới có thể mang mtime cũ (lệch giờ camera, mv / cp -p)
+            with self._lock:
+                done = self._processed.get(path) == mtime_ns
+            if not done:
+                self._submit(path, mtime_ns)
+        return next_check
+
+    def run(self):
+        """Chạy tới khi stop() được gọi (hoặc Ctrl+C)"""
+        watcher = create_watcher(self.directories, force_polling=self.force_polling)
+        try:
+            count = self.drain_backlog()
+            print(f"📥 Tồn đọng: {count} ảnh")
+            next_check = self._check_pending() if self._pending else None
+            while not self._stop.is_set():
+                # Không có file chờ -> block tới khi có sự kiện (tối đa 1s để kiểm tra stop)
+                timeout = 1.0 if next_check is None else max(0.05, min(next_check, 1.0))
+                for path, closed in watcher.wait(timeout):
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entry = self._pending.get(path)
+                    if entry is None:
+                        self._pending[path] = (stat.st_size, stat.st_mtime_ns, time.monotonic(), closed)
+                    elif closed and not entry[3]:
+                        self._pending[path] = entry[:3] + (True,)
+                next_check = self._check_pending() if self._pending else None
+        finally:
+            watcher.close()
+            self.pipeline.close()
+            self.pipeline.join()
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,222 @@
+"""
+Module danh sách theo dõi (watchlist): báo ngay khi nhận diện được xe cần chú ý
+(xe mất cắp, xe được phép ra vào, ...)
+- File danh sách: CSV "biển số,danh sách,ghi chú" (danh sách/ghi chú có thể bỏ trống, '#' = chú thích)
+- Tra cứu bằng dict dựng sẵn: khớp chính xác O(1); khớp khi OCR nhầm cặp ký tự hay nhầm
+  (8/B, 0/D, 5/S, ...) tra thêm vài chục biến thể, không làm chậm pipeline.
+  Ký tự khác nhau mà không phải cặp hay nhầm trực tiếp thì không bao giờ khớp (tránh báo nhầm xe khác)
+- Sửa file danh sách trong lúc chạy -> tự nạp lại (kiểm tra mtime định kỳ), không cần khởi động lại
+- Mỗi lần khớp ghi 1 dòng JSONL vào file sự kiện
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+from .config import WATCHLIST_FILE, WATCHLIST_EVENTS_FILE, WATCHLIST_MAX_DISTANCE, WATCHLIST_RELOAD_INTERVAL
+from .search import normalize_plate, substitution_variants, EDIT_COST
+
+DEFAULT_LIST = 'watch'
+
+
+@dataclass(slots=True)
+class WatchEntry:
+    """1 biển số trong danh sách theo dõi"""
+    plate: str                 # Biển số như trong file (đã format)
+    list_name: str             # Tên danh sách (vd. 'stolen', 'allowed')
+    note: str = ""
+
+
+@dataclass(slots=True)
+class WatchMatch:
+    """1 lần biển số nhận diện được khớp với danh sách"""
+    plate: str                 # Biển số đọc được
+    entry: WatchEntry          # Biển số trong danh sách
+    distance: float            # 0 = khớp chính xác, 0.5 = nhầm 1 cặp ký tự, ...
+
+    @property
+    def exact(self) -> bool:
+        return self.distance == 0
+
+
+def load_entries(path: str) -> List[WatchEntry]:
+    """Đọc file danh sách, bỏ qua dòng trống / chú thích / header"""
+    entries = []
+    with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+        for row in csv.reader(f):
+            if not row or not row[0].strip() or row[0].lstrip().startswith('#'):
+                continue
+            plate = row[0].strip()
+            # Header hoặc dòng rác: biển số phải có chữ số
+            if not any(c.isdigit() for c in plate):
+                continue
+            list_name = row[1].strip() if len(row) > 1 and row[1].strip() else DEFAULT_LIST
+            note = row[2].strip() if len(row) > 2 else ""
+            entries.append(WatchEntry(plate, list_name, note))
+    return entries
+
+
+class _Tables:
+    """Bảng tra cứu dựng sẵn (bất biến sau khi dựng, thay nguyên khối khi nạp lại)"""
+
+    __slots__ = ('exact', 'chars_at', 'size')
+
+    def __init__(self, entries: Iterable[WatchEntry]):
+        # Biển số đã normalize -> các mục (1 biển số có thể nằm trong nhiều danh sách)
+        self.exact: Dict[str, List[WatchEntry]] = {}
+        # Vị trí -> ký tự có trong danh sách (bỏ biến thể chắc chắn không khớp)
+        self.chars_at: List[Set[str]] = []
+        self.size = 0
+        for entry in entries:
+            plate = normalize_plate(entry.plate)
+            if not plate:
+                continue
+            self.exact.setdefault(plate, []).append(entry)
+            while len(self.chars_at) < len(plate):
+                self.chars_at.append(set())
+            for chars, c in zip(self.chars_at, plate):
+                chars.add(c)
+            self.size += 1
+
+
+class Watchlist:
+    """
+    Danh sách theo dõi, dùng trong pipeline nhận diện
+
+    Ví dụ:
+        watchlist = Watchlist("watchlist.csv")
+        for match in watchlist.check_plates(detections, source="cam1/xe.jpg"):
+            print(match.entry.list_name, match.plate)
+    """
+
+    def __init__(self, path: str = WATCHLIST_FILE, events_path: Optional[str] = WATCHLIST_EVENTS_FILE,
+                 max_distance: float = WATCHLIST_MAX_DISTANCE, reload_interval: float = WATCHLIST_RELOAD_INTERVAL):
+        """
+        Args:
+            path: File danh sách (CSV)
+            events_path: File JSONL ghi sự kiện khớp (None = không ghi)
+            max_distance: Khoảng cách tối đa khi khớp gần đúng (0 = chỉ khớp chính xác)
+            reload_interval: Chu kỳ kiểm tra file danh sách thay đổi (giây, 0 = không tự nạp lại)
+        """
+        self.path = path
+        self.events_path = events_path
+        self.max_cost = int(max_distance * EDIT_COST)
+        self.reload_interval = reload_interval
+        self._tables = _Tables(())
+        self._mtime = None
+        self._next_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._events_lock = threading.Lock()
+        self._events = None
+        self.reload()
+
+    def __len__(self) -> int:
+        return self._tables.size
+
+    def reload(self) -> bool:
+        """
+        Nạp lại file danh sách nếu đã thay đổi
+
+        Returns:
+            True nếu đã nạp lại
+        """
+        with self._reload_lock:
+            self._next_check = time.monotonic() + self.reload_interval
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                if self._mtime is None:
+                    print(f"⚠ Không tìm thấy danh sách theo dõi {self.path}")
+                    self._mtime = 0
+                return False
+            if mtime == self._mtime:
+                return False
+            try:
+                tables = _Tables(load_entries(self.path))
+            except (OSError, UnicodeDecodeError, csv.Error) as e:
+                # File đang được ghi dở -> giữ danh sách cũ, lần kiểm tra sau thử lại
+                print(f"⚠ Không đọc được danh sách theo dõi {self.path}: {e}")
+                return False
+            # Thay nguyên khối: thread đang tra cứu vẫn dùng bảng cũ trọn vẹn
+            self._tables = tables
+            self._mtime = mtime
+        print(f"📋 Danh sách theo dõi: {tables.size} biển số ({self.path})")
+        return True
+
+    def _maybe_reload(self):
+        if self.reload_interval and time.monotonic() >= self._next_check:
+            self.reload()
+
+    def match(self, plate_text: str) -> List[WatchMatch]:
+        """
+        Tra 1 biển số
+
+        Returns:
+            Các mục khớp (khớp chính xác, hoặc gần đúng trong max_distance), gần nhất trước
+        """
+        self._maybe_reload()
+        tables = self._tables
+        plate = normalize_plate(plate_text)
+        entries = tables.exact.get(plate)
+        if entries:
+            return [WatchMatch(plate_text, entry, 0.0) for entry in entries]
+        if not self.max_cost or len(plate) > len(tables.chars_at):
+            return []
+        matches = []
+        # Chỉ thay bằng cặp hay nhầm trực tiếp (0.5 mỗi cặp), không thay ký tự bất kỳ
+        for variant, cost in substitution_variants(plate, self.max_cost, tables.chars_at, hard=False)[1:]:
+            for entry in tables.exact.get(variant, ()):
+                matches.append(WatchMatch(plate_text, entry, cost / EDIT_COST))
+        matches.sort(key=lambda m: m.distance)
+        return matches
+
+    def check_plates(self, detections, source: str = "") -> List[WatchMatch]:
+        """
+        Tra các biển số của 1 ảnh và ghi sự kiện cho các lần khớp
+
+        Args:
+            detections: List PlateResult
+            source: Ảnh / camera nguồn (ghi vào sự kiện)
+        """
+        found = []
+        for det in detections:
+            matches = self.match(det.text)
+            for match in matches:
+                self._emit(match, source, det.confidence)
+            found.extend(matches)
+        return found
+
+    def _emit(self, match: WatchMatch, source: str, confidence: float):
+        kind = "khớp" if match.exact else f"gần đúng {match.distance:g}"
+        print(f"🚨 [{match.entry.list_name}] {match.plate} ({kind} {match.entry.plate}) - {source}")
+        if not self.events_path:
+            return
+        event = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'source': source,
+            'plate': match.plate,
+            'confidence': round(float(confidence), 4) if confidence is not None else None,
+            'matched': match.entry.plate,
+            'list': match.entry.list_name,
+            'note': match.entry.note,
+            'distance': match.distance,
+        }
+        line = json.dumps(event, ensure_ascii=False) + "\n"
+        with self._events_lock:
+            if self._events is None:
+                folder = os.path.dirname(self.events_path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                self._events = open(self.events_path, 'a', encoding='utf-8')
+            self._events.write(line)
+            self._events.flush()
+
+    def close(self):
+        with self._events_lock:
+            if self._events is not None:
+                self._events.close()
+                self._events = None
@@ -0,0 +1,69 @@
+"""
+Chạy lại hậu xử lý + xếp hạng (fix_plate_chars, classify_vehicle, format_plate, calculate_smart_score)
+trên kết quả thô OCR đã ghi bằng --record-raw, không cần chạy lại model
+- In thống kê: bao nhiêu lần đọc giữ nguyên / đổi / đọc thêm được / mất
+- Ghi các dòng khác biệt ra CSV để xem lại
+
+Ví dụ:
+    python run_batch.py anh/ --record-raw           # ghi raw OCR vào history/raw_ocr/
+    # ... sửa luật trong modules/utils.py hoặc modules/ocr.py ...
+    python rescore_history.py                       # so sánh với kết quả lúc ghi
+    python rescore_history.py history/raw_ocr/ --diff khac_biet.csv --workers 8
+"""
+
+import argparse
+import csv
+import os
+import time
+from modules.rawocr import find_segments, RAW_OCR_EXT
+from modules.rescore import rescore_segments
+from modules.config import RAW_OCR_DIR
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy lại luật hậu xử lý trên raw OCR đã lưu")
+    parser.add_argument('paths', nargs='*', default=[RAW_OCR_DIR], help="Thư mục hoặc file .rawocr")
+    parser.add_argument('--workers', type=int, default=None, help="Số process (mặc định: số CPU)")
+    parser.add_argument('--diff', help="Ghi các lần đọc có kết quả khác ra file CSV")
+    parser.add_argument('--max-diffs', type=int, default=100000, help="Số dòng khác biệt tối đa ghi ra CSV")
+    parser.add_argument('--top', type=int, default=15, help="Số thay đổi phổ biến nhất in ra")
+    args = parser.parse_args()
+
+    segments = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            segments.extend(find_segments(path))
+        elif path.endswith(RAW_OCR_EXT) and os.path.isfile(path):
+            segments.append(path)
+        else:
+            print(f"⚠ Bỏ qua {path}")
+    if not segments:
+        print("Không có file raw OCR nào (chạy run_batch.py / watch_folder.py với --record-raw để ghi).")
+        return
+
+    start = time.perf_counter()
+    report = rescore_segments(segments, workers=args.workers, max_diffs=args.max_diffs if args.diff else 0)
+    elapsed = time.perf_counter() - start
+
+    total = max(report.total, 1)
+    print(f"🔁 Chạy lại {report.total} lần đọc từ {len(segments)} file trong {elapsed:.2f}s "
+          f"({report.total / max(elapsed, 1e-9):.0f} lần đọc/s)")
+    print(f"   • Giữ nguyên:       {report.unchanged} ({report.unchanged / total:.1%})")
+    print(f"   • Đổi kết quả:      {report.changed} ({report.changed / total:.1%})")
+    print(f"   • Đọc thêm được:    {report.gained} ({report.gained / total:.1%})")
+    print(f"   • Không đọc được:   {report.lost} ({report.lost / total:.1%})")
+    if report.transitions and args.top:
+        print("📊 Thay đổi phổ biến nhất (cũ -> mới):")
+        for (old, new), count in report.transitions.most_common(args.top):
+            print(f"   {count:>6}  {old or '∅':<14} -> {new or '∅'}")
+
+    if args.diff:
+        with open(args.diff, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Ảnh nguồn', 'Lần OCR', 'Kết quả cũ', 'Kết quả mới'])
+            writer.writerows(report.diffs)
+        print(f"📝 Đã ghi {len(report.diffs)} dòng khác biệt vào {args.diff}")
+
+
+if __name__ == "__main__":
+    main()
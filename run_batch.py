@@ -0,0 +1,232 @@
+"""
+Chạy nhận diện biển số hàng loạt không cần giao diện (headless)
+Dùng chung pipeline decode -> detect -> OCR -> render -> persist với GUI
+
+Ví dụ:
+    python run_batch.py anh1.jpg anh2.jpg thu_muc_anh/
+    python run_batch.py thu_muc_anh/ --workers decode=4,persist=4
+    python run_batch.py thu_muc_anh/ --manifest job.jsonl   # chạy lại lệnh này để tiếp tục khi bị dừng
+    python run_batch.py --input-list ds_anh.txt --shard 0/4   # máy 1 trong 4 máy, ghi vào shards/shard-0-of-4/
+    python merge_shards.py shards/ --dest ket_qua/             # gộp kết quả sau khi các shard chạy xong
+"""
+
+import argparse
+import os
+import time
+from modules.detection import LicensePlateDetector
+from modules.ocr import LicensePlateOCR
+from modules.logger import HistoryLogger, PERSIST_LEVELS, STORAGE_MODES
+from modules.pipeline import build_recognition_pipeline
+from modules.manifest import JobManifest
+from modules.watchlist import Watchlist
+from modules.sightings import SightingAggregator
+from modules.rawocr import RawOCRWriter
+from modules.columnar import ColumnarWriter, EXPORT_FORMATS
+from modules.metrics import MetricsDumper, start_http_server
+from modules.diagnostics import Diagnostics, LOG_LEVELS, get_logger, setup_logging
+from modules.sharding import parse_shard, select_shard, read_path_list, shard_dir
+from modules.config import (IMAGE_EXTENSIONS, MANIFEST_MAX_RETRIES, SHARD_OUTPUT_DIR, SHARD_MANIFEST_FILE,
+                            HISTORY_DIR, HISTORY_BATCH_PERSIST_LEVEL, HISTORY_STORAGE, WATCHLIST_EVENTS_FILE,
+                            SIGHTING_WINDOW, RAW_OCR_DIR, EXPORT_LIVE_DIR, EXPORT_FORMAT, METRICS_HOST,
+                            METRICS_DUMP_INTERVAL, LOG_LEVEL, TRACE_DIR)
+
+log = get_logger('run_batch')
+
+
+def collect_image_paths(inputs):
+    """Gom danh sách file ảnh từ các đường dẫn file/thư mục"""
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(IMAGE_EXTENSIONS):
+                    paths.append(os.path.join(path, name))
+        elif os.path.isfile(path):
+            paths.append(path)
+        else:
+            print(f"⚠ Bỏ qua đường dẫn không tồn tại: {path}")
+    return paths
+
+
+def parse_workers(value):
+    """Phân tích chuỗi 'decode=4,persist=2' thành dict số worker"""
+    workers = {}
+    if not value:
+        return workers
+    for part in value.split(','):
+        name, _, count = part.partition('=')
+        workers[name.strip()] = int(count)
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nhận diện biển số hàng loạt (headless)")
+    parser.add_argument('inputs', nargs='*', help="File ảnh hoặc thư mục chứa ảnh")
+    parser.add_argument('--input-list', help="File danh sách ảnh (.txt: 1 đường dẫn/dòng, .jsonl: {\"path\": ...})")
+    parser.add_argument('--shard', help="Chỉ xử lý phần i/N của danh sách (i từ 0), ví dụ: 0/4")
+    parser.add_argument('--output', default=SHARD_OUTPUT_DIR,
+                        help="Thư mục gốc chứa kết quả các shard (dùng với --shard)")
+    parser.add_argument('--workers', default='', help="Số worker từng giai đoạn, ví dụ: decode=4,persist=2")
+    parser.add_argument('--no-history', action='store_true', help="Không lưu kết quả vào History")
+    parser.add_argument('--persist', choices=PERSIST_LEVELS, default=HISTORY_BATCH_PERSIST_LEVEL,
+                        help="Mức lưu History: none/text/roi/debug/sampled")
+    parser.add_argument('--storage', choices=STORAGE_MODES, default=HISTORY_STORAGE,
+                        help="Lưu ảnh History: files (mỗi ảnh 1 thư mục) hoặc pack (1 gói .pack cho cả batch)")
+    parser.add_argument('--manifest', help="File nhật ký JSONL: bỏ qua ảnh đã xong, thử lại ảnh lỗi khi chạy lại")
+    parser.add_argument('--max-retries', type=int, default=MANIFEST_MAX_RETRIES,
+                        help="Số lần thử tối đa cho 1 ảnh lỗi (dùng với --manifest)")
+    parser.add_argument('--watchlist', help="File danh sách theo dõi (CSV: biển số,danh sách,ghi chú)")
+    parser.add_argument('--aggregate', nargs='?', type=float, const=SIGHTING_WINDOW, metavar='SECONDS',
+                        help=f"Gộp các lần đọc cùng biển số, cùng thư mục, cách nhau <= SECONDS giây "
+                             f"(mặc định {SIGHTING_WINDOW:g}) thành 1 lần ghi History")
+    parser.add_argument('--record-raw', action='store_true',
+                        help="Ghi kết quả thô của OCR để chạy lại luật bằng rescore_history.py")
+    parser.add_argument('--export', nargs='?', const='', metavar='DIR',
+                        help=f"Ghi kết quả dạng cột (Parquet/Arrow, chia theo ngày) kèm confidence và thời gian "
+                             f"từng giai đoạn (mặc định {EXPORT_LIVE_DIR}, cần pyarrow)")
+    parser.add_argument('--export-format', choices=EXPORT_FORMATS, default=EXPORT_FORMAT,
+                        help="Định dạng file khi dùng --export")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help=f"Mở endpoint Prometheus http://{METRICS_HOST}:PORT/metrics")
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help=f"Ghi metrics ra file mỗi {METRICS_DUMP_INTERVAL:g}s (.json hoặc .prom cho node_exporter)")
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default=LOG_LEVEL,
+                        help="Mức log (DEBUG: in chi tiết từng ảnh / biển số / biến thể OCR)")
+    parser.add_argument('--trace', action='store_true',
+                        help=f"Ghi trace-event JSON của batch vào {TRACE_DIR} (mở bằng chrome://tracing / Perfetto)")
+    parser.add_argument('--profile', action='store_true',
+                        help=f"Chạy sampling profiler, ghi folded stacks của batch vào {TRACE_DIR} (flamegraph)")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+    if not args.inputs and not args.input_list:
+        parser.error("cần ít nhất 1 đường dẫn ảnh/thư mục hoặc --input-list")
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+
+    file_paths = collect_image_paths(args.inputs)
+    if args.input_list:
+        file_paths.extend(read_path_list(args.input_list))
+    # Ảnh lặp lại trong danh sách chỉ xử lý 1 lần
+    file_paths = list(dict.fromkeys(file_paths))
+    history_dir = None
+    if shard is not None:
+        # Mỗi shard ghi vào thư mục riêng và luôn có manifest (chạy lại được, merge_shards.py dùng để gộp)
+        total = len(file_paths)
+        file_paths = select_shard(file_paths, *shard)
+        output_dir = shard_dir(args.output, *shard)
+        history_dir = os.path.join(output_dir, 'history')
+        args.manifest = args.manifest or os.path.join(output_dir, SHARD_MANIFEST_FILE)
+        print(f"🧩 Shard {shard[0]}/{shard[1]}: {len(file_paths)}/{total} ảnh -> {output_dir}")
+    if not file_paths:
+        print("Không có ảnh nào để xử lý.")
+        return
+
+    manifest = None
+    if args.manifest:
+        manifest = JobManifest(args.manifest, max_retries=args.max_retries)
+        total = len(file_paths)
+        file_paths = manifest.pending(file_paths)
+        print(f"📒 Manifest {args.manifest}: {total - len(file_paths)}/{total} ảnh đã xong hoặc hết lượt thử, "
+              f"còn {len(file_paths)} ảnh")
+        if manifest.corrupt_lines:
+            print(f"⚠ Bỏ qua {manifest.corrupt_lines} dòng hỏng trong manifest")
+        if not file_paths:
+            manifest.close()
+            return
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    dumper = MetricsDumper(args.metrics_file).start() if args.metrics_file else None
+    diagnostics = Diagnostics(trace=args.trace, profile=args.profile)
+    diagnostics.install_signals()
+
+    detector = LicensePlateDetector()
+    ocr = LicensePlateOCR()
+    def record_saved(file_path, saved_dir, plates):
+        # Gộp sighting: ảnh chỉ xong khi History của sự kiện chứa nó đã được ghi
+        if manifest is None:
+            return
+        if saved_dir is None:
+            manifest.record_failed(file_path, "không lưu được History")
+        else:
+            manifest.record_done(file_path, {'plates': plates, 'history_dir': saved_dir})
+
+    logger = None if args.no_history else HistoryLogger(history_dir or HISTORY_DIR, level=args.persist,
+                                                         storage=args.storage)
+    aggregating = logger is not None and bool(args.aggregate)
+    if logger is not None:
+        # OCR chỉ giữ các ảnh trung gian mà mức lưu cần
+        ocr.retention = logger.required_retention
+        if aggregating:
+            logger = SightingAggregator(logger, window=args.aggregate, on_saved=record_saved,
+                                            draw=detector.draw_detections)
+    if args.record_raw:
+        ocr.raw_recorder = RawOCRWriter(os.path.join(history_dir, os.path.basename(RAW_OCR_DIR)) if history_dir else RAW_OCR_DIR)
+    watchlist = None
+    if args.watchlist:
+        # Shard: sự kiện ghi cạnh History của shard
+        events_path = os.path.join(history_dir, os.path.basename(WATCHLIST_EVENTS_FILE)) if history_dir else WATCHLIST_EVENTS_FILE
+        watchlist = Watchlist(args.watchlist, events_path=events_path)
+    exporter = None
+    if args.export is not None:
+        export_dir = args.export or (os.path.join(history_dir, os.path.basename(EXPORT_LIVE_DIR)) if history_dir else EXPORT_LIVE_DIR)
+        try:
+            exporter = ColumnarWriter(export_dir, fmt=args.export_format)
+        except RuntimeError as e:
+            parser.error(str(e))
+
+    def on_result(item):
+        if exporter is not None:
+            exporter.add_item(item)
+        error = item.error
+        if error is None and logger is not None and item.history_dir is None:
+            error = "không lưu được History"
+        if error is not None:
+            log.error("❌ #%d %s: %s", item.stt, item.file_path, error)
+            # Gộp sighting: lỗi ghi History đã được record_saved ghi nhận
+            if manifest is not None and (item.error is not None or not aggregating):
+                manifest.record_failed(item.file_path, str(error))
+        else:
+            plates = ', '.join(item.plates) if item.plates else "Không phát hiện biển số"
+            log.debug("✅ #%d %s: %s", item.stt, item.file_path, plates)
+            if manifest is not None and not aggregating:
+                manifest.record_done(item.file_path, {'plates': item.plates, 'history_dir': item.history_dir})
+
+    start = time.time()
+    pipeline = build_recognition_pipeline(detector, ocr, logger, on_result=on_result,
+                                          workers=parse_workers(args.workers), watchlist=watchlist)
+    diagnostics.begin_batch(f"batch_{time.strftime('%Y%m%d_%H%M%S')}")
+    try:
+        pipeline.run(file_paths)
+    finally:
+        diagnostics.end_batch()
+        # Đóng logger trước manifest: gộp sighting ghi nốt sự kiện đang mở và đánh dấu xong các ảnh của chúng
+        if logger is not None:
+            logger.close()
+        if manifest is not None:
+            manifest.close()
+        if watchlist is not None:
+            watchlist.close()
+        if ocr.raw_recorder is not None:
+            ocr.raw_recorder.close()
+        if exporter is not None:
+            exporter.close()
+        if dumper is not None:
+            dumper.close()
+    total_time = time.time() - start
+
+    print("=" * 60)
+    print(f"🎉 Đã xử lý {len(file_paths)} ảnh trong {total_time:.2f}s "
+          f"({len(file_paths) / total_time:.2f} ảnh/s)")
+    pipeline.print_metrics()
+    if manifest is not None:
+        summary = manifest.summary()
+        print(f"📒 Manifest: {summary['done']} ảnh xong, {summary['failed']} ảnh lỗi")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Tìm biển số trong lịch sử (history.csv), chấp nhận OCR đọc sai/thiếu ký tự
+- Cặp ký tự hay nhầm (8/B, 0/D, 5/S, 1/I, ...) chỉ tính nửa lỗi
+- '?' thay cho ký tự không đọc được (tối đa 2)
+- Chỉ mục được cache ở history/search_index.pkl, lần sau chỉ đọc thêm dòng mới
+
+Ví dụ:
+    python search_history.py 51A-123.45
+    python search_history.py "51A-l23.4S" --max-distance 1.5
+    python search_history.py 51A12?45 --history ket_qua/history --rows 10
+"""
+
+import argparse
+import os
+import time
+from modules.search import HistorySearch
+from modules.config import HISTORY_DIR, HISTORY_CSV_FILE, SEARCH_MAX_DISTANCE, SEARCH_LIMIT, SEARCH_CACHE_FILE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tìm biển số gần đúng trong lịch sử nhận diện")
+    parser.add_argument('query', help="Biển số cần tìm ('?' = ký tự không đọc được)")
+    parser.add_argument('--history', default=HISTORY_DIR, help="Thư mục History chứa history.csv")
+    parser.add_argument('--max-distance', type=float, default=SEARCH_MAX_DISTANCE,
+                        help="Khoảng cách tối đa (sai 1 ký tự = 1, cặp hay nhầm = 0.5)")
+    parser.add_argument('--limit', type=int, default=SEARCH_LIMIT, help="Số biển số tối đa")
+    parser.add_argument('--rows', type=int, default=3, help="Số dòng lịch sử mới nhất in ra cho mỗi biển số")
+    parser.add_argument('--rebuild', action='store_true', help="Bỏ cache, dựng lại chỉ mục từ đầu")
+    args = parser.parse_args()
+
+    csv_path = os.path.join(args.history, HISTORY_CSV_FILE)
+    if not os.path.isfile(csv_path):
+        print(f"❌ Không tìm thấy {csv_path}")
+        return
+    cache_path = os.path.join(args.history, os.path.basename(SEARCH_CACHE_FILE))
+    if args.rebuild and os.path.isfile(cache_path):
+        os.remove(cache_path)
+
+    start = time.perf_counter()
+    search = HistorySearch(csv_path, cache_path)
+    added = search.refresh()
+    if added:
+        search.save_cache()
+    print(f"📇 Chỉ mục: {len(search.index)} biển số / {search.index.rows} dòng "
+          f"(+{added} dòng mới, {(time.perf_counter() - start) * 1000:.0f}ms)")
+
+    start = time.perf_counter()
+    try:
+        results = search.search(args.query, max_distance=args.max_distance, limit=args.limit, rows_per_plate=args.rows)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
+    elapsed = (time.perf_counter() - start) * 1000
+
+    if not results:
+        print(f"🔍 Không có biển số nào gần '{args.query}' ({elapsed:.1f}ms)")
+        return
+    print(f"🔍 {len(results)} biển số gần '{args.query}' ({elapsed:.1f}ms):")
+    for hit, rows in results:
+        print(f"  {hit.plate:<14} khoảng cách {hit.distance:g}  ({hit.count} lần)")
+        for row in rows:
+            print(f"      {row[0]}  {row[2] if len(row) > 2 else ''}  {row[3] if len(row) > 3 else ''}")
+
+
+if __name__ == "__main__":
+    main()
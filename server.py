@@ -0,0 +1,184 @@
+"""
+Server HTTP nhận diện biển số (chạy local, chỉ dùng thư viện chuẩn)
+- Model được load 1 lần khi khởi động (nền + warm-up) và giữ sẵn
+- Request đồng thời được gom thành micro-batch (BATCH_MAX_SIZE / BATCH_MAX_WAIT_MS)
+
+Endpoint:
+    GET  /health      Trạng thái model + thống kê batching
+    GET  /metrics     Metrics dạng text Prometheus (ảnh, biển số, OCR, latency, RSS, ...)
+    POST /recognize   Body là nội dung ảnh (Content-Type: image/jpeg, image/png,
+                      application/octet-stream) hoặc JSON {"path": "duong/dan/anh.jpg"}
+
+Ví dụ:
+    python server.py --port 8080
+    curl --data-binary @xe.jpg -H "Content-Type: image/jpeg" http://127.0.0.1:8080/recognize
+    curl -d '{"path": "xe.jpg"}' -H "Content-Type: application/json" http://127.0.0.1:8080/recognize
+"""
+
+import argparse
+import json
+import os
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from modules.config import (SERVER_HOST, SERVER_PORT, SERVER_MAX_UPLOAD_MB, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS,
+                            LOG_LEVEL, TRACE_DIR)
+from modules.loader import ModelLoader
+from modules.service import RecognitionService
+from modules.metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE
+from modules.diagnostics import Diagnostics, LOG_LEVELS, setup_logging
+
+
+class RecognitionHandler(BaseHTTPRequestHandler):
+    """Xử lý request HTTP, mỗi request chạy trên 1 thread của ThreadingHTTPServer"""
+
+    server_version = "LicensePlateServer/1.0"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Log gọn 1 dòng thay cho format mặc định của http.server
+        print(f"🌐 {self.address_string()} {format % args}")
+
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if self.path != '/health':
+            self._send_json(404, {'error': 'not found'})
+            return
+        app = self.server.app
+        payload = {
+            'status': app.loader.state,
+            'uptime': round(time.time() - app.started_at, 1),
+            'model_load_seconds': {k: round(v, 2) for k, v in app.loader.timings.items()},
+        }
+        if app.service is not None:
+            payload.update(app.service.get_stats())
+        self._send_json(200 if app.service is not None else 503, payload)
+
+    def do_POST(self):
+        if self.path != '/recognize':
+            self._send_json(404, {'error': 'not found'})
+            return
+        app = self.server.app
+        if app.service is None:
+            self._send_json(503, {'error': f"model chưa sẵn sàng ({app.loader.state})"})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self._send_json(400, {'error': 'body rỗng'})
+            return
+        if length > SERVER_MAX_UPLOAD_MB * 1024 * 1024:
+            self._send_json(413, {'error': f"ảnh vượt quá {SERVER_MAX_UPLOAD_MB}MB"})
+            return
+        body = self.rfile.read(length)
+
+        content_type = (self.headers.get('Content-Type') or '').split(';')[0].strip().lower()
+        if content_type == 'application/json':
+            try:
+                source = json.loads(body.decode('utf-8'))['path']
+            except (ValueError, KeyError, TypeError):
+                self._send_json(400, {'error': 'JSON cần có trường "path"'})
+                return
+            if not os.path.isfile(source):
+                self._send_json(404, {'error': f"không tìm thấy file: {source}"})
+                return
+        else:
+            source = body
+
+        try:
+            result = app.service.recognize(source)
+        except (OSError, ValueError) as e:
+            # PIL không đọc được ảnh
+            self._send_json(400, {'error': f"không đọc được ảnh: {e}"})
+            return
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        self._send_json(200, result)
+
+
+class RecognitionApp:
+    """Trạng thái dùng chung của server: model loader và dịch vụ nhận diện"""
+
+    def __init__(self, max_batch_size, max_wait_ms, logger=None, watchlist=None):
+        self.started_at = time.time()
+        self.service = None
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.logger = logger
+        self.watchlist = watchlist
+        self.loader = ModelLoader(on_ready=self._on_ready)
+
+    def _on_ready(self, loader):
+        self.service = RecognitionService(loader.detector, loader.ocr, logger=self.logger,
+                                          max_batch_size=self.max_batch_size, max_wait_ms=self.max_wait_ms,
+                                          watchlist=self.watchlist)
+        print(f"✅ Model sẵn sàng, nhận request (batch tối đa {self.max_batch_size}, chờ {self.max_wait_ms}ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server HTTP nhận diện biển số")
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--max-batch', type=int, default=BATCH_MAX_SIZE, help="Số ảnh tối đa trong 1 batch")
+    parser.add_argument('--max-wait-ms', type=float, default=BATCH_MAX_WAIT_MS, help="Thời gian gom batch tối đa (ms)")
+    parser.add_argument('--history', action='store_true', help="Lưu kết quả vào History")
+    parser.add_argument('--watchlist', help="File danh sách theo dõi (CSV: biển số,danh sách,ghi chú)")
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default=LOG_LEVEL,
+                        help="Mức log (DEBUG: in chi tiết từng ảnh / biển số / biến thể OCR)")
+    parser.add_argument('--trace', action='store_true',
+                        help=f"Ghi trace-event JSON vào {TRACE_DIR} khi dừng (bật/tắt lúc chạy: kill -USR1)")
+    parser.add_argument('--profile', action='store_true',
+                        help=f"Chạy sampling profiler, ghi folded stacks vào {TRACE_DIR} khi dừng (bật/tắt: kill -USR2)")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+
+    logger = None
+    if args.history:
+        from modules.logger import HistoryLogger
+        logger = HistoryLogger()
+
+    watchlist = None
+    if args.watchlist:
+        from modules.watchlist import Watchlist
+        watchlist = Watchlist(args.watchlist)
+
+    app = RecognitionApp(args.max_batch, args.max_wait_ms, logger=logger, watchlist=watchlist)
+    httpd = ThreadingHTTPServer((args.host, args.port), RecognitionHandler)
+    httpd.daemon_threads = True
+    httpd.app = app
+    diagnostics = Diagnostics(trace=args.trace, profile=args.profile)
+    diagnostics.install_signals()
+    diagnostics.begin_batch()
+    app.loader.start()
+    print(f"🚀 Server chạy tại http://{args.host}:{args.port} (đang tải model...)")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Dừng server")
+    finally:
+        httpd.server_close()
+        diagnostics.end_batch()
+        if app.service is not None:
+            app.service.close()
+        if logger is not None:
+            logger.close()
+        if watchlist is not None:
+            watchlist.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Giải nén History lưu dạng gói (.pack) về dạng thư mục cũ (mỗi ảnh 1 thư mục)
+- Ảnh trong gói được ghi ra {dest}/{Timestamp}_{OriginalName}/{file}
+- history.csv được viết lại: tham chiếu "{gói}::{ảnh}" đổi thành đường dẫn file
+
+Ví dụ:
+    python unpack_history.py                                  # giải nén tại chỗ thư mục history/
+    python unpack_history.py history/ --dest history_legacy/  # giải nén sang thư mục khác
+    python unpack_history.py history/ --delete-packs          # xóa gói sau khi giải nén xong
+"""
+
+import argparse
+import csv
+import glob
+import os
+from modules.archive import ArchiveReader, unpack_to, is_archive_ref, split_ref, index_path, PACK_EXT
+from modules.config import HISTORY_DIR, HISTORY_CSV_FILE, HISTORY_PACK_DIR
+
+
+def rewrite_csv(csv_path, dest_csv, extracted):
+    """
+    Viết lại history.csv, đổi tham chiếu gói thành đường dẫn file đã giải nén
+
+    Returns:
+        (số tham chiếu đã đổi, số tham chiếu không tìm thấy)
+    """
+    with open(csv_path, 'r', newline='', encoding='utf-8-sig') as f:
+        rows = list(csv.reader(f))
+    replaced = missing = 0
+    for row in rows:
+        for i, value in enumerate(row):
+            if not is_archive_ref(value):
+                continue
+            pack_path, member = split_ref(value)
+            # Khóa theo tên gói: đường dẫn gói trong CSV có thể là tương đối theo thư mục làm việc lúc ghi
+            target = extracted.get((os.path.basename(pack_path), member))
+            if target is None:
+                missing += 1
+            else:
+                row[i] = target
+                replaced += 1
+    tmp_path = dest_csv + '.tmp'
+    with open(tmp_path, 'w', newline='', encoding='utf-8-sig') as f:
+        csv.writer(f).writerows(rows)
+    os.replace(tmp_path, dest_csv)
+    return replaced, missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Giải nén History dạng gói về dạng thư mục")
+    parser.add_argument('history_dir', nargs='?', default=HISTORY_DIR, help="Thư mục History chứa packs/")
+    parser.add_argument('--dest', help="Thư mục đích (mặc định: giải nén tại chỗ)")
+    parser.add_argument('--delete-packs', action='store_true', help="Xóa gói sau khi giải nén và viết lại CSV")
+    args = parser.parse_args()
+
+    dest = args.dest or args.history_dir
+    packs = sorted(glob.glob(os.path.join(args.history_dir, HISTORY_PACK_DIR, f"*{PACK_EXT}")))
+    if not packs:
+        print(f"Không có gói nào trong {os.path.join(args.history_dir, HISTORY_PACK_DIR)}.")
+        return
+
+    # (tên gói, thành viên) -> file đã giải nén
+    extracted = {}
+    for pack_path in packs:
+        with ArchiveReader(pack_path) as reader:
+            mapping = unpack_to(pack_path, dest, reader=reader)
+        for ref, target in mapping.items():
+            _, member = split_ref(ref)
+            extracted[(os.path.basename(pack_path), member)] = target
+        print(f"📦 {os.path.basename(pack_path)}: {len(mapping)} ảnh")
+
+    csv_path = os.path.join(args.history_dir, HISTORY_CSV_FILE)
+    if os.path.isfile(csv_path):
+        replaced, missing = rewrite_csv(csv_path, os.path.join(dest, HISTORY_CSV_FILE), extracted)
+        print(f"📝 {HISTORY_CSV_FILE}: đổi {replaced} đường dẫn")
+        if missing:
+            print(f"⚠ {missing} tham chiếu không tìm thấy trong gói, giữ nguyên")
+
+    if args.delete_packs:
+        for pack_path in packs:
+            os.remove(pack_path)
+            if os.path.isfile(index_path(pack_path)):
+                os.remove(index_path(pack_path))
+        print(f"🗑 Đã xóa {len(packs)} gói")
+    print(f"✅ Đã giải nén {len(extracted)} ảnh vào {dest}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Chạy nền: theo dõi thư mục camera đổ ảnh vào và nhận diện ảnh mới liên tục
+- Khởi động: xử lý hết ảnh tồn đọng (mới hơn cursor đã lưu)
+- Sau đó: inotify (Linux) hoặc polling, chỉ xử lý file đã ghi xong
+- Kết quả lưu vào History như GUI; cursor lưu ở WATCH_CURSOR_FILE
+
+Ví dụ:
+    python watch_folder.py /mnt/camera1 /mnt/camera2
+    python watch_folder.py /mnt/share --poll    # thư mục mạng (NFS/SMB) không hỗ trợ inotify
+"""
+
+import argparse
+import os
+import signal
+from modules.config import (WATCH_CURSOR_FILE, WATCH_STABLE_SECONDS, HISTORY_BATCH_PERSIST_LEVEL,
+                            SIGHTING_WINDOW, EXPORT_LIVE_DIR, EXPORT_FORMAT, METRICS_HOST, METRICS_DUMP_INTERVAL,
+                            LOG_LEVEL, TRACE_DIR)
+from modules.loader import ModelLoader
+from modules.logger import HistoryLogger, PERSIST_LEVELS
+from modules.watcher import FolderWatchDaemon, WatchCursor
+from modules.watchlist import Watchlist
+from modules.sightings import SightingAggregator
+from modules.rawocr import RawOCRWriter
+from modules.columnar import ColumnarWriter, EXPORT_FORMATS
+from modules.metrics import MetricsDumper, start_http_server
+from modules.diagnostics import Diagnostics, LOG_LEVELS, setup_logging
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Theo dõi thư mục và nhận diện ảnh mới")
+    parser.add_argument('directories', nargs='+', help="Các thư mục cần theo dõi")
+    parser.add_argument('--cursor', default=WATCH_CURSOR_FILE, help="File lưu tiến độ")
+    parser.add_argument('--poll', action='store_true', help="Dùng polling thay cho inotify")
+    parser.add_argument('--stable-seconds', type=float, default=WATCH_STABLE_SECONDS,
+                        help="Thời gian file không đổi để coi là đã ghi xong")
+    parser.add_argument('--no-history', action='store_true', help="Không lưu kết quả vào History")
+    parser.add_argument('--persist', choices=PERSIST_LEVELS, default=HISTORY_BATCH_PERSIST_LEVEL,
+                        help="Mức lưu History: none/text/roi/debug/sampled")
+    parser.add_argument('--watchlist', help="File danh sách theo dõi (CSV: biển số,danh sách,ghi chú), tự nạp lại khi sửa")
+    parser.add_argument('--aggregate', nargs='?', type=float, const=SIGHTING_WINDOW, metavar='SECONDS',
+                        help=f"Gộp các lần đọc cùng biển số, cùng camera, cách nhau <= SECONDS giây "
+                             f"(mặc định {SIGHTING_WINDOW:g}) thành 1 lần ghi History")
+    parser.add_argument('--record-raw', action='store_true',
+                        help="Ghi kết quả thô của OCR để chạy lại luật bằng rescore_history.py")
+    parser.add_argument('--export', nargs='?', const=EXPORT_LIVE_DIR, metavar='DIR',
+                        help=f"Ghi kết quả dạng cột (Parquet/Arrow, chia theo ngày) kèm confidence và thời gian "
+                             f"từng giai đoạn (mặc định {EXPORT_LIVE_DIR}, cần pyarrow)")
+    parser.add_argument('--export-format', choices=EXPORT_FORMATS, default=EXPORT_FORMAT,
+                        help="Định dạng file khi dùng --export")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help=f"Mở endpoint Prometheus http://{METRICS_HOST}:PORT/metrics")
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help=f"Ghi metrics ra file mỗi {METRICS_DUMP_INTERVAL:g}s (.json hoặc .prom cho node_exporter)")
+    parser.add_argument('--log-level', choices=LOG_LEVELS, default=LOG_LEVEL,
+                        help="Mức log (DEBUG: in chi tiết từng ảnh / biển số / biến thể OCR)")
+    parser.add_argument('--trace', action='store_true',
+                        help=f"Ghi trace-event JSON vào {TRACE_DIR} khi dừng (bật/tắt lúc chạy: kill -USR1)")
+    parser.add_argument('--profile', action='store_true',
+                        help=f"Chạy sampling profiler, ghi folded stacks vào {TRACE_DIR} khi dừng (bật/tắt: kill -USR2)")
+    args = parser.parse_args()
+    setup_logging(args.log_level)
+
+    for directory in args.directories:
+        if not os.path.isdir(directory):
+            parser.error(f"không phải thư mục: {directory}")
+
+    exporter = None
+    if args.export:
+        try:
+            exporter = ColumnarWriter(args.export, fmt=args.export_format)
+        except RuntimeError as e:
+            parser.error(str(e))
+
+    if args.metrics_port:
+        start_http_server(args.metrics_port)
+    dumper = MetricsDumper(args.metrics_file).start() if args.metrics_file else None
+
+    loader = ModelLoader().start()
+    if not loader.wait():
+        print(f"❌ Không load được model: {loader.error}")
+        return
+
+    logger = None if args.no_history else HistoryLogger(level=args.persist)
+    if logger is not None:
+        # OCR chỉ giữ các ảnh trung gian mà mức lưu cần
+        loader.ocr.retention = logger.required_retention
+        if args.aggregate:
+            logger = SightingAggregator(logger, window=args.aggregate, draw=loader.detector.draw_detections)
+    watchlist = Watchlist(args.watchlist) if args.watchlist else None
+    if args.record_raw:
+        loader.ocr.raw_recorder = RawOCRWriter()
+
+    def on_result(item):
+        if exporter is not None:
+            exporter.add_item(item)
+        if item.error is not None:
+            print(f"❌ {item.file_path}: {item.error}")
+        else:
+            plates = ', '.join(item.plates) if item.plates else "Không phát hiện biển số"
+            print(f"✅ {item.file_path}: {plates}")
+
+    daemon = FolderWatchDaemon(
+        args.directories, loader.detector, loader.ocr,
+        logger=logger,
+        cursor=WatchCursor(args.cursor),
+        force_polling=args.poll,
+        stable_seconds=args.stable_seconds,
+        on_result=on_result,
+        watchlist=watchlist
+    )
+    # Ctrl+C / kill: xử lý nốt ảnh đang trong pipeline rồi thoát
+    signal.signal(signal.SIGINT, lambda *_: daemon.stop())
+    signal.signal(signal.SIGTERM, lambda *_: daemon.stop())
+    # Tín hiệu USR1/USR2 bật/tắt tracing / profiler, mỗi lần tắt ghi 1 file
+    diagnostics = Diagnostics(trace=args.trace, profile=args.profile)
+    diagnostics.install_signals()
+    print(f"🚀 Đang theo dõi: {', '.join(args.directories)} (Ctrl+C để dừng)")
+    diagnostics.begin_batch()
+    try:
+        daemon.run()
+    finally:
+        diagnostics.end_batch()
+    if logger is not None:
+        logger.close()
+    if watchlist is not None:
+        watchlist.close()
+    if loader.ocr.raw_recorder is not None:
+        loader.ocr.raw_recorder.close()
+    if exporter is not None:
+        exporter.close()
+    if dumper is not None:
+        dumper.close()
+    print(f"🛑 Đã dừng, xử lý {daemon.processed} ảnh")
+
+
+if __name__ == "__main__":
+    main()